@@ -0,0 +1,217 @@
+#! /usr/bin/python3
+"""
+Stand-in SSH server for the CLI of a UCS domain, using asyncssh
+
+Answers connect nxos, terminal length 0, exit and the commands in OUTPUTS
+like UCSM and NX-OS of the FIs do: the command is echoed, followed by its
+output and the prompt. The host key is generated at start.
+
+Can also be run on its own to pull CLI stats from it with --async-ssh:
+    python3 ssh_stand_in.py 8022
+"""
+
+__author__ = "Paresh Gupta"
+
+import sys
+import re
+import asyncio
+import threading
+import asyncssh
+
+UCSM_PROMPT = 'UCS-A# '
+NXOS_PROMPT = 'UCS-{}(nx-os)# '
+
+# Block of a port in show queuing interface
+QUEUING_BLOCK = '''{port} queuing information:
+  TX Queuing
+    qos-group  sched-type  oper-bandwidth
+        0       WRR             50
+        1       WRR             50
+
+  RX Queuing
+    qos-group 0
+    q-size: 360640, HW MTU: 1500 (1500 configured)
+    drop-type: drop, xon: 0, xoff: 360640
+    Statistics:
+        Pkts received over the port             : 3217
+        Ucast pkts sent to the cross-bar        : 3100
+        Mcast pkts sent to the cross-bar        : 117
+        Ucast pkts received from the cross-bar  : 2954
+        Pkts sent to the port                   : 2954
+        Pkts discarded on ingress               : {drop0}
+        Per-priority-pause status               : Rx (Inactive), Tx (Inactive)
+
+    qos-group 1
+    q-size: 79360, HW MTU: 2158 (2158 configured)
+    drop-type: no-drop, xon: 20480, xoff: 40320
+    Statistics:
+        Pkts received over the port             : 118
+        Ucast pkts sent to the cross-bar        : 118
+        Mcast pkts sent to the cross-bar        : 0
+        Ucast pkts received from the cross-bar  : 0
+        Pkts sent to the port                   : 0
+        Pkts discarded on ingress               : {drop1}
+        Per-priority-pause status               : Rx (Active), Tx (Inactive)
+
+  Total Multicast crossbar statistics:
+    Mcast pkts received from the cross-bar      : 0
+'''
+
+# Output of the commands, as returned by send_command() of netmiko, i.e.
+# without the echoed command and the prompt
+OUTPUTS = {
+    'show interface priority-flow-control': '\n'.join([
+        '',
+        '============================================================',
+        'Port               Mode Oper(VL bmap)  RxPPP      TxPPP',
+        '============================================================',
+        '',
+        'Ethernet1/1        Auto On  (8)       11         12',
+        'Ethernet1/49       Auto Off           0          0',
+        'Vethernet9547      Auto Off           0          0',
+        'Ethernet1/1/1      Auto On  (8)       21         22',
+        'Ethernet1/1/2      Auto On  (8)       31         32',
+        'Br-Ethernet1/17/1  Auto Off           373112640  5422273',
+        '']),
+    'show queuing interface': '\n' + ''.join([QUEUING_BLOCK.format( \
+            port=port, drop0=drop0, drop1=drop1) for port, drop0, drop1 in \
+            [('Ethernet1/1', 12, 3), ('Ethernet1/49', 0, 0),
+             ('Ethernet1/1/1', 7, 0), ('Ethernet1/1/2', 0, 40)]])
+    }
+
+IOM_ERR_RE = re.compile(r'^show interface ethernet (\d+)/1/1-(\d+) counters '
+                        r'errors$')
+
+def get_iom_err_output(c_id, last_port):
+    '''
+    Return the output of show interface ethernet c_id/1/1-last_port counters
+    errors, with a second table of the same ports
+    '''
+    sep = '-' * 72
+    lines = ['', sep, 'Port          Align-Err    FCS-Err   Xmit-Err    '
+             'Rcv-Err  UnderSize OutDiscards', sep]
+    for port in range(1, last_port + 1):
+        lines.append('Eth{}/1/{}  0  0  {}  {}  0  {}'.format(c_id, port, \
+                     port, 2 * port, 100 + port))
+    lines.extend(['', sep, 'Port         Single-Col  Multi-Col   Late-Col  '
+                  'Exces-Col  Carri-Sen      Runts', sep])
+    for port in range(1, last_port + 1):
+        lines.append('Eth{}/1/{}  0  0  0  0  0  0'.format(c_id, port))
+    lines.append('')
+    return '\n'.join(lines)
+
+def get_output(command):
+    '''
+    Return the output of a command. Empty for an unknown command
+    '''
+    if command in OUTPUTS:
+        return OUTPUTS[command]
+    match = IOM_ERR_RE.match(command)
+    if match:
+        return get_iom_err_output(match.group(1), (int)(match.group(2)))
+    return ''
+
+class StandInServer(object):
+    """
+    SSH server on 127.0.0.1, running on its own event loop in a thread
+
+    Every write to the channel is split in chunk_size bytes, if not 0, to
+    split lines across the reads of the client
+    """
+
+    def __init__(self, user='admin', passwd='password', chunk_size=0):
+        self.user = user
+        self.passwd = passwd
+        self.chunk_size = chunk_size
+        self.host_key = asyncssh.generate_private_key('ssh-ed25519')
+        self.commands = []
+        self.logins = 0
+        self.port = None
+        self.server = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name='StandInServer', daemon=True)
+
+    def start(self, port=0):
+        '''
+        Listen on port (0 for any free port). Return the port
+        '''
+        self.thread.start()
+        self.server = asyncio.run_coroutine_threadsafe( \
+                        self.listen(port), self.loop).result()
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def listen(self, port):
+        server = self
+        class Auth(asyncssh.SSHServer):
+            def begin_auth(self, username):
+                return True
+            def password_auth_supported(self):
+                return True
+            def validate_password(self, username, password):
+                if username != server.user or password != server.passwd:
+                    return False
+                server.logins = server.logins + 1
+                return True
+        return await asyncssh.create_server(Auth, '127.0.0.1', port,
+                                    server_host_keys=[self.host_key],
+                                    process_factory=self.handle,
+                                    line_editor=False)
+
+    async def write(self, process, text):
+        text = text.replace('\n', '\r\n')
+        if not self.chunk_size:
+            process.stdout.write(text)
+            return
+        for i in range(0, len(text), self.chunk_size):
+            process.stdout.write(text[i:i + self.chunk_size])
+            await asyncio.sleep(0)
+
+    async def handle(self, process):
+        prompt = UCSM_PROMPT
+        await self.write(process, 'Cisco UCS 6300 Series Fabric ' \
+                         'Interconnect\n' + prompt)
+        pending = ''
+        try:
+            while True:
+                data = await process.stdin.read(1024)
+                if not data:
+                    break
+                lines = (pending + data.replace('\r', '\n')).split('\n')
+                pending = lines.pop()
+                for command in lines:
+                    command = command.strip()
+                    if not command:
+                        continue
+                    self.commands.append(command)
+                    output = ''
+                    if command.startswith('connect nxos '):
+                        prompt = NXOS_PROMPT.format(command.split()[-1])
+                    elif command == 'exit':
+                        prompt = UCSM_PROMPT
+                    else:
+                        output = get_output(command)
+                    await self.write(process, command + '\n' + output + prompt)
+        except (asyncssh.Error, ConnectionError):
+            pass
+        process.exit(0)
+
+def main(argv):
+    server = StandInServer()
+    port = server.start((int)(argv[1]) if len(argv) > 1 else 0)
+    print('Listening on 127.0.0.1:{} as {}/{}'.format(port, server.user,
+                                                       server.passwd))
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main(sys.argv)
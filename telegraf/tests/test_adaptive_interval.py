@@ -0,0 +1,120 @@
+"""
+Tests of adaptive polling: interval of a domain chosen from its pull time,
+FI load and memory and the stats collection interval, and domains skipped
+until their next poll. Requires the modules of ucs_traffic_monitor, else
+skipped.
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+BASE = 60
+
+class UpdateDomainScheduleTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.dict(utm.user_args, {'adaptive_interval':BASE}),
+                   mock.patch.object(utm, 'domain_schedule', {}),
+                   mock.patch.object(utm, 'stats_dict', {}),
+                   mock.patch.object(utm, 'response_time_dict', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def update(self, pull_time, fi_a=None, **time_d):
+        '''
+        Update the schedule after a pull which started at 1000. Return the
+        schedule of the domain
+        '''
+        utm.stats_dict[DOMAIN_IP] = {'A':fi_a or {}, 'B':{}}
+        utm.response_time_dict[DOMAIN_IP] = dict({'sdk_start':1000,
+                                                  'sdk_end':1000 + pull_time,
+                                                  'cli_start':1000,
+                                                  'cli_end':1002}, **time_d)
+        utm.update_domain_schedule(DOMAIN_IP)
+        return utm.domain_schedule[DOMAIN_IP]
+
+    def test_base_interval(self):
+        schedule = self.update(10)
+        self.assertEqual(schedule, {'interval':BASE, 'next':1000 + BASE})
+        self.assertEqual(utm.stats_dict[DOMAIN_IP]['poll_interval'], BASE)
+
+    def test_slow_pull(self):
+        self.assertEqual(self.update(70)['interval'], 3 * BASE)
+        utm.domain_schedule.clear()
+        self.assertEqual(self.update(1000)['interval'],
+                         utm.ADAPTIVE_MAX_FACTOR * BASE)
+
+    def test_fi_load_and_memory(self):
+        self.assertEqual(self.update(10, {'load':'9.0'})['interval'], 4 * BASE)
+        utm.domain_schedule.clear()
+        self.assertEqual(self.update(10, {'load':'bad',
+                                          'mem_available':'512'})['interval'],
+                         2 * BASE)
+
+    def test_collection_interval(self):
+        schedule = self.update(10, collection_interval=90)
+        self.assertEqual(schedule['interval'], 2 * BASE)
+        self.assertEqual(schedule['collection_interval'], 90)
+        self.assertAlmostEqual(schedule['collection_time'], time.time(),
+                               delta=5)
+        # Kept for the next pulls, which do not query the policies
+        self.assertEqual(self.update(10)['interval'], 2 * BASE)
+
+    def test_shorter_interval_one_step_at_a_time(self):
+        self.update(1000)
+        self.assertEqual(self.update(10)['interval'], 4 * BASE)
+        self.assertEqual(self.update(10)['interval'], 2 * BASE)
+        self.assertEqual(self.update(10)['interval'], BASE)
+
+    def test_not_pulled(self):
+        schedule = self.update(0, sdk_start=0, cli_start=0)
+        self.assertEqual(schedule, {})
+        self.assertNotIn('poll_interval', utm.stats_dict[DOMAIN_IP])
+
+class SkipDomainsNotDueTest(unittest.TestCase):
+    def test_skip(self):
+        now = time.time()
+        pickled = {DOMAIN_IP:{'sdk':'handle', 'cli':None}}
+        domains = {DOMAIN_IP:now + 10 * BASE, '10.1.1.2':now + BASE / 4,
+                   '10.1.1.3':None}
+        patches = [mock.patch.dict(utm.user_args, {'adaptive_interval':BASE}),
+                   mock.patch.object(utm, 'domain_dict',
+                                     {d:[] for d in domains}),
+                   mock.patch.object(utm, 'domain_schedule',
+                                     {d:{'next':n} for d, n in \
+                                        domains.items() if n}),
+                   mock.patch.object(utm, 'stats_dict',
+                                     {d:{} for d in domains}),
+                   mock.patch.object(utm, 'counter_stores', {}),
+                   mock.patch.object(utm, 'response_time_dict', {}),
+                   mock.patch.object(utm, 'conn_dict', {}),
+                   mock.patch.object(utm, 'pickled_connections', pickled)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        utm.skip_domains_not_due()
+        self.assertEqual(sorted(utm.stats_dict), ['10.1.1.2', '10.1.1.3'])
+        self.assertEqual(utm.conn_dict, pickled)
+        self.assertIsNot(utm.conn_dict[DOMAIN_IP], pickled[DOMAIN_IP])
+
+class GetIntervalSecondsTest(unittest.TestCase):
+    def test_intervals(self):
+        self.assertEqual(utm.get_interval_seconds('30seconds'), 30)
+        self.assertEqual(utm.get_interval_seconds('2minutes'), 120)
+        self.assertEqual(utm.get_interval_seconds('1hour'), 3600)
+        self.assertIsNone(utm.get_interval_seconds('not-applicable'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+Tests of the CLI (SSH) sessions with --async-ssh against ssh_stand_in
+
+Rows read by AsyncSshEngine while the output is received must be the same
+as the rows read from the output of netmiko (send_command) for the same
+commands. Requires the modules of ucs_traffic_monitor and asyncssh, else
+skipped.
+"""
+
+import os
+import sys
+import tempfile
+import functools
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import asyncssh
+    import ucs_traffic_monitor as utm
+    import ssh_stand_in
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '127.0.0.1'
+
+def get_netmiko_rows(stats_type, command):
+    '''
+    Return rows read from the output of a command, like the netmiko path of
+    pull_ucs_stats
+    '''
+    return utm.CliTableReader(stats_type).feed_text( \
+                                            ssh_stand_in.get_output(command))
+
+class AsyncSshTest(unittest.TestCase):
+    chunk_size = 0
+
+    @classmethod
+    def setUpClass(cls):
+        if not utm.cli_stats_types:
+            utm.compile_cli_table_maps()
+        cls.server = ssh_stand_in.StandInServer(chunk_size=cls.chunk_size)
+        cls.port = cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        patches = [
+            mock.patch.dict(utm.user_args, {'conn_timeout':10,
+                                            'known_hosts':None}),
+            mock.patch.dict(utm.domain_dict, {DOMAIN_IP:[self.server.user, \
+                                              self.server.passwd, 'lab']}),
+            mock.patch.object(utm, 'login_limiter',
+                              utm.LoginLimiter(0, utm.LOGIN_BURST, 3)),
+            mock.patch.object(utm.asyncssh, 'connect', functools.partial( \
+                                    asyncssh.connect, port=self.port))]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.engine = utm.AsyncSshEngine()
+        self.addCleanup(self.engine.close)
+
+    def test_rows_same_as_netmiko(self):
+        stats_types = ['pfc_stats', 'queuing_stats']
+        fi_tables = self.engine.run(DOMAIN_IP, {'A':stats_types,
+                                                'B':stats_types})
+        expected = [get_netmiko_rows(t, utm.cli_stats_types[t][0]) for t in \
+                        stats_types]
+        self.assertTrue(all(expected))
+        self.assertEqual(fi_tables, {'A':expected, 'B':expected})
+
+    def test_queuing_drops_added(self):
+        rows = get_netmiko_rows('queuing_stats', 'show queuing interface')
+        self.assertEqual([tuple(row) for row in rows],
+                         [('Ethernet1/1', 15), ('Ethernet1/49', 0),
+                          ('Ethernet1/1/1', 7), ('Ethernet1/1/2', 40)])
+
+    def test_session_reused(self):
+        logins = self.server.logins
+        self.engine.run(DOMAIN_IP, {'A':['pfc_stats']})
+        fi_tables = self.engine.run(DOMAIN_IP, {'B':['pfc_stats']},
+                                    reuse_only=True)
+        self.assertEqual(list(fi_tables), ['B'])
+        self.assertEqual(self.server.logins, logins + 1)
+        # The slot is kept for the life of the session, not per use
+        self.assertEqual(utm.login_limiter.sessions[DOMAIN_IP], 1)
+        self.engine.close()
+        self.assertEqual(utm.login_limiter.sessions[DOMAIN_IP], 0)
+
+    def test_iom_rows_same_as_netmiko(self):
+        command = utm.cli_stats_types['iom_err_stats'][0].format(c_id='3',
+                                                            last_port=8)
+        with mock.patch.dict(utm.cli_stats_types, {'iom_err_stats':[command] \
+                                + utm.cli_stats_types['iom_err_stats'][1:]}):
+            fi_tables = self.engine.run(DOMAIN_IP, {'A':['iom_err_stats']})
+        expected = get_netmiko_rows('iom_err_stats', command)
+        self.assertEqual(len(expected), 8)
+        self.assertEqual(fi_tables, {'A':[expected]})
+
+class AsyncSshChunkedTest(AsyncSshTest):
+    '''
+    Lines and prompts split across the reads of the channel
+    '''
+    chunk_size = 7
+
+class KnownHostsTest(AsyncSshTest):
+    '''
+    Host key verification with --known-hosts
+    '''
+
+    def write_known_hosts(self, key):
+        known_hosts = tempfile.NamedTemporaryFile('w', suffix='.known_hosts',
+                                                  delete=False)
+        self.addCleanup(os.remove, known_hosts.name)
+        known_hosts.write('[{}]:{} {}'.format(DOMAIN_IP, self.port, \
+                    key.export_public_key('openssh').decode()))
+        known_hosts.close()
+        utm.user_args['known_hosts'] = known_hosts.name
+
+    def test_rows_same_as_netmiko(self):
+        self.write_known_hosts(self.server.host_key)
+        super().test_rows_same_as_netmiko()
+
+    def test_unknown_host_key(self):
+        self.write_known_hosts(asyncssh.generate_private_key('ssh-ed25519'))
+        self.assertEqual(self.engine.run(DOMAIN_IP, {'A':['pfc_stats']}), {})
+
+    test_session_reused = None
+    test_iom_rows_same_as_netmiko = None
+    test_queuing_drops_added = None
+
+if __name__ == '__main__':
+    unittest.main()
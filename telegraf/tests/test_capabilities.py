@@ -0,0 +1,97 @@
+"""
+Tests of the capability map: class IDs and CLI commands which keep failing
+on a domain are skipped for its model and firmware, and probed again for a
+new profile. Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+CLASS_IDS = ['TopSystem', 'ComputeBlade', 'EtherRxStats']
+
+class CapabilityTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(utm, 'class_ids', CLASS_IDS),
+            mock.patch.object(utm, 'capabilities', {}),
+            mock.patch.object(utm, 'protection', {}),
+            mock.patch.object(utm, 'cli_stats_types',
+                              {'pfc_stats':['show pfc', None, {}],
+                               'drops':['show drops', None, {}]}),
+            mock.patch.object(utm, 'stats_dict', {DOMAIN_IP:{
+                                'ucsm_fw_ver':'4.2(1f)',
+                                'A':{'model':'UCS-FI-6332',
+                                     'fi_fw_sys_ver':'5.0(3)N2(4.21f)'}}})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def fail_pulls(self, failed_class_ids, pulls=utm.CAPABILITY_PROBES):
+        with self.assertLogs(utm.logger, 'WARNING'):
+            utm.logger.warning('start')
+            for n in range(pulls):
+                utm.update_class_capabilities(DOMAIN_IP, failed_class_ids)
+
+    def test_profile(self):
+        capability = utm.get_capability(DOMAIN_IP)
+        self.assertEqual(capability['profile'],
+                         'UCS-FI-6332, 4.2(1f), 5.0(3)N2(4.21f)')
+        self.assertIs(utm.get_capability(DOMAIN_IP), capability)
+        # Model not known, like a skipped domain
+        utm.stats_dict[DOMAIN_IP] = {}
+        self.assertIs(utm.get_capability(DOMAIN_IP), capability)
+        utm.capabilities.clear()
+        self.assertIsNone(utm.get_capability(DOMAIN_IP))
+
+    def test_failing_class_id_skipped(self):
+        self.fail_pulls(['TopSystem', 'ComputeBlade'],
+                        utm.CAPABILITY_PROBES - 1)
+        self.assertEqual(utm.get_query_class_ids(DOMAIN_IP), CLASS_IDS)
+        self.fail_pulls(['TopSystem', 'ComputeBlade'], 1)
+        # Required class IDs are always queried
+        self.assertEqual(utm.get_query_class_ids(DOMAIN_IP),
+                         ['TopSystem', 'EtherRxStats'])
+        self.assertEqual(utm.capabilities[DOMAIN_IP]['failed_class_ids'],
+                         {'ComputeBlade':utm.CAPABILITY_PROBES})
+
+    def test_count_reset_by_success(self):
+        self.fail_pulls(['ComputeBlade'], utm.CAPABILITY_PROBES - 1)
+        utm.update_class_capabilities(DOMAIN_IP, ['EtherRxStats'])
+        self.assertEqual(utm.capabilities[DOMAIN_IP]['failed_class_ids'],
+                         {'EtherRxStats':1})
+
+    def test_new_firmware_probed_again(self):
+        self.fail_pulls(['ComputeBlade'])
+        utm.stats_dict[DOMAIN_IP]['ucsm_fw_ver'] = '4.3(2b)'
+        with self.assertLogs(utm.logger, 'WARNING') as log:
+            utm.update_class_capabilities(DOMAIN_IP, [])
+        self.assertIn('New profile', log.output[0])
+        self.assertEqual(utm.get_query_class_ids(DOMAIN_IP), CLASS_IDS)
+
+    def test_unusable_cli_output(self):
+        fi_dict = {'A':{'pfc_stats':[['Ethernet1/1', '0']], 'drops':None},
+                   'B':{'pfc_stats':[], 'drops':[['Ethernet1/1', '5']]}}
+        with self.assertLogs(utm.logger, 'WARNING'):
+            for n in range(utm.CAPABILITY_PROBES):
+                self.assertEqual(utm.update_cli_capabilities(DOMAIN_IP,
+                                                             fi_dict),
+                                 ['pfc_stats'])
+        self.assertEqual(utm.get_cli_stats_types(DOMAIN_IP), ['pfc_stats'])
+        # Not run, not counted
+        utm.update_cli_capabilities(DOMAIN_IP, {'A':{'pfc_stats':[]}})
+        self.assertEqual(utm.capabilities[DOMAIN_IP]['failed_cli'],
+                         {'drops':utm.CAPABILITY_PROBES})
+
+if __name__ == '__main__':
+    unittest.main()
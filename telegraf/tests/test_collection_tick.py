@@ -0,0 +1,108 @@
+"""
+Tests of the collection tick: interval and clock offset of a domain learned
+from time_collected, repeated samples found and waits for the next tick.
+Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+T0 = time.mktime(time.strptime('2026-01-01T10:00:00', '%Y-%m-%dT%H:%M:%S'))
+
+def get_obj(*seconds):
+    '''
+    Return EtherRxStats objects collected at T0 + seconds
+    '''
+    return {'EtherRxStats':[SimpleNamespace(dn='port-' + (str)(n),
+                time_collected=time.strftime('%Y-%m-%dT%H:%M:%S', \
+                    time.localtime(T0 + s)) + '.123') for n, s in \
+                enumerate(seconds)]}
+
+class IsSampleUnchangedTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(utm, 'collection_ticks', {}),
+                   mock.patch.object(utm, 'response_time_dict',
+                                     {DOMAIN_IP:{}})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def is_unchanged(self, obj, sdk_end):
+        utm.response_time_dict[DOMAIN_IP]['sdk_end'] = T0 + sdk_end
+        return utm.is_sample_unchanged(DOMAIN_IP, obj)
+
+    def test_time_collected(self):
+        self.assertEqual(utm.get_time_collected(get_obj(0, 60, 30)), T0 + 60)
+        self.assertIsNone(utm.get_time_collected({}))
+        obj = {'EtherRxStats':[SimpleNamespace(dn='port-1',
+                                               time_collected='never')]}
+        with self.assertLogs(utm.logger, 'WARNING'):
+            self.assertIsNone(utm.get_time_collected(obj))
+
+    def test_learn_tick(self):
+        self.assertFalse(self.is_unchanged(get_obj(0), 5))
+        self.assertEqual(utm.collection_ticks[DOMAIN_IP],
+                         {'last':T0, 'offset':5})
+        self.assertTrue(self.is_unchanged(get_obj(0), 25))
+        self.assertFalse(self.is_unchanged(get_obj(60), 63))
+        self.assertEqual(utm.collection_ticks[DOMAIN_IP],
+                         {'last':T0 + 60, 'offset':3, 'interval':60})
+        # Shortest gap is the interval
+        self.assertFalse(self.is_unchanged(get_obj(90), 94))
+        self.assertEqual(utm.collection_ticks[DOMAIN_IP]['interval'], 30)
+        self.assertEqual(utm.collection_ticks[DOMAIN_IP]['offset'], 3)
+
+    def test_offset_reset_after_clock_change(self):
+        self.is_unchanged(get_obj(0), 5)
+        self.is_unchanged(get_obj(60), 63)
+        self.assertFalse(self.is_unchanged(get_obj(120), 200))
+        self.assertEqual(utm.collection_ticks[DOMAIN_IP]['offset'], 80)
+
+    def test_no_time_collected(self):
+        self.assertFalse(self.is_unchanged({}, 5))
+        self.assertEqual(utm.collection_ticks, {})
+
+class WaitForCollectionTickTest(unittest.TestCase):
+    def wait(self, seconds_since_tick, tick=None):
+        '''
+        Wait in a domain whose last tick was 2s after T0. Return the sleeps
+        '''
+        sleeps = []
+        fake_time = SimpleNamespace(time=lambda: T0 + 2 + seconds_since_tick,
+                                    sleep=sleeps.append)
+        if tick is None:
+            tick = {'last':T0, 'offset':2, 'interval':60}
+        with mock.patch.object(utm, 'collection_ticks', {DOMAIN_IP:tick}), \
+                mock.patch.object(utm, 'time', fake_time):
+            utm.wait_for_collection_tick(DOMAIN_IP)
+        return sleeps
+
+    def test_new_sample_available(self):
+        self.assertEqual(self.wait(60 + utm.TICK_MARGIN + 1), [])
+
+    def test_tick_is_now(self):
+        self.assertEqual(self.wait(61), [utm.TICK_MARGIN - 1])
+
+    def test_sample_pulled(self):
+        self.assertEqual(self.wait(50), [10 + utm.TICK_MARGIN])
+        # Too long to wait
+        self.assertEqual(self.wait(60 - utm.TICK_MAX_WAIT - 5), [])
+
+    def test_interval_not_known(self):
+        self.assertEqual(self.wait(50, {'last':T0, 'offset':2}), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""
+Tests of CounterStore: counters of FI ports, backplane ports and vifs in
+columns, with and without numpy. Requires the modules of
+ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+INTERVAL = 60
+
+def get_store():
+    '''
+    Return a CounterStore with two FI ports, a backplane port and a vif
+    '''
+    store = utm.CounterStore()
+    rows = [
+        ({'oper_speed':10}, 'FI-A', 'fi_port',
+         {'bytes_rx_delta':'7500000000', 'bytes_tx_delta':'750000000'}),
+        ({'oper_speed':40}, 'FI-A', 'fi_port',
+         {'bytes_rx_delta':'3.0E10', 'bytes_tx_delta':'bad'}),
+        ({'oper_speed':0, 'admin_speed':10}, 'chassis-1', 'bp_port',
+         {'bytes_rx_delta':'150000000', 'pause_rx':'4'}),
+        ({}, 'chassis-1', 'vif', {'bytes_rx_delta':'600'})]
+    for record, group, kind, counters in rows:
+        row = store.get_row(record, group, kind)
+        for metric, value in counters.items():
+            store.set(row, metric, value)
+    return store
+
+class CounterStoreTest(unittest.TestCase):
+    def assertListAlmostEqual(self, first, second):
+        self.assertEqual(len(first), len(second))
+        for a, b in zip(first, second):
+            self.assertAlmostEqual(a, b)
+
+    def test_rows_and_values(self):
+        store = get_store()
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.records[1]['counter_row'], 1)
+        self.assertEqual(store.get_row(store.records[1], 'FI-A', 'fi_port'), 1)
+        self.assertEqual(store.get(1, 'bytes_rx_delta'), 30000000000)
+        self.assertIsNone(store.get(1, 'bytes_tx_delta'))
+        self.assertIsNone(store.get(None, 'bytes_rx_delta'))
+
+    def test_rates(self):
+        self.assertListAlmostEqual( \
+                list(get_store().rates('bytes_rx_delta', INTERVAL)),
+                [125000000.0, 500000000.0, 2500000.0, 10.0])
+        self.assertListAlmostEqual( \
+                list(get_store().rates('bytes_tx_delta', INTERVAL)),
+                [12500000.0, 0.0, 0.0, 0.0])
+
+    def test_utilization_against_oper_speed(self):
+        # 10 Gbps, 40 Gbps, oper_speed 0 and no speed (vif)
+        self.assertListAlmostEqual( \
+                list(get_store().utilization('bytes_rx_delta', INTERVAL)),
+                [10.0, 10.0, 0.0, 0.0])
+
+    def test_totals_and_sums_by_group(self):
+        store = get_store()
+        self.assertEqual(store.total('bytes_rx_delta'), 37650000600)
+        self.assertEqual(store.total('bytes_rx_delta', 'fi_port'),
+                         37500000000)
+        self.assertEqual(store.sum_by_group('bytes_rx_delta'),
+                         {'FI-A':37500000000, 'chassis-1':150000600})
+        self.assertEqual(store.sum_by_group('bytes_rx_delta', 'vif'),
+                         {'chassis-1':600})
+        # Groups without the counter are not in the sums
+        self.assertEqual(store.sum_by_group('pause_rx'), {'chassis-1':4})
+
+    def test_clear_and_serialize(self):
+        store = get_store()
+        store.clear('bytes_rx_delta')
+        text = store.serialize()
+        self.assertEqual(text[0], {'bytes_tx_delta':'750000000'})
+        self.assertEqual(text[2], {'pause_rx':'4'})
+        self.assertEqual(text[3], {})
+        self.assertEqual(store.sum_by_group('bytes_rx_delta'), {})
+
+    def test_empty_store(self):
+        store = utm.CounterStore()
+        self.assertEqual(list(store.rates('bytes_rx_delta', INTERVAL)), [])
+        self.assertEqual(store.total('bytes_rx_delta'), 0)
+        self.assertEqual(store.sum_by_group('bytes_rx_delta'), {})
+        self.assertEqual(store.serialize(), [])
+
+@unittest.skipIf(utm.numpy is None, 'numpy not installed')
+class CounterStoreNoNumpyTest(CounterStoreTest):
+    '''
+    Same results without numpy
+    '''
+
+    def setUp(self):
+        patch = mock.patch.object(utm, 'numpy', None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Tests of the DNS cache: only names without an address or with an expired
+address resolved, and the expired address used if resolution fails.
+Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import time
+import socket
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+ADDRESSES = {'ucs-1.example.com':'10.1.1.1', 'ucs-2.example.com':'10.1.1.2',
+             '10.1.1.3':'10.1.1.3'}
+
+class ResolveDomainsTest(unittest.TestCase):
+    def setUp(self):
+        self.resolved = []
+        patches = [mock.patch.object(utm, 'dns_cache', {}),
+                   mock.patch.object(utm, 'domain_dict',
+                                     {name:[] for name in ADDRESSES}),
+                   mock.patch.object(utm.socket, 'getaddrinfo',
+                                     side_effect=self.getaddrinfo)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def getaddrinfo(self, name, port, proto=0):
+        self.resolved.append(name)
+        if name not in ADDRESSES:
+            raise socket.gaierror('Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, proto, '',
+                 (ADDRESSES[name], 0))]
+
+    def test_resolved_once_per_ttl(self):
+        utm.resolve_domains()
+        self.assertEqual(sorted(self.resolved), sorted(ADDRESSES))
+        for name, address in ADDRESSES.items():
+            self.assertEqual(utm.get_domain_address(name), address)
+            self.assertAlmostEqual(utm.dns_cache[name]['expiry'],
+                                   time.time() + utm.DNS_CACHE_TTL, delta=5)
+        utm.resolve_domains()
+        self.assertEqual(len(self.resolved), len(ADDRESSES))
+
+        utm.dns_cache['ucs-2.example.com']['expiry'] = time.time() - 1
+        utm.resolve_domains()
+        self.assertEqual(self.resolved[len(ADDRESSES):], ['ucs-2.example.com'])
+
+    def test_expired_address_kept_on_failure(self):
+        utm.domain_dict['ucs-9.example.com'] = []
+        utm.dns_cache['ucs-9.example.com'] = {'address':'10.1.1.9',
+                                              'expiry':0}
+        with self.assertLogs(utm.logger, 'WARNING') as log:
+            utm.resolve_domains()
+        self.assertIn('Using 10.1.1.9', log.output[0])
+        self.assertEqual(utm.get_domain_address('ucs-9.example.com'),
+                         '10.1.1.9')
+        self.assertEqual(utm.get_domain_address('ucs-8.example.com'),
+                         'ucs-8.example.com')
+
+if __name__ == '__main__':
+    unittest.main()
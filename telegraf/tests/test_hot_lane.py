@@ -0,0 +1,105 @@
+"""
+Tests of the hot lane: hot ports selected from the hotports file and the
+busiest ports, and bytes of hot ports written only for a new UCSM sample.
+Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+UPLINK_DN = 'sys/switch-A/slot-1/switch-ether/port-49'
+BR_PORT_DN = 'sys/switch-B/slot-1/switch-ether/aggr-port-25/port-1'
+BP_PORT_DN = 'sys/chassis-1/slot-1/host/port-3'
+VIF_DN = 'sys/chassis-1/blade-1/adaptor-1/host-eth-1/vif-1'
+
+def get_stats(rn, port_bytes, time_collected='t1'):
+    '''
+    Return EtherRxStats or EtherTxStats objects for {port dn:bytes}
+    '''
+    return [SimpleNamespace(dn=port_dn + '/' + rn, total_bytes_delta=delta,
+                            time_collected=time_collected) for \
+                port_dn, delta in port_bytes.items()]
+
+class HotPortsTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.dict(utm.user_args, {'hot_port_count':2}),
+                   mock.patch.object(utm, 'hot_ports', {}),
+                   mock.patch.object(utm, 'hot_port_collected', {}),
+                   mock.patch.object(utm, 'hot_port_config', {}),
+                   mock.patch.object(utm, 'ssh_engine', None),
+                   mock.patch.object(utm, 'stats_dict',
+                                     {DOMAIN_IP:{'location':'lab'}})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_pfc_port_name(self):
+        self.assertEqual(utm.get_pfc_port_name(UPLINK_DN), 'Ethernet1/49')
+        self.assertEqual(utm.get_pfc_port_name(BR_PORT_DN),
+                         'Br-Ethernet1/25/1')
+        self.assertEqual(utm.get_pfc_port_name(BP_PORT_DN), 'Ethernet1/1/3')
+        self.assertEqual(utm.get_pfc_port_name( \
+                            'sys/fex-2/slot-1/host/port-3'), 'Ethernet2/1/3')
+        self.assertIsNone(utm.get_pfc_port_name(VIF_DN))
+
+    def test_busiest_ports(self):
+        obj = {'EtherRxStats':get_stats('rx-stats', {UPLINK_DN:'100',
+                                BR_PORT_DN:'50', BP_PORT_DN:'bad',
+                                VIF_DN:'1000'}),
+               'EtherTxStats':get_stats('tx-stats', {BP_PORT_DN:'120'}),
+               'EtherServerIntFIo':[SimpleNamespace(dn=BP_PORT_DN,
+                                                    switch_id='B')]}
+        utm.select_hot_ports(DOMAIN_IP, obj)
+        self.assertEqual(utm.hot_ports[DOMAIN_IP], {'location':'lab',
+            'ports':[{'dn':BP_PORT_DN, 'fi_id':'B',
+                      'pfc_name':'Ethernet1/1/3'},
+                     {'dn':UPLINK_DN, 'fi_id':'A',
+                      'pfc_name':'Ethernet1/49'}]})
+
+    def test_ports_of_hotports_file_first(self):
+        utm.hot_port_config['domains'] = {DOMAIN_IP:[BR_PORT_DN, VIF_DN]}
+        obj = {'EtherRxStats':get_stats('rx-stats', {UPLINK_DN:'100',
+                                BR_PORT_DN:'500', BP_PORT_DN:'10'})}
+        with self.assertLogs(utm.logger, 'WARNING'):
+            utm.select_hot_ports(DOMAIN_IP, obj)
+        self.assertEqual([port['dn'] for port in \
+                            utm.hot_ports[DOMAIN_IP]['ports']],
+                         [BR_PORT_DN, UPLINK_DN, BP_PORT_DN])
+        # Backplane port without EtherServerIntFIo
+        self.assertEqual(utm.hot_ports[DOMAIN_IP]['ports'][2]['fi_id'], '')
+
+    def test_bytes_of_new_samples(self):
+        utm.select_hot_ports(DOMAIN_IP, {'EtherRxStats':get_stats( \
+                        'rx-stats', {UPLINK_DN:'100', BR_PORT_DN:'50'})})
+        sdk_handle = mock.Mock()
+        sdk_handle.query_classid.side_effect = lambda class_id, f: \
+            get_stats('rx-stats', {UPLINK_DN:'7'}) if \
+                class_id == 'EtherRxStats' else \
+            get_stats('tx-stats', {UPLINK_DN:'9', BR_PORT_DN:'3'})
+        lines = utm.pull_hot_ports(DOMAIN_IP, {'sdk':sdk_handle, 'cli':None})
+        self.assertEqual(lines, [
+            'HotPortStats,domain=10.1.1.1,fi_id=A,location=lab,port=' + \
+                UPLINK_DN + ' bytes_rx_delta=7,bytes_tx_delta=9\n',
+            'HotPortStats,domain=10.1.1.1,fi_id=B,location=lab,port=' + \
+                BR_PORT_DN + ' bytes_tx_delta=3\n'])
+        filter_str = sdk_handle.query_classid.call_args_list[0][0][1]
+        self.assertEqual(filter_str, '(dn, "^({}|{})/rx-stats$", ' \
+                         'type="re")'.format(UPLINK_DN, BR_PORT_DN))
+        # Same time_collected : not written again
+        self.assertEqual(utm.pull_hot_ports(DOMAIN_IP, {'sdk':sdk_handle,
+                                                        'cli':None}), [])
+
+if __name__ == '__main__':
+    unittest.main()
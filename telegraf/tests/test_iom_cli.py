@@ -0,0 +1,62 @@
+"""
+Tests of the chassis and FEX targets of --iom-cli, found from the
+backplane ports of the parsed SDK stats. Requires the modules of
+ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+def get_bp_ports(fi_id, port_ids):
+    return {port_id:{'fi_id':fi_id} for port_id in port_ids}
+
+class UpdateIomTargetsTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(utm, 'stats_dict', {}),
+                   mock.patch.object(utm, 'iom_targets', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def update(self, chassis, fex=None, model='UCS-FI-6332'):
+        utm.stats_dict[DOMAIN_IP] = {'A':{'model':model}, 'chassis':chassis,
+                                     'fex':fex or {}}
+        utm.update_iom_targets(DOMAIN_IP)
+        return utm.iom_targets.get(DOMAIN_IP)
+
+    def test_last_port_per_iom(self):
+        chassis = {
+            'chassis-1':{'bp_ports':{'1':get_bp_ports('A', ['1', '2', '8']),
+                                     '2':get_bp_ports('B', ['4', '16'])}},
+            'chassis-2':{'bp_ports':{'1':get_bp_ports('A', ['1'])}}}
+        fex = {'fex-3':{'bp_ports':{'1':get_bp_ports('B', ['32'])}}}
+        self.assertEqual(self.update(chassis, fex),
+                         {'A':[['1', 8], ['2', 1]], 'B':[['1', 16], ['3', 32]]})
+
+    def test_port_channel_keys_skipped(self):
+        bp_ports = get_bp_ports('A', ['PC-1290', '27', '3'])
+        chassis = {
+            'chassis-1':{'bp_ports':{'1':bp_ports,
+                                     '2':get_bp_ports('B', ['PC-1291'])}}}
+        self.assertEqual(self.update(chassis), {'A':[['1', 27]]})
+
+    def test_unknown_fi_and_mini(self):
+        chassis = {'chassis-1':{'bp_ports':{'1':get_bp_ports('', ['1'])}}}
+        self.assertIsNone(self.update(chassis))
+        chassis = {'chassis-1':{'bp_ports':{'1':get_bp_ports('A', ['1'])}}}
+        self.assertIsNone(self.update(chassis, model='UCS-FI-M-6324'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""
+Tests of --keep-alive: requests of the SDK handles of a domain sent on the
+idle connections of its TransportPool, sent again on a new connection if
+UCS Manager closed the idle one, and redirects followed. Uses a local HTTP
+server. Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import threading
+import unittest
+import socketserver
+import http.server
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    '''
+    Echo the body and keep the path and client port of requests. /close
+    closes the connection after the response without telling the client.
+    /old redirects to /nuova
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, self.client_address[1]))
+        if self.path == '/old':
+            self.send_response(302)
+            self.send_header('Location', 'http://127.0.0.1:{}/nuova'.format( \
+                                                self.server.server_port))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', (str)(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        if self.path == '/close':
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+class PooledUcsDriverTest(unittest.TestCase):
+    def setUp(self):
+        server = Server(('127.0.0.1', 0), Handler)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        self.uri = 'http://127.0.0.1:{}/'.format(server.server_port)
+        patch = mock.patch.object(utm, 'transport_pools', {})
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def post(self, path, data):
+        return utm.PooledUcsDriver(DOMAIN_IP).post(self.uri + path, data,
+                                                   timeout=5)
+
+    def get_ports(self):
+        return [port for path, port in self.server.requests]
+
+    def test_connection_shared_by_drivers(self):
+        self.assertEqual(self.post('nuova', b'<a/>'), '<a/>')
+        self.assertEqual(self.post('nuova', b'<b/>'), '<b/>')
+        ports = self.get_ports()
+        self.assertEqual(ports[0], ports[1])
+        self.assertEqual(len(utm.transport_pools[DOMAIN_IP].idle), 1)
+        self.assertGreater(utm.get_transport_times(DOMAIN_IP)['sdk_request'],
+                           0)
+        self.assertEqual(utm.transport_pools[DOMAIN_IP].pop_times()
+                                                    ['requests'], 0)
+
+    def test_sent_again_if_idle_connection_closed(self):
+        self.post('close', b'<a/>')
+        self.assertEqual(self.post('nuova', b'<b/>'), '<b/>')
+        ports = self.get_ports()
+        self.assertEqual(len(ports), 2)
+        self.assertNotEqual(ports[0], ports[1])
+
+    def test_redirect(self):
+        driver = utm.PooledUcsDriver(DOMAIN_IP)
+        self.assertEqual(driver.post(self.uri + 'old', b'<a/>', timeout=5),
+                         '<a/>')
+        self.assertEqual(driver.redirect_uri, self.uri + 'nuova')
+        driver.post(self.uri + 'old', b'<b/>', timeout=5)
+        self.assertEqual([path for path, port in self.server.requests],
+                         ['/old', '/nuova', '/nuova'])
+
+class TransportPoolTest(unittest.TestCase):
+    def test_pool_size(self):
+        pool = utm.TransportPool(DOMAIN_IP)
+        conns = [mock.Mock(sock=mock.Mock(), host='h', port=443) for \
+                    n in range(utm.TRANSPORT_POOL_SIZE + 1)]
+        for conn in conns:
+            pool.put_connection(conn)
+        self.assertEqual(pool.idle, conns[:-1])
+        conns[-1].close.assert_called_once_with()
+        # Last connection put is used first
+        self.assertIs(pool.get_connection('https', 'h', 443, 5), conns[-2])
+        conns[-2].sock.settimeout.assert_called_once_with(5)
+        self.assertIsInstance(pool.get_connection('https', 'other', 443, 5),
+                              utm.PooledHTTPSConnection)
+
+class UsePooledTransportTest(unittest.TestCase):
+    def test_driver_replaced(self):
+        handle = SimpleNamespace(_UcsSession__driver=object())
+        with mock.patch.dict(utm.user_args, {'keep_alive':True}):
+            utm.use_pooled_transport(DOMAIN_IP, handle)
+        self.assertIsInstance(handle._UcsSession__driver,
+                              utm.PooledUcsDriver)
+        self.assertEqual(handle._UcsSession__driver.domain_ip, DOMAIN_IP)
+
+    def test_unsupported_logged_once(self):
+        with mock.patch.dict(utm.user_args, {'keep_alive':True}), \
+                mock.patch.object(utm, 'pooled_transport_unsupported', False):
+            with self.assertLogs(utm.logger, 'WARNING') as log:
+                utm.use_pooled_transport(DOMAIN_IP, SimpleNamespace())
+                utm.use_pooled_transport(DOMAIN_IP, SimpleNamespace())
+                utm.logger.warning('end')
+        self.assertEqual(len(log.output), 2)
+
+if __name__ == '__main__':
+    unittest.main()
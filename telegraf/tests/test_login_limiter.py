@@ -0,0 +1,66 @@
+"""
+Tests of LoginLimiter: token bucket of new logins and cap of sessions per
+domain. Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+class LoginLimiterTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        limiter = utm.LoginLimiter(20, 2, 3)
+        start = time.monotonic()
+        for domain_ip in ['10.1.1.1', '10.1.1.2']:
+            self.assertTrue(limiter.acquire(domain_ip, 1))
+        self.assertLess(time.monotonic() - start, 0.04)
+        self.assertTrue(limiter.acquire('10.1.1.3', 1))
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_no_token_by_timeout(self):
+        limiter = utm.LoginLimiter(0.1, 1, 3)
+        self.assertTrue(limiter.acquire('10.1.1.1', 1))
+        start = time.monotonic()
+        self.assertFalse(limiter.acquire('10.1.1.1', 0.2))
+        self.assertLess(time.monotonic() - start, 0.2)
+        # Slot of the login which did not happen is not kept
+        self.assertEqual(limiter.sessions['10.1.1.1'], 1)
+
+    def test_no_rate_limit(self):
+        limiter = utm.LoginLimiter(0, 1, 100)
+        for _ in range(50):
+            self.assertTrue(limiter.acquire('10.1.1.1', 0))
+
+    def test_session_cap(self):
+        limiter = utm.LoginLimiter(0, 1, 2)
+        self.assertTrue(limiter.acquire('10.1.1.1', 1))
+        self.assertTrue(limiter.acquire('10.1.1.1', 1))
+        self.assertFalse(limiter.acquire('10.1.1.1', 0.1))
+        self.assertTrue(limiter.acquire('10.1.1.2', 0.1))
+        threading.Timer(0.1, limiter.release, ['10.1.1.1']).start()
+        start = time.monotonic()
+        self.assertTrue(limiter.acquire('10.1.1.1', 2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(limiter.sessions['10.1.1.1'], 2)
+
+    def test_hold_and_release(self):
+        limiter = utm.LoginLimiter(0, 1, 1)
+        limiter.hold('10.1.1.1')
+        self.assertFalse(limiter.acquire('10.1.1.1', 0))
+        limiter.release('10.1.1.1')
+        limiter.release('10.1.1.1')
+        self.assertEqual(limiter.sessions['10.1.1.1'], 0)
+        self.assertTrue(limiter.acquire('10.1.1.1', 0))
+
+if __name__ == '__main__':
+    unittest.main()
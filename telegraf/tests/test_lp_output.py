@@ -0,0 +1,81 @@
+"""
+Tests of the output in InfluxDB Line Protocol written as it is generated,
+in batches of whole lines. Requires the modules of ucs_traffic_monitor,
+else skipped.
+"""
+
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+class Sink(io.BytesIO):
+    '''
+    Binary file which keeps every write and counts the flushes
+    '''
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+        self.flushes = 0
+
+    def write(self, data):
+        self.writes.append(data)
+        return super().write(data)
+
+    def flush(self):
+        self.flushes += 1
+
+class WriteInfluxdbLpTest(unittest.TestCase):
+    def setUp(self):
+        patch = mock.patch.object(utm, 'LP_WRITE_LINES', 3)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_batches_of_whole_lines(self):
+        sink = Sink()
+        lines = ['m,port=' + (str)(n) + ' v=' + (str)(n) + '\n' for \
+                    n in range(7)]
+        utm.write_influxdb_lp(lines, sink)
+        self.assertEqual([data.count(b'\n') for data in sink.writes],
+                         [3, 3, 1])
+        self.assertTrue(all(data.endswith(b'\n') for data in sink.writes))
+        self.assertEqual(sink.getvalue(), ''.join(lines).encode())
+        self.assertEqual(sink.flushes, 1)
+
+    def test_written_as_generated(self):
+        sink = Sink()
+        written = []
+        def generate():
+            for n in range(6):
+                # Lines of earlier batches are already written
+                written.append(len(sink.writes))
+                yield 'm v={}\n'.format(n)
+        utm.write_influxdb_lp(generate(), sink)
+        self.assertEqual(written, [0, 0, 0, 1, 1, 1])
+        self.assertEqual(len(sink.writes), 2)
+
+    def test_no_lines(self):
+        sink = Sink()
+        utm.write_influxdb_lp(iter([]), sink)
+        self.assertEqual(sink.writes, [])
+        self.assertEqual(sink.flushes, 1)
+
+    def test_stdout(self):
+        stdout = mock.Mock()
+        stdout.buffer = Sink()
+        with mock.patch.object(utm.sys, 'stdout', stdout):
+            utm.write_influxdb_lp(['m v=1\n'])
+        stdout.flush.assert_called_once_with()
+        self.assertEqual(stdout.buffer.getvalue(), b'm v=1\n')
+
+if __name__ == '__main__':
+    unittest.main()
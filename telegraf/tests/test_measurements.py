@@ -0,0 +1,93 @@
+"""
+Tests of the measurements file applied to the output: fields left out of
+InfluxDB Line Protocol and keys removed from output in dict format.
+Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+SERIES = 'BackplanePortStats,domain=10.1.1.1,chassis=1'
+FIELDS = [('speed', '40000'), ('pause_rx', '5'), ('fcs_delta', '0')]
+
+def get_domain_stats():
+    vif = {'bytes_rx_delta':1, 'errors_rx_delta':0}
+    return {
+        'mode':'cluster-ha', 'name':'ucs1', 'uptime':100, 'location':'lab',
+        'A':{'load':1.5, 'serial':'FDO1', 'fi_ports':{
+                '1/1':{'if_role':'server', 'name':'Eth1/1', 'pause_rx':3},
+                '1/49':{'if_role':'network', 'name':'Eth1/49', 'pause_rx':4}}},
+        'chassis':{'chassis-1':{
+            'blades':{'1':{'serial':'FCH1', 'model':'B200', 'location':'lab',
+                           'adaptors':{'1':{'vifs':{'801':vif}}}}},
+            'bp_ports':{'1':{'1':{'oper_speed':40000, 'admin_speed':0,
+                                  'fcs_delta':0, 'pause_rx':5}}}}},
+        'ru':{}, 'fex':{}}
+
+class GetLpLineTest(unittest.TestCase):
+    def test_all_fields(self):
+        self.assertEqual(utm.get_lp_line(SERIES, FIELDS, set()),
+                         SERIES + ' speed=40000,pause_rx=5,fcs_delta=0\n')
+
+    def test_excluded_fields(self):
+        self.assertEqual(utm.get_lp_line(SERIES, FIELDS,
+                                         {'speed', 'fcs_delta'}),
+                         SERIES + ' pause_rx=5\n')
+
+    def test_no_field_left(self):
+        self.assertIsNone(utm.get_lp_line(SERIES, FIELDS,
+                                  {'speed', 'fcs_delta', 'pause_rx'}))
+        self.assertIsNone(utm.get_lp_line(SERIES, [], set()))
+
+class PruneDictOutputTest(unittest.TestCase):
+    def prune(self, config):
+        enabled = [m for m in utm.MEASUREMENT_PARSERS if m not in \
+                        config.get('disable', [])]
+        with mock.patch.object(utm, 'measurement_config', config), \
+                mock.patch.object(utm, 'enabled_measurements', enabled):
+            d_dict = get_domain_stats()
+            utm.prune_dict_output(d_dict)
+        return d_dict
+
+    def test_no_measurements_file(self):
+        self.assertEqual(self.prune({}), get_domain_stats())
+
+    def test_excluded_fields(self):
+        d_dict = self.prune({'exclude_fields':{
+                    'FIEnvStats':['serial', 'sys_uptime'],
+                    'FIServerPortStats':['description'],
+                    'BackplanePortStats':['speed']}})
+        self.assertNotIn('uptime', d_dict)
+        self.assertNotIn('serial', d_dict['A'])
+        fi_ports = d_dict['A']['fi_ports']
+        self.assertNotIn('name', fi_ports['1/1'])
+        self.assertEqual(fi_ports['1/49']['name'], 'Eth1/49')
+        bp_port = d_dict['chassis']['chassis-1']['bp_ports']['1']['1']
+        self.assertEqual(bp_port, {'fcs_delta':0, 'pause_rx':5})
+        # Serial of a server is a field of Servers, not FIEnvStats
+        blade = d_dict['chassis']['chassis-1']['blades']['1']
+        self.assertEqual(blade['serial'], 'FCH1')
+
+    def test_disabled_measurements(self):
+        d_dict = self.prune({'disable':['FIEnvStats', 'Servers', 'VnicStats',
+                                        'FIUplinkPortStats']})
+        self.assertEqual(d_dict['A'], {'fi_ports':{
+                '1/1':{'if_role':'server', 'name':'Eth1/1', 'pause_rx':3}}})
+        self.assertNotIn('mode', d_dict)
+        self.assertEqual(d_dict['location'], 'lab')
+        self.assertEqual(d_dict['chassis']['chassis-1']['blades']['1'],
+                         {'location':'lab'})
+        self.assertIn('bp_ports', d_dict['chassis']['chassis-1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""
+Tests of the retry of class IDs missing in the response of a domain: only
+the missing class IDs and failed chunks queried again, within the retries
+and the deadline. Requires the modules of ucs_traffic_monitor, else
+skipped.
+"""
+
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+CLASS_IDS = ['TopSystem', 'NetworkElement', 'ComputeBlade', 'EtherRxStats']
+
+class MissingHandle(object):
+    '''
+    UcsHandle which does not return the class IDs of missing, for the
+    first misses queries
+    '''
+
+    def __init__(self, missing, misses):
+        self.missing = missing
+        self.misses = misses
+        self.queries = []
+
+    def query_classids(self, class_ids):
+        self.queries.append(list(class_ids))
+        if len(self.queries) <= self.misses:
+            class_ids = [c for c in class_ids if c not in self.missing]
+        return {class_id:[] for class_id in class_ids}
+
+class QueryMissingClassIdsTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(utm, 'class_ids', CLASS_IDS),
+                   mock.patch.object(utm, 'capabilities', {}),
+                   mock.patch.object(utm, 'protection', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def query(self, handle, failed_chunks=None, deadline=60):
+        '''
+        Query and retry missing class IDs. Return sdk_stats
+        '''
+        sdk_stats = handle.query_classids(CLASS_IDS)
+        with self.assertLogs(utm.logger, 'WARNING') as self.log:
+            return utm.query_missing_class_ids(DOMAIN_IP, handle, sdk_stats,
+                        failed_chunks or {}, time.time() + deadline, 1)
+
+    def test_only_missing_queried(self):
+        handle = MissingHandle(['ComputeBlade', 'EtherRxStats'], 1)
+        sdk_stats = self.query(handle)
+        self.assertEqual(sorted(sdk_stats), sorted(CLASS_IDS))
+        self.assertEqual(handle.queries[1:],
+                         [['ComputeBlade', 'EtherRxStats']])
+
+    def test_retries(self):
+        handle = MissingHandle(['ComputeBlade'], 10)
+        sdk_stats = self.query(handle)
+        self.assertNotIn('ComputeBlade', sdk_stats)
+        self.assertEqual(len(handle.queries),
+                         utm.MISSING_CLASS_ID_RETRIES + 1)
+
+    def test_no_time_left(self):
+        handle = MissingHandle(['ComputeBlade'], 1)
+        sdk_stats = self.query(handle, deadline=0.5)
+        self.assertNotIn('ComputeBlade', sdk_stats)
+        self.assertEqual(len(handle.queries), 1)
+        self.assertIn('No time left', self.log.output[0])
+
+    def test_failed_chunks_not_queried_whole(self):
+        handle = MissingHandle(['ComputeBlade', 'EtherRxStats'], 1)
+        def query_failed_chunks(domain_ip, sdk_handle, sdk_stats,
+                                failed_chunks):
+            self.assertIs(sdk_handle, handle)
+            sdk_stats['EtherRxStats'] = failed_chunks.pop('EtherRxStats') \
+                                            ['objects']
+        with mock.patch.object(utm, 'query_failed_chunks',
+                               side_effect=query_failed_chunks):
+            sdk_stats = self.query(handle, {'EtherRxStats':{'objects':[],
+                                            'scopes':[['chassis-1']]}})
+        self.assertEqual(sorted(sdk_stats), sorted(CLASS_IDS))
+        self.assertEqual(handle.queries[1:], [['ComputeBlade']])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Tests of the diagnostics files of failed parsers: content, size cap and
+rotation. Requires the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import glob
+import gzip
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+class Item(object):
+    def __init__(self, dn):
+        self.dn = dn
+
+    def __str__(self):
+        return 'dn:{}\n'.format(self.dn)
+
+OBJ = {'EtherPIo':[Item('sys/switch-A/slot-1/switch-ether/port-' + \
+                        (str)(i)) for i in range(1, 5)],
+       'FcPIo':[Item('sys/switch-A/slot-1/switch-fc/port-1')]}
+
+class CaptureParseFailureTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.prefix = os.path.join(tmp_dir.name, 'utm_diag')
+        patch = mock.patch.object(utm, 'diag_file_prefix', self.prefix)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def capture(self, parser_name, class_ids, domain_ip='10.1.1.1'):
+        '''
+        Call capture_parse_failure from the handler of a parser exception.
+        Return the text of the diagnostics file and the log
+        '''
+        with self.assertLogs(utm.logger, 'ERROR') as log:
+            try:
+                raise KeyError('speed')
+            except KeyError as e:
+                utm.capture_parse_failure(domain_ip, parser_name, OBJ,
+                                          class_ids, e)
+        diag_files = glob.glob(self.prefix + '_' + domain_ip + '_' + \
+                               parser_name + '_*.txt.gz')
+        self.assertEqual(len(diag_files), 1)
+        self.assertIn(diag_files[0], log.output[0])
+        with gzip.open(diag_files[0], 'rt') as diag_file:
+            return diag_file.read(), log.output[0]
+
+    def test_objects_of_parser_class_ids(self):
+        text, log = self.capture('parse_fi_stats', ['FcPIo', 'EtherPIo'])
+        lines = text.splitlines()
+        self.assertEqual(lines[0],
+                         "10.1.1.1 : parse_fi_stats : KeyError : 'speed'")
+        self.assertEqual(lines[1:3], ['----- FcPIo -----',
+                                      'dn:sys/switch-A/slot-1/switch-fc/port-1'])
+        self.assertEqual(lines[3], '----- EtherPIo -----')
+        self.assertEqual(len(lines), 8)
+        self.assertNotIn('truncated', log)
+
+    def test_size_cap(self):
+        item_len = len((str)(OBJ['EtherPIo'][0]))
+        with mock.patch.object(utm, 'DIAG_FILE_SIZE', 2 * item_len + 1):
+            text, log = self.capture('parse_fi_stats', ['EtherPIo', 'FcPIo'])
+        lines = text.splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[-1], '----- Truncated at {} bytes -----' \
+                                        .format(2 * item_len))
+        self.assertIn('truncated', log)
+
+    def test_latest_files_kept(self):
+        with mock.patch.object(utm, 'DIAG_FILE_NUMBER', 3):
+            for n in range(5):
+                self.capture('parse_{}'.format(n), ['FcPIo'])
+                # Order of the files by modification time
+                for diag_file in glob.glob(self.prefix + '_*'):
+                    mtime = os.path.getmtime(diag_file) - 1
+                    os.utime(diag_file, (mtime, mtime))
+        kept = sorted(os.path.basename(f).split('_')[4] for f in \
+                        glob.glob(self.prefix + '_*.txt.gz'))
+        self.assertEqual(kept, ['2', '3', '4'])
+
+if __name__ == '__main__':
+    unittest.main()
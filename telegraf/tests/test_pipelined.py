@@ -0,0 +1,102 @@
+"""
+Tests of --pipelined: a domain is parsed and printed as soon as all its
+pulls are merged, while the pulls of other domains continue. Requires the
+modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+SLOW_DOMAIN = '10.1.1.1'
+FAST_DOMAIN = '10.1.1.2'
+
+class GetUcsStatsTest(unittest.TestCase):
+    def setUp(self):
+        domains = [SLOW_DOMAIN, FAST_DOMAIN]
+        self.slow_pull = threading.Event()
+        patches = [
+            mock.patch.object(utm, 'ssh_engine', None),
+            mock.patch.object(utm, 'pickled_connections',
+                              {SLOW_DOMAIN:{'cli':None, 'sdk':None},
+                               FAST_DOMAIN:{'sdk':None},
+                               '10.1.1.3':{'sdk':None}}),
+            mock.patch.object(utm, 'stats_dict', {d:{} for d in domains}),
+            mock.patch.object(utm, 'conn_dict', {d:{} for d in domains}),
+            mock.patch.object(utm, 'response_time_dict',
+                              {d:{} for d in domains}),
+            mock.patch.object(utm, 'raw_sdk_stats', {}),
+            mock.patch.object(utm, 'raw_cli_stats', {}),
+            mock.patch.object(utm, 'connect_and_pull_stats',
+                              side_effect=self.pull)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def pull(self, executor):
+        '''
+        Pull of a domain. CLI pull of SLOW_DOMAIN waits for FAST_DOMAIN
+        '''
+        domain_ip, handle_type, handle = executor
+        if domain_ip == SLOW_DOMAIN and handle_type == 'cli':
+            self.assertTrue(self.slow_pull.wait(5))
+        return utm.PullResult(domain_ip, handle_type, {}, [handle_type],
+                              {handle_type + '_end':1}, None)
+
+    def test_domain_done_after_all_its_pulls(self):
+        done = []
+        def domain_done(domain_ip):
+            done.append((domain_ip, utm.raw_sdk_stats.get(domain_ip),
+                         utm.raw_cli_stats.get(domain_ip)))
+            if domain_ip == FAST_DOMAIN:
+                self.slow_pull.set()
+        utm.get_ucs_stats(domain_done)
+        # Domain not due is not pulled
+        self.assertEqual(done, [(FAST_DOMAIN, ['sdk'], None),
+                                (SLOW_DOMAIN, ['sdk'], ['cli'])])
+
+    def test_exception_after_pull(self):
+        done = []
+        def domain_done(domain_ip):
+            done.append(domain_ip)
+            self.slow_pull.set()
+            raise KeyError('location')
+        with self.assertLogs(utm.logger, 'ERROR') as log:
+            utm.get_ucs_stats(domain_done)
+        self.assertEqual(done, [FAST_DOMAIN, SLOW_DOMAIN])
+        self.assertIn('Exception after pull for ' + FAST_DOMAIN,
+                      log.output[0])
+
+class PrintDomainOutputTest(unittest.TestCase):
+    def test_parsed_and_printed(self):
+        calls = []
+        with mock.patch.object(utm, 'stats_dict', {SLOW_DOMAIN:{'A':{}}}), \
+                mock.patch.dict(utm.user_args,
+                                {'output_format':'influxdb-lp'}), \
+                mock.patch.object(utm, 'parse_domain_stats',
+                                  side_effect=calls.append), \
+                mock.patch.object(utm, 'get_influxdb_lp',
+                                  return_value=iter(['m v=1\n'])), \
+                mock.patch.object(utm, 'write_influxdb_lp',
+                                  side_effect=lambda lines: \
+                                    calls.append(list(lines))):
+            utm.print_domain_output(SLOW_DOMAIN)
+            utm.get_influxdb_lp.assert_called_once_with(SLOW_DOMAIN,
+                                                        {'A':{}})
+            utm.user_args['output_format'] = 'dict'
+            utm.print_domain_output(FAST_DOMAIN)
+        # Output in dict format is printed after all the domains
+        self.assertEqual(calls, [SLOW_DOMAIN, ['m v=1\n'], FAST_DOMAIN])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Tests of protection mode: started by load or available memory of an FI,
+limited to PROTECT_MEASUREMENTS and ended after polls within the
+thresholds by the hysteresis. Requires the modules of ucs_traffic_monitor,
+else skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+class ProtectionTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.dict(utm.user_args, {'protect_load':4.0,
+                                                   'protect_mem':1024}),
+                   mock.patch.object(utm, 'protection', {}),
+                   mock.patch.object(utm, 'capabilities', {}),
+                   mock.patch.object(utm, 'stats_dict', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def poll(self, fi_b):
+        '''
+        Update protection mode with FI-B stats. Return protected
+        '''
+        utm.stats_dict[DOMAIN_IP] = {'A':{'load':'1.0',
+                                          'mem_available':'8192'},
+                                     'B':fi_b}
+        utm.update_protection(DOMAIN_IP)
+        return utm.stats_dict[DOMAIN_IP].get('protected')
+
+    def test_start_and_end(self):
+        self.assertEqual(self.poll({'load':'3.9'}), 0)
+        with self.assertLogs(utm.logger, 'WARNING'):
+            self.assertEqual(self.poll({'load':'4.5'}), 1)
+        self.assertEqual(utm.protection[DOMAIN_IP]['reasons'],
+                         ['FI-B load:4.5'])
+        # Below the threshold but not by the hysteresis
+        for n in range(utm.PROTECT_RECOVER_POLLS):
+            self.assertEqual(self.poll({'load':'3.5'}), 1)
+        for n in range(utm.PROTECT_RECOVER_POLLS - 1):
+            self.assertEqual(self.poll({'load':'3.0'}), 1)
+        with self.assertLogs(utm.logger, 'WARNING'):
+            self.assertEqual(self.poll({'load':'3.0'}), 0)
+        self.assertEqual(utm.protection, {})
+
+    def test_memory(self):
+        with self.assertLogs(utm.logger, 'WARNING'):
+            self.assertEqual(self.poll({'mem_available':'1000'}), 1)
+        self.assertEqual(utm.protection[DOMAIN_IP]['reasons'],
+                         ['FI-B mem_available:1000'])
+        self.assertEqual(self.poll({'mem_available':'1200'}), 1)
+        self.assertEqual(utm.protection[DOMAIN_IP]['recover_count'], 0)
+
+    def test_mode_kept_without_stats(self):
+        utm.stats_dict[DOMAIN_IP] = {'A':{}, 'B':{'load':''}}
+        utm.protection[DOMAIN_IP] = {'since':0, 'reasons':[],
+                                     'recover_count':1}
+        utm.update_protection(DOMAIN_IP)
+        self.assertEqual(utm.protection[DOMAIN_IP]['recover_count'], 1)
+        self.assertNotIn('protected', utm.stats_dict[DOMAIN_IP])
+
+    def test_parsers_and_class_ids(self):
+        self.assertEqual(utm.get_domain_parsers(DOMAIN_IP), utm.sdk_parsers)
+        all_class_ids = utm.get_query_class_ids(DOMAIN_IP)
+        utm.protection[DOMAIN_IP] = {'since':0}
+        parsers = utm.get_domain_parsers(DOMAIN_IP)
+        self.assertEqual(sorted(parser.__name__ for parser, c in parsers),
+                         ['parse_fi_env_stats', 'parse_fi_stats'])
+        parser_class_ids = set()
+        for parser, class_ids in parsers:
+            parser_class_ids.update(class_ids)
+        self.assertEqual(utm.get_query_class_ids(DOMAIN_IP),
+                         [c for c in all_class_ids if c in parser_class_ids])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests of the merge of the PullResult of a domain, returned by the collector
+threads, into the global dictionaries. Requires the modules of
+ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+class MergePullResultTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(utm, 'conn_dict', {DOMAIN_IP:{'cli':'old'}}),
+            mock.patch.object(utm, 'response_time_dict',
+                              {DOMAIN_IP:{'cli_start':0, 'sdk_start':0}}),
+            mock.patch.object(utm, 'raw_sdk_stats', {}),
+            mock.patch.object(utm, 'raw_cli_stats', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_sdk_and_cli(self):
+        sdk_stats = {'TopSystem':[]}
+        utm.merge_pull_result(utm.PullResult(DOMAIN_IP, 'sdk',
+                                {'sdk':'handle', 'sdk_time':10}, sdk_stats,
+                                {'sdk_start':5, 'sdk_end':7}, None))
+        cli_stats = {'A':{'pfc_stats':[]}}
+        utm.merge_pull_result(utm.PullResult(DOMAIN_IP, 'cli',
+                                {'cli':'session'}, cli_stats,
+                                {'cli_start':6}, None))
+        self.assertEqual(utm.conn_dict[DOMAIN_IP],
+                         {'sdk':'handle', 'sdk_time':10, 'cli':'session'})
+        self.assertEqual(utm.response_time_dict[DOMAIN_IP],
+                         {'sdk_start':5, 'sdk_end':7, 'cli_start':6})
+        self.assertIs(utm.raw_sdk_stats[DOMAIN_IP], sdk_stats)
+        self.assertIs(utm.raw_cli_stats[DOMAIN_IP], cli_stats)
+
+    def test_error(self):
+        with self.assertLogs(utm.logger, 'ERROR') as log:
+            utm.merge_pull_result(utm.PullResult(DOMAIN_IP, 'sdk', {}, None,
+                                    {'sdk_start':5}, 'Login failed'))
+        self.assertIn('Exiting sdk for 10.1.1.1 : Login failed',
+                      log.output[0])
+        self.assertEqual(utm.raw_sdk_stats, {})
+        self.assertEqual(utm.conn_dict[DOMAIN_IP], {'cli':'old'})
+        self.assertEqual(utm.response_time_dict[DOMAIN_IP]['sdk_start'], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Tests of --query-chunk: large classes queried per subtree, merged in order,
+and only the failed chunks queried again. Requires the modules of
+ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import re
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+OBJECTS = {
+    'NetworkElement':['sys/switch-A', 'sys/switch-B'],
+    'ComputeBlade':['sys/chassis-1/blade-1', 'sys/chassis-2/blade-1'],
+    'ComputeRackUnit':['sys/rack-unit-1'],
+    'EtherRxStats':['sys/switch-A/slot-1/switch-ether/port-1/rx-stats',
+                    'sys/chassis-1/slot-1/host/port-1/rx-stats',
+                    'sys/chassis-2/slot-1/host/port-1/rx-stats',
+                    'sys/rack-unit-1/adaptor-1/ext-eth-1/rx-stats'],
+    'FabricPathEp':['sys/chassis-2/slot-1/fabric/port-1/path']
+    }
+
+class ChunkHandle(object):
+    '''
+    UcsHandle with the objects of OBJECTS. A query under a subtree of
+    failing raises an exception
+    '''
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.chunk_queries = []
+
+    def get_objects(self, class_id):
+        return [SimpleNamespace(dn=dn) for dn in OBJECTS.get(class_id, [])]
+
+    def query_classids(self, class_ids):
+        return {class_id:self.get_objects(class_id) for class_id in class_ids}
+
+    def query_classid(self, class_id, filter_str):
+        scopes = re.search(r'\^sys/\((.*)\)/', filter_str).group(1).split('|')
+        self.chunk_queries.append((class_id, scopes))
+        if self.failing.intersection(scopes):
+            raise RuntimeError('chunk failed')
+        return [item for item in self.get_objects(class_id) if \
+                    item.dn.split('/')[1] in scopes]
+
+def get_dns(sdk_stats, class_id):
+    return [item.dn for item in sdk_stats[class_id]]
+
+class QueryChunksTest(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            mock.patch.object(utm, 'class_ids', list(OBJECTS)),
+            mock.patch.dict(utm.user_args, {'query_chunk':2})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_chunks_merged_in_order(self):
+        handle = ChunkHandle()
+        sdk_stats, failed_chunks = utm.query_classids_in_chunks(DOMAIN_IP,
+                                                                handle)
+        self.assertEqual(failed_chunks, {})
+        self.assertEqual(get_dns(sdk_stats, 'EtherRxStats'),
+                         OBJECTS['EtherRxStats'])
+        self.assertEqual(get_dns(sdk_stats, 'FabricPathEp'),
+                         OBJECTS['FabricPathEp'])
+        scopes = [['switch-A', 'switch-B'], ['chassis-1', 'chassis-2'],
+                  ['rack-unit-1']]
+        self.assertEqual(handle.chunk_queries,
+                         [('EtherRxStats', s) for s in scopes] + \
+                         [('FabricPathEp', s) for s in scopes])
+
+    def test_only_failed_chunks_queried_again(self):
+        handle = ChunkHandle(failing=['chassis-1'])
+        with mock.patch.object(utm, 'CHUNK_QUERY_RETRIES', 0):
+            sdk_stats, failed_chunks = utm.query_classids_in_chunks( \
+                                                        DOMAIN_IP, handle)
+        self.assertNotIn('EtherRxStats', sdk_stats)
+        self.assertEqual(failed_chunks['EtherRxStats']['scopes'],
+                         [['chassis-1', 'chassis-2']])
+        self.assertEqual(len(handle.chunk_queries), 6)
+
+        handle.failing.clear()
+        utm.query_failed_chunks(DOMAIN_IP, handle, sdk_stats, failed_chunks)
+        self.assertEqual(failed_chunks, {})
+        self.assertEqual(handle.chunk_queries[6:],
+                         [('EtherRxStats', ['chassis-1', 'chassis-2']),
+                          ('FabricPathEp', ['chassis-1', 'chassis-2'])])
+        self.assertEqual(sorted(get_dns(sdk_stats, 'EtherRxStats')),
+                         sorted(OBJECTS['EtherRxStats']))
+
+    def test_chunk_retried(self):
+        handle = ChunkHandle(failing=['rack-unit-1'])
+        sdk_stats, failed_chunks = utm.query_classids_in_chunks(DOMAIN_IP,
+                                                                handle)
+        self.assertEqual(handle.chunk_queries.count(('EtherRxStats',
+                            ['rack-unit-1'])), utm.CHUNK_QUERY_RETRIES + 1)
+        self.assertEqual(failed_chunks['EtherRxStats']['scopes'],
+                         [['rack-unit-1']])
+        self.assertEqual(get_dns(failed_chunks['EtherRxStats'], 'objects'),
+                         OBJECTS['EtherRxStats'][:3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Tests of the record maps compiled into handlers, which fill stats_dict and
+the counter store from SDK objects. Requires the modules of
+ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+FI_PORT_DN = 'sys/switch-A/slot-1/switch-ether/port-1'
+BP_PORT_DN = 'sys/chassis-1/slot-1/host/port-3'
+
+def get_mo_lists(map_name, **mo_lists):
+    '''
+    Return objects for all the class IDs of a record map, empty if not given
+    '''
+    lists = {entry['class_id']:[] for entry in utm.record_maps[map_name]}
+    lists.update(mo_lists)
+    return lists
+
+class RecordMapTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not utm.compiled_record_maps:
+            utm.compile_record_maps()
+
+    def setUp(self):
+        patches = [mock.patch.object(utm, 'stats_dict', {}),
+                   mock.patch.object(utm, 'counter_stores', {}),
+                   mock.patch.object(utm, 'response_time_dict', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        utm.reset_domain_stats(DOMAIN_IP, 'lab')
+        self.traces = []
+
+    def trace(self, tag, text):
+        self.traces.append((tag, text))
+
+    def test_all_maps_compiled(self):
+        self.assertEqual(set(utm.compiled_record_maps),
+                         set(utm.record_maps))
+        for map_name, record_map in utm.record_maps.items():
+            self.assertEqual([c for c, h in \
+                                utm.compiled_record_maps[map_name]],
+                             [entry['class_id'] for entry in record_map])
+        handler = utm.compiled_record_maps['fi_stats'][0][1]
+        self.assertEqual(handler.__name__, 'handle_FcPIo_fcpio')
+
+    def test_fi_port(self):
+        ports = [SimpleNamespace(dn=FI_PORT_DN, if_role='network',
+                                 oper_state='up', admin_state='enabled',
+                                 name='to-core', oper_speed='10gbps'),
+                 SimpleNamespace(dn=BP_PORT_DN, if_role='server',
+                                 oper_state='up', admin_state='enabled',
+                                 name='', oper_speed='10gbps')]
+        rx_stats = [SimpleNamespace(dn=FI_PORT_DN + '/rx-stats',
+                                    total_bytes_delta='1000.0'),
+                    SimpleNamespace(dn=BP_PORT_DN + '/rx-stats',
+                                    total_bytes_delta='5')]
+        utm.apply_record_map(DOMAIN_IP, 'fi_stats', get_mo_lists('fi_stats', \
+                             EtherPIo=ports, EtherRxStats=rx_stats),
+                             self.trace)
+        fi_ports = utm.stats_dict[DOMAIN_IP]['A']['fi_ports']
+        self.assertEqual(fi_ports, {'1/01':{'channel':'No', 'transport':'Eth',
+                                            'if_role':'network',
+                                            'oper_state':'up',
+                                            'admin_state':'enabled',
+                                            'name':'to-core',
+                                            'oper_speed':10,
+                                            'counter_row':0}})
+        store = utm.counter_stores[DOMAIN_IP]
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get(0, 'bytes_rx_delta'), 1000)
+        self.assertEqual(store.groups, ['FI-A'])
+        self.assertEqual(store.kinds, ['fi_port'])
+        # Objects filtered by dn_has are not traced
+        self.assertEqual(self.traces, [('ethpio', FI_PORT_DN),
+                                       ('ethrx', FI_PORT_DN + '/rx-stats')])
+
+    def test_backplane_port(self):
+        fio = [SimpleNamespace(dn=BP_PORT_DN, switch_id='B',
+                               admin_state='enabled', oper_state='up',
+                               admin_speed='40gbps',
+                               peer_dn='sys/chassis-1/blade-2/adaptor-1/' \
+                                       'ext-eth-5')]
+        rx_stats = [SimpleNamespace(dn=BP_PORT_DN + '/rx-stats',
+                                    total_bytes_delta='12'),
+                    SimpleNamespace(dn=FI_PORT_DN + '/rx-stats',
+                                    total_bytes_delta='1000'),
+                    SimpleNamespace(dn='sys/chassis-1/slot-1/host/port-4/' \
+                                       'rx-stats', total_bytes_delta='7')]
+        utm.apply_record_map(DOMAIN_IP, 'backplane_ports', get_mo_lists( \
+                             'backplane_ports', EtherServerIntFIo=fio, \
+                             EtherRxStats=rx_stats), None)
+        bp_ports = utm.stats_dict[DOMAIN_IP]['chassis']['chassis-1'] \
+                        ['bp_ports']
+        self.assertEqual(bp_ports, {'1':{'03':{'channel':'No', 'fi_id':'B',
+                                               'admin_state':'enabled',
+                                               'oper_state':'up',
+                                               'admin_speed':40,
+                                               'peer':'blade-2',
+                                               'peer_type':'blade',
+                                               'peer_port':'1/05',
+                                               'counter_row':0}}})
+        store = utm.counter_stores[DOMAIN_IP]
+        # Stats of a port without EtherServerIntFIo are not stored
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.get(0, 'bytes_rx_delta'), 12)
+        self.assertEqual(store.groups, ['chassis-1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests of the release of the raw stats of a domain once parsed and of the
+peak RSS per phase. Requires the modules of ucs_traffic_monitor, else
+skipped.
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+class ParseDomainStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.parsed = []
+        patches = [
+            mock.patch.dict(utm.user_args, {'tick_aligned':False,
+                                            'iom_cli':False,
+                                            'protect_load':None,
+                                            'adaptive_interval':None}),
+            mock.patch.object(utm, 'raw_sdk_stats',
+                              {DOMAIN_IP:{'TopSystem':[]},
+                               '10.1.1.2':{'TopSystem':[]}}),
+            mock.patch.object(utm, 'raw_cli_stats', {DOMAIN_IP:{'A':{}}}),
+            mock.patch.object(utm, 'counter_stores',
+                              {DOMAIN_IP:utm.CounterStore()}),
+            mock.patch.object(utm, 'parse_raw_sdk_stats',
+                              side_effect=self.parse),
+            mock.patch.object(utm, 'parse_raw_cli_stats',
+                              side_effect=self.parse)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def parse(self, domain_ip, obj):
+        self.parsed.append((obj, domain_ip in utm.raw_sdk_stats,
+                            domain_ip in utm.raw_cli_stats))
+
+    def test_released_before_parse(self):
+        utm.parse_domain_stats(DOMAIN_IP)
+        self.assertEqual(self.parsed, [({'TopSystem':[]}, False, True),
+                                       ({'A':{}}, False, False)])
+        # Raw stats of other domains are kept
+        self.assertEqual(list(utm.raw_sdk_stats), ['10.1.1.2'])
+        self.assertEqual(utm.raw_cli_stats, {})
+
+class PeakRssTest(unittest.TestCase):
+    def test_track_per_phase(self):
+        with mock.patch.object(utm, 'peak_rss_dict', {}), \
+                mock.patch.object(utm, 'get_peak_rss', side_effect=[100, 80]), \
+                mock.patch.object(utm, 'reset_peak_rss',
+                                  side_effect=[True, False]):
+            utm.track_peak_rss('input')
+            with self.assertLogs(utm.logger, 'DEBUG'):
+                utm.track_peak_rss('pull')
+            self.assertEqual(utm.peak_rss_dict, {'input':100, 'pull':80})
+
+    def test_peak_rss(self):
+        peak_rss = utm.get_peak_rss()
+        if peak_rss is None:
+            self.skipTest('Peak RSS not available')
+        self.assertGreater(peak_rss, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""
+Tests of the topology cache: stitched again only when the hash of its
+objects changes, and saved only on change. Requires the modules of
+ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+DOMAIN_IP = '10.1.1.1'
+
+def get_items(switch_id='A'):
+    '''
+    Return DcxVc objects of 3 vNICs, pinned to uplink ports 1/01 to 1/03
+    '''
+    return [SimpleNamespace(dn='sys/chassis-1/blade-1/adaptor-1/host-eth-1' \
+                            '/vc-' + n, vnic='eth' + n, switch_id=switch_id,
+                            transport='ether', id=n, fcoe_id='0',
+                            oper_border_port_id=n, oper_border_slot_id='1') \
+                for n in ['1', '2', '3']]
+
+class TopologyCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.prefix = os.path.join(tmp_dir.name, 'utm')
+        self.stitched = []
+        class_id, attrs, stitch = utm.topology_types['pinned_uplinks']
+        patches = [
+            mock.patch.object(utm, 'FILENAME_PREFIX', self.prefix),
+            mock.patch.object(utm, 'INPUT_FILE_PREFIX', 'domains'),
+            mock.patch.object(utm, 'topology_cache', {}),
+            mock.patch.object(utm, 'topology_cache_changed', False),
+            mock.patch.object(utm, 'domain_dict', {DOMAIN_IP:[]}),
+            mock.patch.dict(utm.topology_types, {'pinned_uplinks':[class_id, \
+                            attrs, self.counting_stitch(stitch)]})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def counting_stitch(self, stitch):
+        def counted(items):
+            self.stitched.append(len(items))
+            return stitch(items)
+        return counted
+
+    def test_stitched_once_per_hash(self):
+        topology = utm.get_topology(DOMAIN_IP, 'pinned_uplinks', get_items())
+        self.assertEqual(len(topology), 3)
+        self.assertTrue(utm.topology_cache_changed)
+        utm.topology_cache_changed = False
+        self.assertEqual(utm.get_topology(DOMAIN_IP, 'pinned_uplinks',
+                                          get_items()), topology)
+        self.assertEqual(self.stitched, [3])
+        self.assertFalse(utm.topology_cache_changed)
+
+        changed = utm.get_topology(DOMAIN_IP, 'pinned_uplinks',
+                                   get_items('B'))
+        self.assertEqual(self.stitched, [3, 3])
+        self.assertNotEqual(changed, topology)
+        self.assertTrue(utm.topology_cache_changed)
+
+    def test_hash(self):
+        attrs = utm.topology_types['pinned_uplinks'][1]
+        items = get_items()
+        self.assertEqual(utm.get_topology_hash(items, attrs),
+                         utm.get_topology_hash(get_items(), attrs))
+        items[2].oper_border_port_id = '7'
+        self.assertNotEqual(utm.get_topology_hash(items, attrs),
+                            utm.get_topology_hash(get_items(), attrs))
+        # An attribute which is not a string
+        items[2].oper_border_port_id = 3
+        self.assertEqual(utm.get_topology_hash(items, attrs),
+                         utm.get_topology_hash(get_items(), attrs))
+        # Attributes joined with a separator, not just concatenated
+        first = [SimpleNamespace(dn='ab', locale='c')]
+        second = [SimpleNamespace(dn='a', locale='bc')]
+        self.assertNotEqual(utm.get_topology_hash(first, ('dn', 'locale')),
+                            utm.get_topology_hash(second, ('dn', 'locale')))
+
+    def test_saved_only_on_change(self):
+        cache_file_name = self.prefix + '_domains.topology'
+        utm.save_topology_cache()
+        self.assertFalse(os.path.exists(cache_file_name))
+
+        topology = utm.get_topology(DOMAIN_IP, 'pinned_uplinks', get_items())
+        utm.topology_cache['10.9.9.9'] = {}
+        utm.save_topology_cache()
+        mtime = os.path.getmtime(cache_file_name)
+        os.utime(cache_file_name, (mtime - 10, mtime - 10))
+        utm.save_topology_cache()
+        self.assertEqual(os.path.getmtime(cache_file_name), mtime - 10)
+
+        utm.read_topology_cache()
+        self.assertEqual(list(utm.topology_cache), [DOMAIN_IP])
+        self.assertEqual(utm.get_topology(DOMAIN_IP, 'pinned_uplinks',
+                                          get_items()), topology)
+        self.assertEqual(self.stitched, [3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+Tests of row tracing in parser loops, enabled by the trace file. Requires
+the modules of ucs_traffic_monitor, else skipped.
+"""
+
+import os
+import sys
+import json
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath( \
+                                                            __file__))))
+
+try:
+    import ucs_traffic_monitor as utm
+except ImportError as e:
+    raise unittest.SkipTest('Missing module : {}'.format(e))
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        level = utm.logger.level
+        self.addCleanup(utm.logger.setLevel, level)
+        utm.logger.setLevel(logging.WARNING)
+
+    def get_traces(self, trace_config, domain_ip, rows):
+        '''
+        Trace rows (list of (tag, text)) of a domain. Return the logged
+        messages
+        '''
+        with mock.patch.object(utm, 'trace_config', trace_config):
+            trace = utm.get_tracer(domain_ip)
+        self.assertIsNotNone(trace)
+        with self.assertLogs(utm.logger, logging.DEBUG) as log:
+            # assertLogs needs at least one message
+            utm.logger.warning('start')
+            for tag, text in rows:
+                trace(tag, text)
+        return [line.split(':', 2)[2] for line in log.output[1:]]
+
+    def test_disabled(self):
+        self.assertIsNone(utm.get_tracer('10.1.1.1'))
+        with mock.patch.object(utm, 'trace_config',
+                               {'domains':{'10.1.1.2':{}}}):
+            self.assertIsNone(utm.get_tracer('10.1.1.1'))
+
+    def test_listed_domain_at_warning(self):
+        rows = [('ethrx', 'port-1'), ('dcxvc', 'vc-1'), ('ethrx', 'port-2')]
+        traces = self.get_traces({'domains':{'10.1.1.1':{}}}, '10.1.1.1',
+                                 rows)
+        self.assertEqual(traces, ['In ethrx for 10.1.1.1:port-1',
+                                  'In dcxvc for 10.1.1.1:vc-1',
+                                  'In ethrx for 10.1.1.1:port-2'])
+
+    def test_classes_and_sample(self):
+        rows = [('ethrx', 'port-' + (str)(i)) for i in range(1, 8)] + \
+               [('dcxvc', 'vc-1')]
+        traces = self.get_traces({'sample':10, 'domains':{'10.1.1.1':{
+                                    'classes':['ethrx'], 'sample':3}}},
+                                 '10.1.1.1', rows)
+        self.assertEqual(traces, ['In ethrx for 10.1.1.1:port-1',
+                                  'In ethrx for 10.1.1.1:port-4',
+                                  'In ethrx for 10.1.1.1:port-7'])
+
+    def test_all_domains_at_debug(self):
+        utm.logger.setLevel(logging.DEBUG)
+        with mock.patch.object(utm, 'trace_config', {'sample':2}):
+            trace = utm.get_tracer('10.1.1.3')
+        with self.assertLogs(utm.logger, logging.DEBUG) as log:
+            for n in range(3):
+                trace('ethrx', (str)(n))
+        self.assertEqual([r.levelno for r in log.records], [logging.DEBUG] * 2)
+
+class ReadTraceConfigTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        prefix = os.path.join(tmp_dir.name, 'utm')
+        self.trace_file_name = prefix + '_domains.trace'
+        patches = [mock.patch.object(utm, 'FILENAME_PREFIX', prefix),
+                   mock.patch.object(utm, 'INPUT_FILE_PREFIX', 'domains'),
+                   mock.patch.object(utm, 'trace_config', {})]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def write_trace_file(self, text):
+        with open(self.trace_file_name, 'w') as trace_file:
+            trace_file.write(text)
+
+    def test_read_every_cycle(self):
+        utm.read_trace_config()
+        self.assertEqual(utm.trace_config, {})
+        config = {'domains':{'10.1.1.1':{'sample':5}}}
+        self.write_trace_file(json.dumps(config))
+        utm.read_trace_config()
+        self.assertEqual(utm.trace_config, config)
+        os.remove(self.trace_file_name)
+        with self.assertLogs(utm.logger, logging.WARNING):
+            utm.read_trace_config()
+        self.assertEqual(utm.trace_config, {})
+
+    def test_bad_file_disables(self):
+        self.write_trace_file('{"domains":')
+        with self.assertLogs(utm.logger, logging.ERROR):
+            utm.read_trace_config()
+        self.assertEqual(utm.trace_config, {})
+
+if __name__ == '__main__':
+    unittest.main()
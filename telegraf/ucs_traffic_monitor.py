@@ -10,13 +10,45 @@ import logging
 from logging.handlers import RotatingFileHandler
 import pickle
 import json
+import gzip
+import glob
 import time
 import random
+import threading
+import socket
+import signal
+import ssl
+import http.client
+import urllib.error
+from urllib.parse import urlsplit
 import re
-from collections import Counter
+import hashlib
+import operator
+from array import array
+from collections import Counter, namedtuple
 import concurrent.futures
+import asyncio
+import ucsmsdk
 from ucsmsdk.ucshandle import UcsHandle
+from ucsmsdk.ucsdriver import UcsDriver
 from netmiko import ConnectHandler
+# asyncssh is optional. With --async-ssh, SSH sessions of all the domains are
+# run on one event loop instead of a netmiko session per thread
+try:
+    import asyncssh
+except ImportError:
+    asyncssh = None
+# numpy is optional. When available, derived metrics on the counter store are
+# computed as vectorized array operations
+try:
+    import numpy
+except ImportError:
+    numpy = None
+# resource is used only for peak memory when /proc is not available
+try:
+    import resource
+except ImportError:
+    resource = None
 
 HOURS_IN_DAY = 24
 MINUTES_IN_HOUR = 60
@@ -26,6 +58,71 @@ SECONDS_IN_MINUTE = 60
 CONNECTION_REFRESH_INTERVAL = 5400
 CONNECTION_TIMEOUT = 10
 MASTER_TIMEOUT = 48
+# Classes with the largest responses. With --query-chunk, these are queried
+# per chassis, rack-unit, FEX and FI subtree instead of in one query
+CHUNKED_CLASS_IDS = ['AdaptorVnicStats', 'EtherRxStats', 'FabricPathEp']
+# Number of retries of a failed chunk query
+CHUNK_QUERY_RETRIES = 1
+# Number of queries for class IDs missing in the response, if time is left
+# within --connection-timeout
+MISSING_CLASS_ID_RETRIES = 2
+# New logins (SDK and SSH) across all the domains can burst up to
+# LOGIN_BURST. After that, they are limited to --login-rate per second
+LOGIN_BURST = 20
+# Resolved addresses of UCS domains are used for this many seconds
+DNS_CACHE_TTL = 300
+# Max names resolved in parallel
+DNS_WORKERS = 16
+# With --daemon, resolve names and login (if needed) these many seconds
+# before the start of a cycle
+WARMUP_LEAD = 5
+# With --keep-alive, max idle HTTPS connections kept per UCS domain
+TRANSPORT_POOL_SIZE = 8
+# With --adaptive-interval, the interval of a domain is stretched when its
+# stats pull takes more than ADAPTIVE_PULL_SHARE of the interval, when the
+# load of an FI is above FI_LOAD_HIGH or when available memory (MB) of an FI
+# is below FI_MEM_LOW. Up to ADAPTIVE_MAX_FACTOR times the base interval
+ADAPTIVE_PULL_SHARE = 0.5
+FI_LOAD_HIGH = 4.0
+FI_MEM_LOW = 1024
+ADAPTIVE_MAX_FACTOR = 8
+# Stats collection policies of UCSM are queried again after these many seconds
+COLLECTION_POLICY_REFRESH = 3600
+# With --tick-aligned, SDK query of a domain is sent TICK_MARGIN seconds
+# after the stats collection tick of UCSM. Wait up to TICK_MAX_WAIT seconds
+# for the next tick
+TICK_MARGIN = 3
+TICK_MAX_WAIT = 15
+# A class ID which fails (query error or parser failure) or a CLI command
+# whose output can not be parsed CAPABILITY_PROBES times in a row is not
+# pulled from the domain anymore, until the model or firmware of the FIs
+# changes. Probed again after CAPABILITY_REPROBE_INTERVAL seconds. A class
+# ID which returns nothing is always queried, since many class IDs are empty
+# only due to the config of the domain (no rack servers, no SAN port
+# channels, etc.)
+CAPABILITY_PROBES = 3
+CAPABILITY_REPROBE_INTERVAL = 86400
+# Always queried. Model and firmware of a domain are found from these
+CAPABILITY_REQUIRED_CLASS_IDS = ['TopSystem', 'NetworkElement',
+                                 'FirmwareRunning']
+# With --protect-load, only these measurements are pulled from a domain while
+# load or available memory of its FI is beyond the thresholds. No CLI (SSH).
+# Protection ends after PROTECT_RECOVER_POLLS polls within the thresholds
+# by PROTECT_HYSTERESIS
+PROTECT_MEASUREMENTS = ['FIEnvStats', 'FIServerPortStats',
+                        'FIUplinkPortStats']
+PROTECT_RECOVER_POLLS = 3
+PROTECT_HYSTERESIS = 0.8
+# With --async-ssh, the last line of the output is a prompt when it matches
+# this. The prompt is then learnt as it is for every mode (UCSM and NX-OS)
+CLI_PROMPT_RE = re.compile(r'^[^\s#>]+[#>] ?$')
+# Max size of a read from an SSH channel
+CLI_READ_SIZE = 65536
+# Without --async-ssh, the netmiko channel is polled for more output every
+# these many seconds
+CLI_POLL_INTERVAL = 0.02
+# InfluxDB Line Protocol is written to stdout in batches of these many lines
+LP_WRITE_LINES = 1000
 
 user_args = {}
 FILENAME_PREFIX = __file__.replace('.py', '')
@@ -36,7 +133,16 @@ LOGFILE_SIZE = 20000000
 LOGFILE_NUMBER = 10
 logger = logging.getLogger('UTM')
 
-# Dictionary with key as IP and value as list of user and passwd
+# When a parser fails, the raw objects of the domain are saved in a compressed
+# diagnostics file next to the log file, instead of in the log file.
+# Set in setup_logging()
+diag_file_prefix = ''
+# Max size of text (before compression) written in one diagnostics file
+DIAG_FILE_SIZE = 10000000
+# Number of diagnostics files to keep. Oldest are deleted
+DIAG_FILE_NUMBER = 10
+
+# Dictionary with key as IP and value as list of user, passwd and location
 domain_dict = {}
 # Dictionary with key as IP and value as a dictionary of type and handle.
 # handle is netmiko.ConnectHandler when type is 'cli'
@@ -60,6 +166,138 @@ response_time_dict = {}
 # previous execution
 pickled_connections = {}
 
+# Polling interval of UCS domains with --adaptive-interval. Saved in the
+# schedule file
+# domain_schedule : {
+#                       'domain_ip' : {
+#                               'interval':seconds,
+#                               'next':'time of next poll',
+#                               'collection_interval':seconds,
+#                               'collection_time':'time of policy query'
+#                               }
+#                       }
+domain_schedule = {}
+
+# Hot ports of UCS domains with --hot-lane. Selected in every full cycle
+# using the inventory of the cycle
+# hot_ports : {
+#               'domain_ip' : {
+#                       'location':'',
+#                       'ports':[{'dn':'', 'fi_id':'', 'pfc_name':''}]
+#                       }
+#               }
+hot_ports = {}
+# time_collected of the last rx/tx bytes of hot ports in the lane. Bytes
+# are written only for a new UCSM sample
+# hot_port_collected : {
+#                       'domain_ip' : {'dn of rx-stats or tx-stats':''}
+#                       }
+hot_port_collected = {}
+# Read from the hotports file in every full cycle. Example (JSON):
+# {"domains": {"10.1.1.1": ["sys/switch-A/slot-1/switch-ether/port-49"]}}
+hot_port_config = {}
+
+# Chassis and FEX with backplane ports per FI, for --iom-cli. Found in every
+# full cycle for the next one. Saved in the iom file
+# iom_targets : {
+#               'domain_ip' : {
+#                       'fi_id':[['chassis or FEX ID', 'last port']]
+#                       }
+#               }
+iom_targets = {}
+
+# Stats collection tick of UCS domains with --tick-aligned, learnt from
+# time_collected of port stats. Saved in the ticks file
+# collection_ticks : {
+#                   'domain_ip' : {
+#                           'last':'time_collected of the last sample (UCSM)',
+#                           'offset':'local time minus UCSM time',
+#                           'interval':seconds
+#                           }
+#                   }
+collection_ticks = {}
+# Domains whose SDK sample of this cycle is same as the last one. Their
+# *_delta counters are not written
+unchanged_samples = set()
+
+# Capability profile of UCS domains. Saved in the capabilities file
+# capabilities : {
+#                   'domain_ip' : {
+#                       'profile':'FI model, UCSM and FI firmware versions',
+#                       'probe_time':'time of first poll with the profile',
+#                       'failed_class_ids':{'class_id':count},
+#                       'failed_cli':{'stats_type':count}
+#                       }
+#               }
+capabilities = {}
+
+# Domains in protection mode. Saved in the protection file
+# protection : {
+#                   'domain_ip' : {
+#                       'since':'time of start of protection',
+#                       'reasons':['FI-A load:5.2'],
+#                       'recover_count':'polls within the thresholds'
+#                       }
+#               }
+protection = {}
+
+# LoginLimiter for all the new logins. Set in parse_cmdline_arguments()
+login_limiter = None
+
+# AsyncSshEngine for the CLI of all the domains with --async-ssh. Set in main()
+ssh_engine = None
+
+# Resolved address of UCS domains with key as the name in the input file.
+# Saved in the dns file
+# dns_cache : {
+#               'domain_ip' : {
+#                       'address':'',
+#                       'expiry':'time'
+#                       }
+#               }
+dns_cache = {}
+
+# TransportPool per UCS domain with key as the name in the input file.
+# Used by PooledUcsDriver with --keep-alive
+transport_pools = {}
+transport_pools_lock = threading.Lock()
+# Set when the installed ucsmsdk does not keep the driver where
+# PooledUcsDriver is plugged in. --keep-alive is then not used
+pooled_transport_unsupported = False
+
+# Row-level tracing of parser loops. Loaded from the trace file
+trace_config = {}
+
+# Measurements (InfluxDB) and the parser functions required for each. Only
+# the class IDs of the required parsers are queried. FIEnvStats carries
+# mode and name of the domain, used by all the others
+MEASUREMENT_PARSERS = {
+    'FIEnvStats':['parse_fi_env_stats'],
+    'FIServerPortStats':['parse_fi_env_stats', 'parse_fi_stats'],
+    'FIUplinkPortStats':['parse_fi_env_stats', 'parse_fi_stats'],
+    'Servers':['parse_fi_env_stats', 'parse_compute_inventory'],
+    'BackplanePortStats':['parse_fi_env_stats', 'parse_compute_inventory',
+                          'parse_backplane_port_stats'],
+    'VnicStats':['parse_fi_env_stats', 'parse_compute_inventory',
+                 'parse_vnic_stats']
+    }
+# Measurements with PFC counters from the CLI (SSH)
+CLI_MEASUREMENTS = ['FIServerPortStats', 'FIUplinkPortStats',
+                    'BackplanePortStats']
+
+# Loaded from the measurements file. Example (JSON):
+# {
+#   "disable": ["VnicStats"],
+#   "exclude_fields": {"FIEnvStats": ["utm_collector_ver"]}
+# }
+measurement_config = {}
+# Measurements to print. Set by plan_queries()
+enabled_measurements = list(MEASUREMENT_PARSERS)
+
+# Peak RSS (resident set size) in KB with key as phase of execution (input,
+# pull, parse, output). Printed before end
+peak_rss_dict = {}
+
 # Stats for all FI, chassis, blades, etc. are collected here before printing
 # in the desired output format
 stats_dict = {}
@@ -69,6 +307,57 @@ stats_dict = {}
 raw_cli_stats = {}
 raw_sdk_stats = {}
 
+# Returned by connect_and_pull_stats for a domain and handle type (cli or sdk)
+# handles : dictionary to update conn_dict
+# raw_stats : CLI outputs or SDK objects, None if not pulled
+# times : dictionary to update response_time_dict
+# error : None or reason of failure
+PullResult = namedtuple('PullResult', ['domain_ip', 'handle_type', 'handles',
+                                       'raw_stats', 'times', 'error'])
+
+# Counters (bytes, pause, errors, discards, etc.) are not stored in stats_dict.
+# Dictionary with key as IP and value as CounterStore for the domain. A record
+# in stats_dict (FI port, backplane port, vif) with counters carries the row
+# number in the CounterStore as counter_row
+counter_stores = {}
+
+# Stitched topology (backplane port to FI server port, vif to pinned uplink
+# and bound veth/vfc) with key as IP. Saved in the topology file for the next
+# execution and stitched again only when the topology objects change
+# topology_cache : {
+#                   'domain_ip' : {
+#                           'fi_server_ports':{'hash':'', 'topology':[]},
+#                           'pinned_uplinks':{'hash':'', 'topology':[]}
+#                           }
+#                   }
+topology_cache = {}
+# The topology file is written only when a topology is stitched again
+topology_cache_changed = False
+
+# Counter metrics stored in CounterStore. One column per metric
+COUNTER_METRICS = ('bytes_rx_delta',
+                   'bytes_tx_delta',
+                   'pause_rx',
+                   'pause_tx',
+                   'errors_rx_delta',
+                   'errors_tx_delta',
+                   'dropped_rx_delta',
+                   'dropped_tx_delta',
+                   'crc_rx_delta',
+                   'discard_rx_delta',
+                   'discard_tx_delta',
+                   'link_failures_delta',
+                   'sync_losses_delta',
+                   'signal_losses_delta',
+                   'out_discard_delta',
+                   'fcs_delta',
+                   'giants_delta',
+                   'hif_xmit_err',
+                   'hif_rcv_err',
+                   'hif_out_discards',
+                   'queue_discard_rx'
+                  )
+
 # List of class IDs to be pulled from UCS
 class_ids = ['TopSystem',
              'NetworkElement',
@@ -159,6 +448,84 @@ def parse_cmdline_arguments():
                     sessions (dss). By default, UCS sessions (SDK only, not \
                     SSH) are saved (using Python pickle) for re-use when this \
                     program is executed every few seconds.')
+    parser.add_argument('-qc', '--query-chunk', type=int, dest='query_chunk',
+                    default=0, help='query AdaptorVnicStats, EtherRxStats \
+                    and FabricPathEp for up to this many chassis, rack-unit, \
+                    FEX or FI subtrees in one request. For very large \
+                    domains (Default:0, one request for all)')
+    parser.add_argument('-ka', '--keep-alive', dest='keep_alive', \
+                    action='store_true', default=False, help='keep HTTPS \
+                    connections to UCS domains open and resume TLS sessions, \
+                    instead of new TCP and TLS handshakes for SDK logins \
+                    and queries')
+    parser.add_argument('-as', '--async-ssh', dest='async_ssh', \
+                    action='store_true', default=False, help='run SSH \
+                    sessions of all the UCS domains on one event loop using \
+                    asyncssh, instead of a netmiko session per thread. CLI \
+                    commands are sent back to back')
+    parser.add_argument('-kh', '--known-hosts', dest='known_hosts',
+                    default=None, help='with --async-ssh, verify the host \
+                    keys of UCS domains against this known_hosts file \
+                    (Default: host keys are not verified, same as netmiko \
+                    sessions)')
+    parser.add_argument('-ic', '--iom-cli', type=int, dest='iom_cli',
+                    default=0, help='with --async-ssh, pull error and \
+                    discard counters of IOM/FEX host ports per chassis and \
+                    FEX, spending up to this many seconds per UCS domain \
+                    (Default:0, disabled)')
+    parser.add_argument('-ich', '--iom-channels', type=int,
+                    dest='iom_channels', default=2, help='max SSH channels \
+                    per UCS domain for --iom-cli (Default:2)')
+    parser.add_argument('-lr', '--login-rate', type=float, dest='login_rate',
+                    default=10, help='max new logins (SDK and SSH) per \
+                    second across all the UCS domains. Others wait. 0 for \
+                    no limit (Default:10)')
+    parser.add_argument('-ms', '--max-sessions', type=int,
+                    dest='max_sessions', default=3, help='max concurrent \
+                    sessions (SDK and SSH) opened by this program per UCS \
+                    domain (Default:3)')
+    parser.add_argument('-dm', '--daemon', type=int, dest='daemon_interval',
+                    default=0, help='keep running and pull stats every this \
+                    many seconds, like with execd input plugin of telegraf. \
+                    Sessions, including SSH, are re-used across cycles \
+                    (Default:0, pull once and exit)')
+    parser.add_argument('-ai', '--adaptive-interval', type=int,
+                    dest='adaptive_interval', default=0, help='base polling \
+                    interval in seconds. The interval of a UCS domain is \
+                    stretched as per its response time, load and memory of \
+                    FIs and stats collection interval of UCSM. A domain is \
+                    skipped until its interval is over. Use the interval of \
+                    telegraf or --daemon (Default:0, poll all the domains \
+                    every time)')
+    parser.add_argument('-ta', '--tick-aligned', dest='tick_aligned', \
+                    action='store_true', default=False, help='learn the \
+                    stats collection tick of a UCS domain and send its SDK \
+                    query just after the next tick. A sample already \
+                    pulled in the previous execution is not printed again')
+    parser.add_argument('-hl', '--hot-lane', type=int, dest='hot_lane',
+                    default=0, help='with --daemon, pull only rx/tx bytes \
+                    and PFC counters of hot ports every this many seconds \
+                    (5-10) between full cycles. Hot ports are the ones in \
+                    the hotports file and the busiest --hot-ports of a UCS \
+                    domain (Default:0, disabled)')
+    parser.add_argument('-hn', '--hot-ports', type=int, dest='hot_port_count',
+                    default=4, help='number of busiest FI and backplane \
+                    ports per UCS domain selected for --hot-lane (Default:4)')
+    parser.add_argument('-pt', '--protect-load', type=float,
+                    dest='protect_load', default=0, help='protection mode. \
+                    When load of an FI is above this or its available \
+                    memory is below --protect-mem, pull only FI and FI port \
+                    stats from the UCS domain, without CLI (SSH), until it \
+                    recovers. Use with --adaptive-interval to also poll it \
+                    less often (Default:0, disabled)')
+    parser.add_argument('-pm', '--protect-mem', type=int, dest='protect_mem',
+                    default=FI_MEM_LOW, help='available memory (MB) of an FI \
+                    below which --protect-load starts protection mode \
+                    (Default:' + (str)(FI_MEM_LOW) + ')')
+    parser.add_argument('-pl', '--pipelined', dest='pipelined', \
+                    action='store_true', default=False, help='parse and \
+                    print the stats of a UCS domain as soon as its stats \
+                    pull completes, instead of after all the domains')
     parser.add_argument('-v', '--verbose', dest='verbose', \
                     action='store_true', default=False, help='warn and above')
     parser.add_argument('-vv', '--more_verbose', dest='more_verbose', \
@@ -173,6 +540,26 @@ def parse_cmdline_arguments():
     user_args['conn_timeout'] = args.conn_timeout
     user_args['no_ssh'] = args.no_ssh
     user_args['dont_save_sessions'] = args.dont_save_sessions
+    user_args['pipelined'] = args.pipelined
+    user_args['keep_alive'] = args.keep_alive
+    user_args['async_ssh'] = args.async_ssh
+    user_args['known_hosts'] = args.known_hosts
+    user_args['iom_cli'] = args.iom_cli
+    user_args['iom_channels'] = args.iom_channels
+    user_args['login_rate'] = args.login_rate
+    user_args['daemon_interval'] = args.daemon_interval
+    user_args['adaptive_interval'] = args.adaptive_interval
+    user_args['hot_lane'] = args.hot_lane
+    user_args['tick_aligned'] = args.tick_aligned
+    user_args['hot_port_count'] = args.hot_port_count
+    user_args['protect_load'] = args.protect_load
+    user_args['protect_mem'] = args.protect_mem
+    user_args['max_sessions'] = args.max_sessions
+
+    global login_limiter
+    login_limiter = LoginLimiter(args.login_rate, LOGIN_BURST,
+                                 args.max_sessions)
+    user_args['query_chunk'] = args.query_chunk
     user_args['output_format'] = args.output_format
     user_args['verbose'] = args.verbose
     user_args['more_verbose'] = args.more_verbose
@@ -194,6 +581,8 @@ def setup_logging():
         # Log in local directory if can't be created in LOGFILE_LOCATION
         logfile_prefix = FILENAME_PREFIX
     finally:
+        global diag_file_prefix
+        diag_file_prefix = logfile_prefix + '_' + INPUT_FILE_PREFIX + '_diag'
         logfile_name = logfile_prefix + '_' + INPUT_FILE_PREFIX + '.log'
         rotator = RotatingFileHandler(logfile_name, maxBytes=LOGFILE_SIZE,
                                       backupCount=LOGFILE_NUMBER)
@@ -208,6 +597,197 @@ def setup_logging():
         if user_args.get('most_verbose') or user_args.get('raw_dump'):
             logger.setLevel(logging.DEBUG)
 
+def read_trace_config():
+    """
+    Read the trace file to enable row-level tracing in parser loops
+
+    The trace file is read at the start of every cycle and can be changed
+    without restart, also with --daemon.
+    Example (JSON):
+    {
+      "sample": 1,
+      "domains": {
+        "10.1.1.1": {},
+        "ucs2.example.com": {"classes": ["ethrx", "dcxvc"], "sample": 10}
+      }
+    }
+    Domains in the trace file are traced at WARNING level, without -vv
+    that logs every domain at INFO level.
+    classes limits tracing to the given tags (default: all).
+    sample traces every Nth row of a tag (default: 1, every row).
+    With -vvv, all domains are traced at DEBUG level.
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global trace_config
+    trace_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.trace'
+    previous_config = trace_config
+    trace_config = {}
+    try:
+        with open(trace_file_name, 'r') as trace_file:
+            trace_config = json.load(trace_file)
+    except FileNotFoundError:
+        if previous_config:
+            logger.warning('Tracing disabled. {} removed' \
+                           .format(trace_file_name))
+        return
+    except Exception as e:
+        logger.error('Error in loading {} : {} : {}. Tracing is disabled' \
+                        .format(trace_file_name, type(e).__name__, e))
+        return
+    if trace_config != previous_config:
+        logger.warning('Tracing enabled by {} : {}'.format(trace_file_name, \
+                                                           trace_config))
+
+def get_tracer(domain_ip):
+    """
+    Return a function to trace rows in parser loops for a domain, or None
+    if tracing is disabled for the domain
+
+    Call once per parser function. Loops must check the returned value
+    before calling it so that the cost is nothing when tracing is disabled:
+        if trace:
+            trace('ethrx', item.dn)
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    trace(tag, text) or None
+
+    """
+
+    domain_cfg = trace_config.get('domains', {}).get(domain_ip)
+    if domain_cfg is not None:
+        level = logging.WARNING
+    else:
+        level = logging.DEBUG
+        domain_cfg = {}
+    if not logger.isEnabledFor(level):
+        return None
+
+    classes = domain_cfg.get('classes')
+    sample = int(domain_cfg.get('sample', trace_config.get('sample', 1)))
+    if sample < 1:
+        sample = 1
+    counts = Counter()
+
+    def trace(tag, text):
+        if classes and tag not in classes:
+            return
+        counts[tag] += 1
+        if (counts[tag] - 1) % sample == 0:
+            logger.log(level, 'In %s for %s:%s', tag, domain_ip, text)
+
+    return trace
+
+def read_state_file(extension):
+    """
+    Read a JSON state file saved by the previous execution. The state files
+    are next to the pickle file, with a different extension
+
+    Parameters:
+    extension (file extension, like topology)
+
+    Returns:
+    Content of the file, an empty dictionary if unable to read
+
+    """
+
+    state_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.' + \
+                        extension
+    try:
+        with open(state_file_name, 'r') as state_file:
+            state = json.load(state_file)
+    except FileNotFoundError as e:
+        logger.info('{} : {} : {}. Running first time?' \
+                        .format(state_file_name, type(e).__name__, e))
+        return {}
+    except Exception as e:
+        logger.warning('Error in reading {} : {} : {}. Start afresh.' \
+                        .format(state_file_name, type(e).__name__, e))
+        return {}
+
+    logger.debug('Read {} entries from {}'.format(len(state), state_file_name))
+    return state
+
+def write_state_file(extension, state):
+    """
+    Save a JSON state file for the next execution. The file is written with
+    a temporary name and renamed to avoid a partial file on failure
+
+    Parameters:
+    extension (file extension, like topology)
+    state (content to save)
+
+    Returns:
+    None
+
+    """
+
+    state_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.' + \
+                        extension
+    try:
+        with open(state_file_name + '.tmp', 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(state_file_name + '.tmp', state_file_name)
+    except Exception as e:
+        logger.exception('Error in saving {} : {} : {}' \
+                        .format(state_file_name, type(e).__name__, e))
+    else:
+        logger.debug('Saved {} entries in {}'.format(len(state),
+                                                     state_file_name))
+
+def get_peak_rss():
+    '''
+    Return peak RSS of this process in KB, since start or since the last
+    reset_peak_rss(). Use VmHWM from /proc/self/status, else getrusage.
+    None if unable to find
+    '''
+    try:
+        with open('/proc/self/status', 'r') as status_file:
+            for line in status_file:
+                if line.startswith('VmHWM:'):
+                    return (int)(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    if sys.platform == 'darwin':
+        peak_rss = peak_rss // 1024
+    return peak_rss
+
+def reset_peak_rss():
+    '''
+    Reset the peak RSS of this process to the current RSS (Linux 4.0+).
+    Return False if not possible. get_peak_rss() then returns the peak since
+    start
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs_file:
+            clear_refs_file.write('5')
+    except OSError:
+        return False
+    return True
+
+def track_peak_rss(phase):
+    '''
+    Save the peak RSS of a phase of execution in peak_rss_dict and reset it
+    for the next phase
+    '''
+    peak_rss_dict[phase] = get_peak_rss()
+    if not reset_peak_rss():
+        logger.debug('Unable to reset peak RSS after {}. Next is peak since ' \
+                     'start'.format(phase))
+
 ###############################################################################
 # END: Generic functions
 ###############################################################################
@@ -216,6 +796,41 @@ def setup_logging():
 # BEGIN: Connection and Collector functions
 ###############################################################################
 
+def reset_domain_stats(domain_ip, location):
+    """
+    Initialize stats_dict, counter_stores and response_time_dict for a domain
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    location (Location of the UCS domain from the input file)
+
+    Returns:
+    None
+
+    """
+
+    stats_dict[domain_ip] = {}
+    stats_dict[domain_ip]['location'] = location
+    stats_dict[domain_ip]['A'] = {}
+    stats_dict[domain_ip]['A']['fi_ports'] = {}
+    stats_dict[domain_ip]['B'] = {}
+    stats_dict[domain_ip]['B']['fi_ports'] = {}
+    stats_dict[domain_ip]['chassis'] = {}
+    stats_dict[domain_ip]['ru'] = {}
+    stats_dict[domain_ip]['fex'] = {}
+
+    counter_stores[domain_ip] = CounterStore()
+
+    response_time_dict[domain_ip] = {}
+    response_time_dict[domain_ip]['cli_start'] = 0
+    response_time_dict[domain_ip]['cli_login'] = 0
+    response_time_dict[domain_ip]['cli_end'] = 0
+    response_time_dict[domain_ip]['sdk_start'] = 0
+    response_time_dict[domain_ip]['sdk_login'] = 0
+    response_time_dict[domain_ip]['sdk_end'] = 0
+    response_time_dict[domain_ip]['sdk_handshake'] = 0
+    response_time_dict[domain_ip]['sdk_request'] = 0
+
 def get_ucs_domains():
     """
     Parse the --input-file argument to get UCS domain(s)
@@ -259,28 +874,11 @@ def get_ucs_domains():
                     logger.warning('Line not in correct input format:'
                                     'IP_Address,username,password')
                     continue
-                domain_dict[domain[0]] = [domain[1], domain[2]]
+                domain_dict[domain[0]] = [domain[1], domain[2], location]
                 logger.info('Added {} to domain dict'.format(domain[0]))
-                stats_dict[domain[0]] = {}
-                stats_dict[domain[0]]['location'] = location
-                stats_dict[domain[0]]['A'] = {}
-                stats_dict[domain[0]]['A']['fi_ports'] = {}
-                stats_dict[domain[0]]['B'] = {}
-                stats_dict[domain[0]]['B']['fi_ports'] = {}
-                stats_dict[domain[0]]['chassis'] = {}
-                stats_dict[domain[0]]['ru'] = {}
-                stats_dict[domain[0]]['fex'] = {}
-
+                reset_domain_stats(domain[0], location)
                 conn_dict[domain[0]] = {}
 
-                response_time_dict[domain[0]] = {}
-                response_time_dict[domain[0]]['cli_start'] = 0
-                response_time_dict[domain[0]]['cli_login'] = 0
-                response_time_dict[domain[0]]['cli_end'] = 0
-                response_time_dict[domain[0]]['sdk_start'] = 0
-                response_time_dict[domain[0]]['sdk_login'] = 0
-                response_time_dict[domain[0]]['sdk_end'] = 0
-
     if not domain_dict:
         logger.warning('No UCS domains to monitor. Check input file. Exiting.')
         sys.exit()
@@ -374,200 +972,1398 @@ def unpickle_connections():
         pickled_connections[domain_ip]['cli'] = cli_handle
         pickled_connections[domain_ip]['sdk'] = sdk_handle
         pickled_connections[domain_ip]['sdk_time'] = sdk_time
+        # Sessions of the previous run take the slots of the domain
+        for handle in (cli_handle, sdk_handle):
+            if handle is not None:
+                login_limiter.hold(domain_ip)
 
     logger.debug('Updating global pickled_connections as {}' \
                     .format(pickled_connections))
 
-def set_ucs_connection(domain_ip, conn_type):
+def read_dns_cache():
     """
-    Given IP Address of UCS domain, allocate a new connection handle and
-    login to the UCS domain
-
-    Must be multithreading aware.
+    Read resolved addresses of UCS domains saved by the previous execution
 
     Parameters:
-    domain_ip (IP Address of UCS domain)
-    conn_type (cli or sdk)
+    None
 
     Returns:
-    handle (UcsHandle or netmiko.ConnectHandler)
+    None
 
     """
 
-    global domain_dict
-    global response_time_dict
-    handle = None
-    if domain_ip in domain_dict:
-        user = domain_dict[domain_ip][0]
-        passwd = domain_dict[domain_ip][1]
-    else:
-        logger.error('Unable to find {} in global domain_dict : {}' \
-                .format(domain_ip, domain_dict))
-        return handle
+    global dns_cache
+    dns_cache = read_state_file('dns')
 
-    logger.info('Trying to set a new {} connection for {}' \
-                .format(conn_type, domain_ip))
+def save_dns_cache():
+    """
+    Save resolved addresses of UCS domains for the next execution
 
-    time_d = response_time_dict[domain_ip]
-    if conn_type == 'cli':
-        try:
-            handle = ConnectHandler(device_type='cisco_nxos',
-                                    host=domain_ip,
-                                    username=user,
-                                    password=passwd,
-                                    timeout=user_args.get('conn_timeout'))
-        except Exception as e:
-            logger.exception('ConnectHandler failed for domain {}. {} : {}' \
-                            .format(domain_ip, type(e).__name__, e))
-        else:
-            time_d['cli_login'] = time.time()
-            logger.info('Connection type {} UP for {} in {}s' \
-                        .format(conn_type, domain_ip, round(( \
-                                time_d['cli_login'] - time_d['cli_start']), 2)))
-    if conn_type == 'sdk':
-        try:
-            handle = UcsHandle(domain_ip, user, passwd)
-        except Exception as e:
-            logger.exception('UcsHandle failed for domain {}. {} : {}' \
-                    .format(domain_ip, type(e).__name__, e))
-        else:
-            try:
-                handle.login(timeout=CONNECTION_TIMEOUT)
-            except Exception as e:
-                logger.exception('UcsHandle {} unable to login to {} in {} ' \
-                'seconds : {} : {}'.format(handle, domain_ip, \
-                CONNECTION_TIMEOUT, type(e).__name__, e))
-                handle = None
-            else:
-                logger.info('Connection type {} UP for {}' \
-                            .format(conn_type, domain_ip))
+    Parameters:
+    None
 
-    return handle
+    Returns:
+    None
 
-def connect_and_pull_stats(handle_list):
     """
-    Wrapper to connect to UCS domains and pull stats for handle_list
-    Pull stats and store in global dictionaries raw_cli_stats & raw_sdk_stats
 
-    Must be multithreading aware.
+    write_state_file('dns', {domain_ip:entry for domain_ip, entry in \
+                                dns_cache.items() if domain_ip in domain_dict})
+
+def resolve_domains():
+    """
+    Resolve names of UCS domains in parallel and save in dns_cache
+
+    Only the names without an address or with an expired address
+    (DNS_CACHE_TTL) are resolved. If a name fails to resolve, the expired
+    address, if any, is used until the next attempt
 
     Parameters:
-    handle_list (list of IP,handle type,handle). Handle type can be cli or sdk
+    None
 
     Returns:
     None
 
     """
 
-    global conn_dict
-    global pickled_connections
-    global raw_sdk_stats
-    global raw_cli_stats
-    global response_time_dict
+    now = time.time()
+    names = [domain_ip for domain_ip in domain_dict \
+                if dns_cache.get(domain_ip, {}).get('expiry', 0) <= now]
+    if not names:
+        return
 
-    domain_ip = handle_list[0]
-    handle_type = handle_list[1]
-    fi_id_list = ['A', 'B']
-    time_d = response_time_dict[domain_ip]
+    logger.info('Resolve {} names'.format(len(names)))
+    with concurrent.futures.ThreadPoolExecutor( \
+            max_workers=min(DNS_WORKERS, len(names))) as e:
+        future_to_name = {e.submit(socket.getaddrinfo, name, None, \
+                            proto=socket.IPPROTO_TCP): name for name in names}
+        for future in concurrent.futures.as_completed(future_to_name):
+            name = future_to_name[future]
+            try:
+                address = future.result()[0][4][0]
+            except Exception as exc:
+                logger.warning('Unable to resolve {} : {} : {}. Using {}' \
+                               .format(name, type(exc).__name__, exc, \
+                                       get_domain_address(name)))
+                continue
+            dns_cache[name] = {'address':address,
+                               'expiry':now + DNS_CACHE_TTL}
 
-    if handle_type == 'cli':
-        if user_args.get('no_ssh'):
-            logger.warning('Skipping CLI metrics due to --no-ssh flag for {}'. \
-                           format(domain_ip))
-            return
-        time_d['cli_start'] = time.time()
-        cli_handle = handle_list[2]
-        if cli_handle is None or not cli_handle.is_alive():
-            # logger.info('Invalid or dead cli_handle for {}'.format(domain_ip))
-            cli_handle = set_ucs_connection(domain_ip, 'cli')
-        conn_dict[domain_ip]['cli'] = cli_handle
-        if cli_handle is None:
-            logger.error('Exiting for {} due to invalid cli_handle' \
-                        .format(domain_ip))
-            return
+    logger.info('Resolved {} names in {}s'.format(len(names), \
+                                            round(time.time() - now, 3)))
 
-        raw_cli_stats[domain_ip] = {}
+def get_domain_address(domain_ip):
+    '''
+    Return the resolved address of a domain, or the name if not resolved
+    '''
+    return dns_cache.get(domain_ip, {}).get('address', domain_ip)
 
-        logger.info('CLI pull Starting on {} FI-{}' \
-                    .format(domain_ip, fi_id_list))
-        for fi_id in fi_id_list:
-            logger.info('Connect to NX-OS FI-{} for {}'.format(fi_id, domain_ip))
-            cli_handle.send_command('connect nxos ' + fi_id, expect_string='#')
-            logger.info('Connected. Now run commands FI-{} {}' \
-                         .format(fi_id, domain_ip))
-            raw_cli_stats[domain_ip][fi_id] = {}
-            for stats_type, stats_item in cli_stats_types.items():
-                raw_cli_stats[domain_ip][fi_id][stats_type] = \
-                    cli_handle.send_command(stats_item[0], expect_string='#')
-                logger.info('-- {} -- on {} FI-{}'\
-                                .format(stats_item[0], domain_ip, fi_id))
-            cli_handle.send_command('exit', expect_string='#')
+class LoginLimiter(object):
+    """
+    Limit new logins (SDK and SSH) across all the UCS domains
 
-        time_d['cli_end'] = time.time()
-        logger.info('CLI pull completed on {} in {}s'. \
-                    format(domain_ip, round((time_d['cli_end'] - \
-                                             time_d['cli_login']), 2)))
+    A token bucket limits the rate of new logins across the process and the
+    number of sessions per domain is capped. A login which does not fit waits
+    until a token and a session slot are available, or until timeout.
+    A session is counted once when it is opened, for as long as it is used,
+    and released when it is logged out or found dead.
+    Must be multithreading aware.
+    """
 
-    if handle_type == 'sdk':
-        sdk_handle = handle_list[2]
-        time_d['sdk_start'] = time.time()
-        conn_time = 0
-        if sdk_handle is not None and \
-                        'sdk_time' in pickled_connections[domain_ip]:
-            conn_time = pickled_connections[domain_ip]['sdk_time']
-            # Do no refresh all the connections at the same time
-            conn_refresh_time = CONNECTION_REFRESH_INTERVAL + \
-                                    random.randint(1, 1500)
-            logger.info('SDK connection for {}. Time:{}, Elapsed:{},' \
-                        ' Refresh:{}'.format(domain_ip, conn_time, \
-                         ((int(time.time())) - conn_time), conn_refresh_time))
-            if (int(time.time())) - conn_time > conn_refresh_time:
-                logger.info('SDK connection refresh time for {}'. \
-                            format(domain_ip))
-                sdk_handle.logout()
+    def __init__(self, rate, burst, max_sessions):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.max_sessions = max_sessions
+        # Number of sessions per domain, open or in login
+        self.sessions = Counter()
+        self.condition = threading.Condition()
+
+    def acquire(self, domain_ip, timeout):
+        '''
+        Wait for a session slot of the domain and a login token.
+        Return False if not available within timeout
+        '''
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.sessions[domain_ip] >= self.max_sessions:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.sessions[domain_ip] += 1
+            if self.rate <= 0:
+                return True
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + \
+                                    (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+                if now + wait > deadline:
+                    self.sessions[domain_ip] -= 1
+                    self.condition.notify_all()
+                    return False
+                self.condition.wait(wait)
+
+    def hold(self, domain_ip):
+        '''
+        Count an open session which was not logged in after acquire(), like
+        an unpickled session. Does not wait or use a token
+        '''
+        with self.condition:
+            self.sessions[domain_ip] += 1
 
-        if sdk_handle is None or not sdk_handle.is_valid():
-            logger.warning('Invalid or dead sdk_handle for {}'. \
-                            format(domain_ip))
-            sdk_handle = set_ucs_connection(domain_ip, 'sdk')
-            if sdk_handle is None:
-                conn_dict[domain_ip]['sdk'] = sdk_handle
-                conn_dict[domain_ip]['sdk_time'] = 0
-                logger.error('Exiting for {} due to invalid sdk_handle' \
-                        .format(domain_ip))
-                return
-            conn_time = int(time.time())
-            logger.info('New SDK connection time:{}'.format(conn_time))
+    def release(self, domain_ip):
+        '''
+        Free the session slot of a failed login or a logged out, dead or
+        dropped session
+        '''
+        with self.condition:
+            if self.sessions[domain_ip] > 0:
+                self.sessions[domain_ip] -= 1
+            self.condition.notify_all()
 
-        conn_dict[domain_ip]['sdk'] = sdk_handle
-        conn_dict[domain_ip]['sdk_time'] = conn_time
-        time_d['sdk_login'] = time.time()
+class PooledHTTPSConnection(http.client.HTTPSConnection):
+    """
+    HTTPSConnection which resumes the TLS session of its TransportPool and
+    adds the time of TCP and TLS handshakes to the pool
+    """
 
-        raw_sdk_stats[domain_ip] = {}
-        logger.info('Query class_ids for {}'.format(domain_ip))
-        raw_sdk_stats[domain_ip] = sdk_handle.query_classids(class_ids)
-        time_d['sdk_end'] = time.time()
-        logger.info('Query completed {}'.format(domain_ip))
+    def __init__(self, pool, host, port, timeout):
+        http.client.HTTPSConnection.__init__(self, host, port,
+                                             timeout=timeout,
+                                             context=pool.context)
+        self.pool = pool
 
-def get_ucs_stats():
+    def connect(self):
+        handshake_start = time.time()
+        sock = socket.create_connection((self.host, self.port), self.timeout,
+                                        self.source_address)
+        try:
+            self.sock = self.pool.context.wrap_socket(sock,
+                                server_hostname=self.host,
+                                session=self.pool.tls_session)
+        except Exception:
+            sock.close()
+            raise
+        self.pool.add_handshake(time.time() - handshake_start,
+                                self.sock.session_reused)
+
+class TransportPool(object):
     """
-    Connect to UCS domains and pull stats
+    Idle HTTPS connections and the last TLS session of a UCS domain
 
-    Use the global pickled_connections. If open connections do not exist or
-    dead, open new connections.
+    Connections are shared by all the SDK handles (sessions) of the domain.
+    Time taken by handshakes and by requests is kept until pop_times().
     Must be multithreading aware.
+    """
 
-    Parameters:
-    None
+    def __init__(self, domain_ip):
+        self.domain_ip = domain_ip
+        # Same as ucsmsdk, UCS Manager certificates are not verified
+        self.context = ssl.create_default_context()
+        self.context.check_hostname = False
+        self.context.verify_mode = ssl.CERT_NONE
+        self.tls_session = None
+        self.idle = []
+        self.lock = threading.Lock()
+        self.times = Counter()
+
+    def get_connection(self, scheme, host, port, timeout):
+        '''
+        Return an idle connection to host and port, or a new one
+        '''
+        with self.lock:
+            for conn in reversed(self.idle):
+                if conn.host == host and conn.port == port:
+                    self.idle.remove(conn)
+                    conn.timeout = timeout
+                    if conn.sock is not None:
+                        conn.sock.settimeout(timeout)
+                    return conn
+        if scheme == 'http':
+            return http.client.HTTPConnection(host, port, timeout=timeout)
+        return PooledHTTPSConnection(self, host, port, timeout)
+
+    def put_connection(self, conn):
+        '''
+        Keep a connection for the next request. Save its TLS session
+        '''
+        with self.lock:
+            if conn.sock is not None and isinstance(conn.sock, ssl.SSLSocket):
+                self.tls_session = conn.sock.session
+            if conn.sock is None or len(self.idle) >= TRANSPORT_POOL_SIZE:
+                conn.close()
+                return
+            self.idle.append(conn)
 
-    Returns:
-    None
+    def add_handshake(self, handshake_time, resumed):
+        with self.lock:
+            self.times['handshakes'] += 1
+            self.times['resumed'] += resumed
+            self.times['handshake_time'] += handshake_time
+
+    def add_request(self, request_time):
+        with self.lock:
+            self.times['requests'] += 1
+            self.times['request_time'] += request_time
+
+    def pop_times(self):
+        '''
+        Return and reset the handshake and request times
+        '''
+        with self.lock:
+            times = self.times
+            self.times = Counter()
+        return times
+
+def get_transport_pool(domain_ip):
+    '''
+    Return the TransportPool of a domain. Create if needed
+    '''
+    with transport_pools_lock:
+        if domain_ip not in transport_pools:
+            transport_pools[domain_ip] = TransportPool(domain_ip)
+        return transport_pools[domain_ip]
 
+class PooledUcsDriver(object):
     """
+    Drop-in replacement of ucsmsdk UcsDriver which sends the requests of a
+    UcsHandle on the HTTPS connections of the TransportPool of the domain
 
-    global pickled_connections
-    executor_list = []
-    for domain_ip, handles in pickled_connections.items():
+    Only the name of the domain is kept here, so a handle with this driver
+    can be pickled.
+    """
+
+    def __init__(self, domain_ip):
+        self.domain_ip = domain_ip
+        self.headers = {}
+        self.__redirect_uri = None
+
+    @property
+    def redirect_uri(self):
+        return self.__redirect_uri
+
+    def update_handlers(self, tls_proto=None):
+        pass
+
+    def add_header(self, header_prop, header_value):
+        self.headers[header_prop] = header_value
+
+    def remove_header(self, header_prop):
+        del self.headers[header_prop]
+
+    def post(self, uri, data=None, dump_xml=False, read=True, timeout=None):
+        '''
+        Send data to uri and return the response, like UcsDriver.post.
+        A request on a connection closed by UCS Manager is sent again on a
+        new connection
+        '''
+        pool = get_transport_pool(self.domain_ip)
+        if self.__redirect_uri:
+            uri = self.__redirect_uri
+        url = urlsplit(uri)
+        headers = {'Content-Type':'application/x-www-form-urlencoded'}
+        headers.update(self.headers)
+        conn = pool.get_connection(url.scheme, url.hostname, url.port,
+                                   timeout)
+        while True:
+            reused = conn.sock is not None
+            try:
+                if not reused:
+                    conn.connect()
+                request_start = time.time()
+                conn.request('POST', url.path, body=data, headers=headers)
+                response = conn.getresponse()
+            except (OSError, http.client.BadStatusLine) as e:
+                # Idle connection closed by UCS Manager. Not for timeouts
+                conn.close()
+                if not reused or isinstance(e, socket.timeout):
+                    raise
+                conn = pool.get_connection(url.scheme, url.hostname,
+                                           url.port, timeout)
+                continue
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if response.status in (301, 302) and response.getheader('Location'):
+            response.read()
+            pool.put_connection(conn)
+            self.__redirect_uri = response.getheader('Location')
+            return self.post(self.__redirect_uri, data, dump_xml, read,
+                             timeout)
+        if response.status >= 400:
+            conn.close()
+            raise urllib.error.HTTPError(uri, response.status,
+                                         response.reason, response.headers,
+                                         None)
+        if not read:
+            # Caller reads the response. Do not re-use the connection
+            return response
+        response = response.read().decode('utf-8')
+        pool.add_request(time.time() - request_start)
+        pool.put_connection(conn)
+        return response
+
+def use_pooled_transport(domain_ip, handle):
+    """
+    Plug PooledUcsDriver into a UcsHandle with --keep-alive. Without it, put
+    back the stock UcsDriver of ucsmsdk, for a handle pickled by an
+    execution with --keep-alive
+
+    ucsmsdk keeps the driver in the private __driver of UcsSession (checked
+    with ucsmsdk 0.9.x). If the handle does not have it, the stock driver
+    is used and the fallback is logged once
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    handle (UcsHandle)
+
+    Returns:
+    None
+
+    """
+
+    global pooled_transport_unsupported
+    if not hasattr(handle, '_UcsSession__driver'):
+        if user_args.get('keep_alive') and not pooled_transport_unsupported:
+            pooled_transport_unsupported = True
+            logger.warning('--keep-alive is not supported with ucsmsdk {}. ' \
+                           'Using its own transport' \
+                           .format(getattr(ucsmsdk, '__version__', 'unknown')))
+        return
+    driver = handle._UcsSession__driver
+    if user_args.get('keep_alive'):
+        if not isinstance(driver, PooledUcsDriver):
+            handle._UcsSession__driver = PooledUcsDriver(domain_ip)
+    elif isinstance(driver, PooledUcsDriver):
+        logger.info('Stock transport for the session of {} saved with ' \
+                    '--keep-alive'.format(domain_ip))
+        handle._UcsSession__driver = UcsDriver(proxy=getattr(handle, \
+                                                        'proxy', None))
+
+def get_transport_times(domain_ip):
+    """
+    Return handshake and request times of a domain since the last call and
+    log the details
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+
+    Returns:
+    Dictionary to update response_time_dict. Empty without --keep-alive
+
+    """
+
+    if domain_ip not in transport_pools:
+        return {}
+    times = transport_pools[domain_ip].pop_times()
+    logger.info('Transport for {} : {} handshakes ({} resumed) in {}s, ' \
+                '{} requests in {}s'.format(domain_ip, times['handshakes'], \
+                times['resumed'], round(times['handshake_time'], 3), \
+                times['requests'], round(times['request_time'], 3)))
+    return {'sdk_handshake':times['handshake_time'],
+            'sdk_request':times['request_time']}
+
+class AsyncSshEngine(object):
+    """
+    SSH sessions (CLI) of all the UCS domains on one asyncio event loop
+
+    The event loop runs in its own thread. Pulls are submitted from other
+    threads and return concurrent.futures.Future, like the thread pool of
+    SDK pulls. A session is kept per domain and re-used until it breaks or
+    close() is called. Prompts are learnt from the output instead of
+    polling for an expect string. After connect nxos, all the commands are
+    sent back to back and their tables are read line by line, while the
+    output is received.
+    Requires asyncssh.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        # Only used in the event loop
+        self.sessions = {}
+        self.locks = {}
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name='AsyncSshEngine', daemon=True)
+        self.thread.start()
+
+    def submit(self, domain_ip):
+        '''
+        Pull cli_stats_types of a domain. Future of a PullResult
+        '''
+        return asyncio.run_coroutine_threadsafe(self.pull(domain_ip),
+                                                self.loop)
+
+    def submit_warm_up(self, domain_ip):
+        '''
+        Login to a domain if its session is not open. Future of {}
+        '''
+        return asyncio.run_coroutine_threadsafe(self.warm_up(domain_ip),
+                                                self.loop)
+
+    def run(self, domain_ip, fi_types, reuse_only=False):
+        '''
+        Run commands of cli_stats_types on FIs of a domain and wait.
+        Dictionary of the list of rows per FI
+        '''
+        return asyncio.run_coroutine_threadsafe( \
+                    self.run_commands(domain_ip, fi_types, reuse_only), \
+                    self.loop).result()
+
+    def close(self):
+        '''
+        Close all the sessions and stop the event loop
+        '''
+        if not self.thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.close_sessions(),
+                                         self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    async def close_sessions(self):
+        for domain_ip in list(self.sessions):
+            await self.drop_session(domain_ip)
+
+    async def drop_session(self, domain_ip):
+        session = self.sessions.pop(domain_ip, None)
+        if session is None:
+            return
+        session['conn'].close()
+        try:
+            await session['conn'].wait_closed()
+        except Exception as e:
+            logger.debug('Closing SSH session of {} : {} : {}'.format( \
+                            domain_ip, type(e).__name__, e))
+        login_limiter.release(domain_ip)
+
+    async def read_until(self, domain_ip, session, prompt=None,
+                         deadline=None):
+        """
+        Read from the channel of a session until the output ends with a
+        prompt. With prompt None, any line matching CLI_PROMPT_RE
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+        session (dictionary of conn, process and buffer)
+        prompt (expected prompt or None)
+        deadline (loop time, default --connection-timeout from now)
+
+        Returns:
+        Tuple of output (without the prompt) and the prompt
+
+        """
+
+        timeout = user_args.get('conn_timeout')
+        if deadline is None:
+            deadline = self.loop.time() + timeout
+        buffer = session['buffer']
+        while True:
+            last_line = buffer.rsplit('\n', 1)[-1]
+            if prompt is None:
+                if CLI_PROMPT_RE.match(last_line):
+                    break
+            elif last_line.rstrip() == prompt:
+                break
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                raise TimeoutError('No prompt from {} in {}s. Last line : {}' \
+                                   .format(domain_ip, timeout, last_line))
+            data = await asyncio.wait_for( \
+                        session['process'].stdout.read(CLI_READ_SIZE), \
+                        remaining)
+            if not data:
+                raise ConnectionError('SSH channel of {} closed' \
+                                      .format(domain_ip))
+            buffer = buffer + data.replace('\r', '')
+        session['buffer'] = ''
+        output = buffer[:len(buffer) - len(last_line)]
+        return output, last_line.rstrip()
+
+    async def get_session(self, domain_ip, reuse_only=False):
+        """
+        Return the open session of a domain or login. Login is limited by
+        login_limiter
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+        reuse_only (do not login if there is no open session)
+
+        Returns:
+        Dictionary of conn, process, buffer and prompt. None if not open
+
+        """
+
+        session = self.sessions.get(domain_ip)
+        if session is not None:
+            if not session['conn'].is_closed():
+                return session
+            await self.drop_session(domain_ip)
+        if reuse_only:
+            return None
+
+        user = domain_dict[domain_ip][0]
+        passwd = domain_dict[domain_ip][1]
+        timeout = user_args.get('conn_timeout')
+        acquired = await self.loop.run_in_executor(None, \
+                                login_limiter.acquire, domain_ip, timeout)
+        if not acquired:
+            logger.error('No login slot for cli connection to {} in {}s' \
+                         .format(domain_ip, timeout))
+            return None
+        # Without --known-hosts, host keys are not verified (known_hosts
+        # None), same as netmiko which adds unknown host keys
+        try:
+            conn = await asyncio.wait_for(asyncssh.connect( \
+                        get_domain_address(domain_ip), username=user, \
+                        password=passwd, \
+                        known_hosts=user_args.get('known_hosts')), timeout)
+        except Exception as e:
+            login_limiter.release(domain_ip)
+            logger.error('SSH login failed for {} : {} : {}'.format( \
+                            domain_ip, type(e).__name__, e))
+            return None
+        session = {'conn':conn, 'buffer':'', 'login_time':time.time()}
+        self.sessions[domain_ip] = session
+        try:
+            session['process'] = await conn.create_process( \
+                                                    term_type='vt100')
+            output, session['prompt'] = await self.read_until(domain_ip,
+                                                              session)
+        except Exception as e:
+            await self.drop_session(domain_ip)
+            logger.error('No shell on SSH session of {} : {} : {}'.format( \
+                            domain_ip, type(e).__name__, e))
+            return None
+        logger.info('SSH session for {} with prompt {}'.format(domain_ip, \
+                                                    session['prompt']))
+        return session
+
+    async def read_tables(self, domain_ip, session, nxos_prompt, readers,
+                          deadline=None):
+        """
+        Read the outputs of commands sent back to back, line by line as
+        they are received, until the output ends with the UCSM prompt.
+        Lines after the n-th NX-OS prompt are fed to the n-th reader. Only
+        a partial line is kept between reads
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+        session (dictionary of conn, process and buffer)
+        nxos_prompt (prompt of NX-OS)
+        readers (list of CliTableReader, one per command)
+        deadline (loop time, default --connection-timeout from now)
+
+        Returns:
+        None
+
+        """
+
+        timeout = user_args.get('conn_timeout')
+        if deadline is None:
+            deadline = self.loop.time() + timeout
+        # Lines before the first NX-OS prompt are of terminal length 0
+        index = -1
+        pending = session['buffer']
+        while pending.rstrip() != session['prompt']:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                raise TimeoutError('No prompt from {} in {}s. Last line : {}' \
+                                   .format(domain_ip, timeout, pending))
+            data = await asyncio.wait_for( \
+                        session['process'].stdout.read(CLI_READ_SIZE), \
+                        remaining)
+            if not data:
+                raise ConnectionError('SSH channel of {} closed' \
+                                      .format(domain_ip))
+            lines = (pending + data.replace('\r', '')).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                if line.startswith(nxos_prompt):
+                    index = index + 1
+                elif 0 <= index < len(readers):
+                    readers[index].feed(line)
+        session['buffer'] = ''
+        # One more prompt for exit
+        if index != len(readers):
+            raise ValueError('{} prompts for {} commands from {}'.format( \
+                                index + 1, len(readers) + 1, domain_ip))
+
+    async def run_commands(self, domain_ip, fi_types, reuse_only=False):
+        """
+        Run commands of cli_stats_types on NX-OS of FIs of a domain.
+        Commands of an FI are sent back to back after connect nxos and
+        their tables are read while the output is received
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+        fi_types (dictionary with FI ID as key and list of stats types)
+        reuse_only (do not login if there is no open session)
+
+        Returns:
+        Dictionary with FI ID as key and list of rows (as returned by
+        CliTableReader) per stats type
+
+        """
+
+        lock = self.locks.setdefault(domain_ip, asyncio.Lock())
+        async with lock:
+            session = await self.get_session(domain_ip, reuse_only)
+            if session is None:
+                return {}
+            fi_tables = {}
+            try:
+                for fi_id, stats_types in fi_types.items():
+                    process = session['process']
+                    process.stdin.write('connect nxos ' + fi_id + '\n')
+                    output, nxos_prompt = await self.read_until(domain_ip,
+                                                                session)
+                    lines = ['terminal length 0'] + \
+                            [cli_stats_types[t][0] for t in stats_types] + \
+                            ['exit']
+                    process.stdin.write('\n'.join(lines) + '\n')
+                    readers = [CliTableReader(t) for t in stats_types]
+                    await self.read_tables(domain_ip, session, nxos_prompt,
+                                           readers)
+                    fi_tables[fi_id] = [reader.rows for reader in readers]
+            except Exception:
+                await self.drop_session(domain_ip)
+                raise
+            return fi_tables
+
+    async def run_iom_channel(self, domain_ip, session, jobs, deadline,
+                              iom_types, fi_tables):
+        """
+        Open a channel on the SSH session of a domain and run the commands
+        of the chassis and FEX in jobs, until no job is left or the
+        deadline. Rows are added in fi_tables
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+        session (dictionary of conn, process and buffer)
+        jobs (list of (FI ID, chassis or FEX ID, last port), shared by the
+              channels)
+        deadline (loop time)
+        iom_types (list of stats types with chassis scope)
+        fi_tables (dictionary with FI ID as key and dictionary of stats
+                   type and rows)
+
+        Returns:
+        None
+
+        """
+
+        channel = {'conn':session['conn'], 'buffer':''}
+        channel['process'] = await session['conn'].create_process( \
+                                                    term_type='vt100')
+        try:
+            output, channel['prompt'] = await self.read_until(domain_ip,
+                                            channel, deadline=deadline)
+            while jobs and self.loop.time() < deadline:
+                job = jobs.pop(0)
+                fi_id, c_id, last_port = job
+                process = channel['process']
+                lines = ['terminal length 0'] + \
+                        [cli_stats_types[t][0].format(c_id=c_id, \
+                            last_port=last_port) for t in iom_types] + \
+                        ['exit']
+                readers = [CliTableReader(t) for t in iom_types]
+                try:
+                    process.stdin.write('connect nxos ' + fi_id + '\n')
+                    output, nxos_prompt = await self.read_until(domain_ip,
+                                                channel, deadline=deadline)
+                    process.stdin.write('\n'.join(lines) + '\n')
+                    await self.read_tables(domain_ip, channel, nxos_prompt,
+                                           readers, deadline)
+                except (asyncio.TimeoutError, TimeoutError):
+                    if self.loop.time() < deadline:
+                        raise
+                    # Out of --iom-cli budget. Leave it as not pulled
+                    jobs.insert(0, job)
+                    return
+                tables = fi_tables.setdefault(fi_id, {})
+                for stats_type, reader in zip(iom_types, readers):
+                    if reader.rows is None:
+                        tables.setdefault(stats_type, None)
+                    else:
+                        tables[stats_type] = (tables.get(stats_type) or []) \
+                                                + reader.rows
+        finally:
+            channel['process'].close()
+
+    async def run_iom_commands(self, domain_ip, iom_types):
+        """
+        Run commands of cli_stats_types with chassis scope for every
+        chassis and FEX in iom_targets, on NX-OS of the FI connected to
+        its IOM/FEX. Up to --iom-channels channels on the SSH session of
+        the domain run the commands in parallel, for up to --iom-cli
+        seconds
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+        iom_types (list of stats types with chassis scope)
+
+        Returns:
+        Dictionary with FI ID as key and dictionary of stats type and rows.
+        Rows are None if no output could be used. An FI is not in it if
+        none of its chassis and FEX were pulled
+
+        """
+
+        deadline = self.loop.time() + user_args['iom_cli']
+        jobs = [(fi_id, c_id, last_port) for fi_id, c_list in \
+                    sorted(iom_targets[domain_ip].items()) \
+                    for c_id, last_port in c_list]
+        fi_tables = {}
+        lock = self.locks.setdefault(domain_ip, asyncio.Lock())
+        async with lock:
+            session = self.sessions.get(domain_ip)
+            if session is None or session['conn'].is_closed():
+                session = await self.get_session(domain_ip)
+            if session is None:
+                return fi_tables
+            count = max(1, min(user_args['iom_channels'], len(jobs)))
+            results = await asyncio.gather(*[self.run_iom_channel( \
+                                domain_ip, session, jobs, deadline, \
+                                iom_types, fi_tables) for i in range(count)],
+                                return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error('IOM/FEX CLI channel of {} : {} : {}'.format( \
+                                domain_ip, type(result).__name__, result))
+        if jobs:
+            logger.warning('IOM/FEX CLI of {} : {} chassis/FEX not pulled ' \
+                           'in {}s'.format(domain_ip, len(jobs), \
+                                           user_args['iom_cli']))
+        return fi_tables
+
+    async def warm_up(self, domain_ip):
+        lock = self.locks.setdefault(domain_ip, asyncio.Lock())
+        async with lock:
+            await self.get_session(domain_ip)
+        return {}
+
+    async def pull(self, domain_ip):
+        """
+        Pull cli_stats_types from both the FIs of a domain
+
+        Parameters:
+        domain_ip (IP Address of UCS domain)
+
+        Returns:
+        PullResult, same as connect_and_pull_stats for cli
+
+        """
+
+        times = {}
+        cli_types = get_cli_pull_types(domain_ip)
+        iom_types = get_iom_pull_types(domain_ip)
+        if not cli_types and not iom_types:
+            return PullResult(domain_ip, 'cli', {}, None, times, None)
+        times['cli_start'] = time.time()
+        cli_stats = {}
+        try:
+            if cli_types:
+                fi_tables = await self.run_commands(domain_ip, \
+                                    {fi_id:cli_types for fi_id in ['A', 'B']})
+                cli_stats = {fi_id:dict(zip(cli_types, tables)) for \
+                                fi_id, tables in fi_tables.items()}
+            if iom_types:
+                iom_start = time.time()
+                for fi_id, tables in (await self.run_iom_commands( \
+                                        domain_ip, iom_types)).items():
+                    cli_stats.setdefault(fi_id, {}).update(tables)
+                logger.info('IOM/FEX CLI pull completed on {} in {}s' \
+                            .format(domain_ip, \
+                                    round(time.time() - iom_start, 2)))
+        except Exception as e:
+            times['cli_end'] = time.time()
+            return PullResult(domain_ip, 'cli', {}, None, times,
+                    'CLI pull failed : {} : {}'.format(type(e).__name__, e))
+        times['cli_end'] = time.time()
+        if not cli_stats:
+            return PullResult(domain_ip, 'cli', {}, None, times,
+                              'Invalid cli session')
+        login_time = self.sessions[domain_ip]['login_time']
+        if login_time >= times['cli_start']:
+            times['cli_login'] = login_time
+        logger.info('CLI pull completed on {} in {}s'.format(domain_ip, \
+                round(times['cli_end'] - times['cli_start'], 2)))
+        return PullResult(domain_ip, 'cli', {}, cli_stats, times, None)
+
+def set_ucs_connection(domain_ip, conn_type):
+    """
+    Given IP Address of UCS domain, allocate a new connection handle and
+    login to the UCS domain
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    conn_type (cli or sdk)
+
+    Returns:
+    handle (UcsHandle or netmiko.ConnectHandler)
+
+    """
+
+    global domain_dict
+    handle = None
+    if domain_ip in domain_dict:
+        user = domain_dict[domain_ip][0]
+        passwd = domain_dict[domain_ip][1]
+    else:
+        logger.error('Unable to find {} in global domain_dict : {}' \
+                .format(domain_ip, domain_dict))
+        return handle
+
+    logger.info('Trying to set a new {} connection for {}' \
+                .format(conn_type, domain_ip))
+
+    wait_start = time.time()
+    if not login_limiter.acquire(domain_ip, user_args.get('conn_timeout')):
+        logger.error('No login slot for {} connection to {} in {}s. ' \
+                     'Sessions:{}'.format(conn_type, domain_ip, \
+                     user_args.get('conn_timeout'), \
+                     login_limiter.sessions[domain_ip]))
+        return handle
+    if time.time() - wait_start > 1:
+        logger.info('Waited {}s for a login slot for {} connection to {}' \
+                    .format(round(time.time() - wait_start, 2), conn_type, \
+                            domain_ip))
+
+    if conn_type == 'cli':
+        try:
+            handle = ConnectHandler(device_type='cisco_nxos',
+                                    host=get_domain_address(domain_ip),
+                                    username=user,
+                                    password=passwd,
+                                    timeout=user_args.get('conn_timeout'))
+        except Exception as e:
+            logger.exception('ConnectHandler failed for domain {}. {} : {}' \
+                            .format(domain_ip, type(e).__name__, e))
+    if conn_type == 'sdk':
+        try:
+            handle = UcsHandle(get_domain_address(domain_ip), user, passwd)
+            use_pooled_transport(domain_ip, handle)
+        except Exception as e:
+            logger.exception('UcsHandle failed for domain {}. {} : {}' \
+                    .format(domain_ip, type(e).__name__, e))
+        else:
+            try:
+                handle.login(timeout=CONNECTION_TIMEOUT)
+            except Exception as e:
+                logger.exception('UcsHandle {} unable to login to {} in {} ' \
+                'seconds : {} : {}'.format(handle, domain_ip, \
+                CONNECTION_TIMEOUT, type(e).__name__, e))
+                handle = None
+            else:
+                logger.info('Connection type {} UP for {}' \
+                            .format(conn_type, domain_ip))
+
+    if handle is None:
+        login_limiter.release(domain_ip)
+
+    return handle
+
+def get_query_scopes(sdk_stats):
+    """
+    Return the subtrees of a UCS domain (switch-A, chassis-1, rack-unit-2,
+    fex-3, etc.) from the objects returned by the first query
+
+    Parameters:
+    sdk_stats (dictionary with class ID as key and managedobjectlist as value)
+
+    Returns:
+    List of top level rn under sys, in order of discovery
+
+    """
+
+    scopes = []
+    # dn: sys/switch-A, sys/chassis-1/blade-8, sys/rack-unit-2,
+    # sys/fex-3/slot-1/host/port-29
+    for class_id in ['NetworkElement', 'ComputeBlade', 'ComputeRackUnit',
+                     'EtherServerIntFIo']:
+        for item in sdk_stats.get(class_id, []):
+            dn_list = (item.dn).split('/')
+            if len(dn_list) < 2 or dn_list[0] != 'sys':
+                continue
+            if dn_list[1] not in scopes:
+                scopes.append(dn_list[1])
+    return scopes
+
+def query_class_chunk(domain_ip, sdk_handle, class_id, scopes):
+    """
+    Query a class ID only under the given subtrees, with retries
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    sdk_handle (UcsHandle)
+    class_id (Class ID to query)
+    scopes (list of top level rn under sys, like chassis-1)
+
+    Returns:
+    managedobjectlist
+
+    """
+
+    filter_str = '(dn, "^sys/({})/", type="re")'.format('|'.join(scopes))
+    for attempt in range(CHUNK_QUERY_RETRIES + 1):
+        try:
+            return sdk_handle.query_classid(class_id=class_id,
+                                            filter_str=filter_str)
+        except Exception as e:
+            if attempt == CHUNK_QUERY_RETRIES:
+                raise
+            logger.warning('Retry {} query for {} in {} : {} : {}' \
+                           .format(class_id, domain_ip, scopes, \
+                                   type(e).__name__, e))
+
+def query_classids_in_chunks(domain_ip, sdk_handle):
+    """
+    Query class_ids, with CHUNKED_CLASS_IDS in chunks of subtrees
+
+    All the other class IDs are queried first in one request. The subtrees
+    (chassis, rack-unit, FEX, FI) are found from it and CHUNKED_CLASS_IDS are
+    queried for up to user_args['query_chunk'] subtrees per request. The
+    chunks are queried one after the other, because UcsSession.post_elem of
+    ucsmsdk sends every request (except logout) under a module level lock
+    (tx_lock), even on separate sessions. If a chunk still fails after
+    retries, its class ID is left out of the response. The objects of its
+    other chunks and the subtrees of the failed chunks are returned, so that
+    query_missing_class_ids queries only the failed subtrees
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    sdk_handle (UcsHandle)
+
+    Returns:
+    Tuple of
+    - dictionary with class ID as key and managedobjectlist as value, same
+      as query_classids
+    - failed chunks : {'class ID':{'objects':[], 'scopes':[[subtrees]]}}
+
+    """
+
+    chunk_size = user_args['query_chunk']
+    query_class_ids = get_query_class_ids(domain_ip)
+    chunked_class_ids = [c for c in CHUNKED_CLASS_IDS if c in query_class_ids]
+    sdk_stats = sdk_handle.query_classids([c for c in query_class_ids \
+                                           if c not in chunked_class_ids])
+    scopes = get_query_scopes(sdk_stats)
+    chunks = []
+    for class_id in chunked_class_ids:
+        for i in range(0, len(scopes), chunk_size):
+            chunks.append((class_id, scopes[i:i + chunk_size]))
+    logger.info('Query {} for {} in {} chunks of {} subtrees' \
+                .format(chunked_class_ids, domain_ip, len(chunks), chunk_size))
+
+    failed_chunks = {}
+    for class_id in chunked_class_ids:
+        sdk_stats[class_id] = []
+    for class_id, chunk_scopes in chunks:
+        try:
+            objects = query_class_chunk(domain_ip, sdk_handle, class_id,
+                                        chunk_scopes)
+        except Exception as e:
+            logger.error('Failed {} query for {} in {} : {} : {}' \
+                         .format(class_id, domain_ip, chunk_scopes, \
+                                 type(e).__name__, e))
+        else:
+            sdk_stats[class_id].extend(objects)
+            continue
+        if class_id not in failed_chunks:
+            failed_chunks[class_id] = {'objects':sdk_stats[class_id],
+                                       'scopes':[]}
+        failed_chunks[class_id]['scopes'].append(chunk_scopes)
+    for class_id in failed_chunks:
+        del sdk_stats[class_id]
+
+    return sdk_stats, failed_chunks
+
+def query_failed_chunks(domain_ip, sdk_handle, sdk_stats, failed_chunks):
+    """
+    Query again only the failed chunks of CHUNKED_CLASS_IDS and merge them.
+    A class ID is added to sdk_stats when none of its chunks is left
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    sdk_handle (UcsHandle)
+    sdk_stats (dictionary with class ID as key and managedobjectlist as value)
+    failed_chunks (as returned by query_classids_in_chunks)
+
+    Returns:
+    None
+
+    """
+
+    for class_id, failed in list(failed_chunks.items()):
+        remaining_scopes = []
+        for chunk_scopes in failed['scopes']:
+            try:
+                failed['objects'].extend(query_class_chunk(domain_ip, \
+                                    sdk_handle, class_id, chunk_scopes))
+            except Exception as e:
+                logger.warning('Failed {} query for {} in {} : {} : {}' \
+                               .format(class_id, domain_ip, chunk_scopes, \
+                                       type(e).__name__, e))
+                remaining_scopes.append(chunk_scopes)
+        failed['scopes'] = remaining_scopes
+        if not remaining_scopes:
+            sdk_stats[class_id] = failed['objects']
+            del failed_chunks[class_id]
+
+def query_missing_class_ids(domain_ip, sdk_handle, sdk_stats, failed_chunks,
+                            deadline, query_time):
+    """
+    Query again only the class IDs missing in the response of a domain
+
+    Some UCS domains occasionally do not return some (or all) class IDs.
+    Instead of skipping the domain while parsing, query only the missing
+    class IDs, up to MISSING_CLASS_ID_RETRIES times, as long as the
+    query is expected to complete before the deadline. For a class ID
+    with failed chunks, only the failed chunks are queried
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    sdk_handle (UcsHandle)
+    sdk_stats (dictionary with class ID as key and managedobjectlist as value)
+    failed_chunks (as returned by query_classids_in_chunks)
+    deadline (time by which the pull of the domain must complete)
+    query_time (time taken by the last query, as an estimate)
+
+    Returns:
+    sdk_stats, updated with the class IDs returned by the retries
+
+    """
+
+    query_class_ids = get_query_class_ids(domain_ip)
+    for attempt in range(1, MISSING_CLASS_ID_RETRIES + 1):
+        missing_class_ids = [c for c in query_class_ids if c not in sdk_stats]
+        if not missing_class_ids:
+            break
+        if time.time() + query_time > deadline:
+            logger.warning('No time left to query missing class ID(s) for ' \
+                           '{}. Missing:{}'.format(domain_ip, \
+                                                   missing_class_ids))
+            break
+        logger.warning('Query missing class ID(s) for {}, attempt {}. ' \
+                       'Missing:{}'.format(domain_ip, attempt, \
+                                           missing_class_ids))
+        query_start = time.time()
+        query_failed_chunks(domain_ip, sdk_handle, sdk_stats, failed_chunks)
+        missing_class_ids = [c for c in missing_class_ids \
+                                if c not in failed_chunks and c not in sdk_stats]
+        try:
+            if missing_class_ids:
+                sdk_stats.update(sdk_handle.query_classids(missing_class_ids))
+        except Exception as e:
+            logger.warning('Query of missing class ID(s) failed for {} : ' \
+                           '{} : {}'.format(domain_ip, type(e).__name__, e))
+        query_time = time.time() - query_start
+
+    return sdk_stats
+
+def query_sdk_stats(domain_ip, sdk_handle):
+    """
+    Query class_ids, in one request or in chunks with --query-chunk
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    sdk_handle (UcsHandle)
+
+    Returns:
+    Tuple of dictionary with class ID as key and managedobjectlist as value
+    and failed chunks, as returned by query_classids_in_chunks
+
+    """
+
+    if user_args.get('query_chunk'):
+        return query_classids_in_chunks(domain_ip, sdk_handle)
+    return sdk_handle.query_classids(get_query_class_ids(domain_ip)), {}
+
+def read_cli_table(domain_ip, cli_handle, prompt, command, reader):
+    """
+    Run a command on a netmiko session and feed its output to a
+    CliTableReader, line by line as read_channel() returns it, until the
+    output ends with the prompt. Only a partial line is kept between reads
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    cli_handle (netmiko.ConnectHandler)
+    prompt (prompt of NX-OS, as returned by find_prompt())
+    command (NX-OS command)
+    reader (CliTableReader)
+
+    Returns:
+    rows of the reader
+
+    """
+
+    timeout = user_args.get('conn_timeout')
+    cli_handle.write_channel(command + '\n')
+    pending = ''
+    deadline = time.time() + timeout
+    while pending.rstrip() != prompt:
+        data = cli_handle.read_channel()
+        if not data:
+            # No output in timeout seconds
+            if time.time() > deadline:
+                raise TimeoutError('No prompt from {} in {}s. Last line : {}' \
+                                   .format(domain_ip, timeout, pending))
+            time.sleep(CLI_POLL_INTERVAL)
+            continue
+        deadline = time.time() + timeout
+        lines = (pending + data.replace('\r', '')).split('\n')
+        pending = lines.pop()
+        # The echo of the command is fed too. It has no marker
+        for line in lines:
+            reader.feed(line)
+    return reader.rows
+
+def get_cli_pull_types(domain_ip):
+    """
+    Return the stats types of cli_stats_types to pull from a domain
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+
+    Returns:
+    List of stats types. Empty if CLI of the domain is skipped
+
+    """
+
+    if user_args.get('no_ssh'):
+        logger.warning('Skipping CLI metrics due to --no-ssh flag for {}'. \
+                       format(domain_ip))
+        return []
+    if domain_ip in protection:
+        logger.info('Skipping CLI metrics for {}. In protection mode' \
+                    .format(domain_ip))
+        return []
+    cli_types = [t for t in get_cli_stats_types(domain_ip) \
+                    if cli_stats_types[t][2]['scope'] == 'fi']
+    if not cli_types:
+        logger.info('Skipping CLI metrics for {}. Not supported by {}' \
+                    .format(domain_ip, \
+                            capabilities[domain_ip].get('profile')))
+    return cli_types
+
+def connect_and_pull_stats(handle_list):
+    """
+    Wrapper to connect to UCS domains and pull stats for handle_list
+
+    Must be multithreading aware. Do not update any global dictionary here.
+    Everything is returned in a PullResult which is merged by
+    merge_pull_result() in the main thread
+
+    Parameters:
+    handle_list (list of IP,handle type,handle). Handle type can be cli or sdk
+
+    Returns:
+    PullResult
+
+    """
+
+    domain_ip = handle_list[0]
+    handle_type = handle_list[1]
+    fi_id_list = ['A', 'B']
+    handles = {}
+    times = {}
+
+    if handle_type == 'cli':
+        cli_types = get_cli_pull_types(domain_ip)
+        if not cli_types:
+            return PullResult(domain_ip, handle_type, handles, None, times,
+                              None)
+        times['cli_start'] = time.time()
+        cli_handle = handle_list[2]
+        if cli_handle is None or not cli_handle.is_alive():
+            # logger.info('Invalid or dead cli_handle for {}'.format(domain_ip))
+            if cli_handle is not None:
+                login_limiter.release(domain_ip)
+            cli_handle = set_ucs_connection(domain_ip, 'cli')
+            if cli_handle is not None:
+                times['cli_login'] = time.time()
+                logger.info('Connection type cli UP for {} in {}s' \
+                            .format(domain_ip, round((times['cli_login'] - \
+                                                      times['cli_start']), 2)))
+        handles['cli'] = cli_handle
+        if cli_handle is None:
+            return PullResult(domain_ip, handle_type, handles, None, times,
+                              'Invalid cli_handle')
+
+        cli_stats = {}
+        error = None
+
+        logger.info('CLI pull Starting on {} FI-{}' \
+                    .format(domain_ip, fi_id_list))
+        try:
+            for fi_id in fi_id_list:
+                logger.info('Connect to NX-OS FI-{} for {}'.format(fi_id, domain_ip))
+                cli_handle.send_command('connect nxos ' + fi_id, expect_string='#')
+                nxos_prompt = cli_handle.find_prompt()
+                logger.info('Connected. Now run commands FI-{} {}' \
+                             .format(fi_id, domain_ip))
+                cli_stats[fi_id] = {}
+                for stats_type in cli_types:
+                    stats_item = cli_stats_types[stats_type]
+                    # Keep only the rows, not the output
+                    cli_stats[fi_id][stats_type] = read_cli_table(domain_ip,
+                                    cli_handle, nxos_prompt, stats_item[0],
+                                    CliTableReader(stats_type))
+                    logger.info('-- {} -- on {} FI-{}'\
+                                    .format(stats_item[0], domain_ip, fi_id))
+                cli_handle.send_command('exit', expect_string='#')
+        except Exception as e:
+            error = 'CLI pull failed : {} : {}'.format(type(e).__name__, e)
+
+        times['cli_end'] = time.time()
+        logger.info('CLI pull completed on {} in {}s'. \
+                    format(domain_ip, round((times['cli_end'] - \
+                                             times.get('cli_login', 0)), 2)))
+        return PullResult(domain_ip, handle_type, handles, cli_stats, times,
+                          error)
+
+    if handle_type == 'sdk':
+        sdk_handle = handle_list[2]
+        if user_args.get('tick_aligned'):
+            wait_for_collection_tick(domain_ip)
+        times['sdk_start'] = time.time()
+        conn_time = 0
+        if sdk_handle is not None and \
+                        'sdk_time' in pickled_connections[domain_ip]:
+            conn_time = pickled_connections[domain_ip]['sdk_time']
+            # Do no refresh all the connections at the same time
+            conn_refresh_time = CONNECTION_REFRESH_INTERVAL + \
+                                    random.randint(1, 1500)
+            logger.info('SDK connection for {}. Time:{}, Elapsed:{},' \
+                        ' Refresh:{}'.format(domain_ip, conn_time, \
+                         ((int(time.time())) - conn_time), conn_refresh_time))
+            if (int(time.time())) - conn_time > conn_refresh_time:
+                logger.info('SDK connection refresh time for {}'. \
+                            format(domain_ip))
+                sdk_handle.logout()
+
+        if sdk_handle is None or not sdk_handle.is_valid():
+            logger.warning('Invalid or dead sdk_handle for {}'. \
+                            format(domain_ip))
+            if sdk_handle is not None:
+                # Logged out for refresh or expired
+                login_limiter.release(domain_ip)
+            sdk_handle = set_ucs_connection(domain_ip, 'sdk')
+            if sdk_handle is None:
+                handles['sdk'] = sdk_handle
+                handles['sdk_time'] = 0
+                return PullResult(domain_ip, handle_type, handles, None,
+                                  times, 'Invalid sdk_handle')
+            conn_time = int(time.time())
+            logger.info('New SDK connection time:{}'.format(conn_time))
+        else:
+            use_pooled_transport(domain_ip, sdk_handle)
+
+        handles['sdk'] = sdk_handle
+        handles['sdk_time'] = conn_time
+        times['sdk_login'] = time.time()
+
+        logger.info('Query class_ids for {}'.format(domain_ip))
+        try:
+            sdk_stats, failed_chunks = query_sdk_stats(domain_ip, sdk_handle)
+            sdk_stats = query_missing_class_ids(domain_ip, sdk_handle,
+                            sdk_stats, failed_chunks,
+                            times['sdk_start'] + user_args.get('conn_timeout'),
+                            time.time() - times['sdk_login'])
+        except Exception as e:
+            return PullResult(domain_ip, handle_type, handles, None, times,
+                    'Query failed : {} : {}'.format(type(e).__name__, e))
+        # Not queried as per the capability profile of the domain
+        for class_id in class_ids:
+            if class_id not in get_query_class_ids(domain_ip):
+                sdk_stats.setdefault(class_id, [])
+        times['sdk_end'] = time.time()
+        times.update(get_transport_times(domain_ip))
+        if user_args.get('adaptive_interval'):
+            times.update(get_collection_interval(domain_ip, sdk_handle))
+        logger.info('Query completed {}'.format(domain_ip))
+        return PullResult(domain_ip, handle_type, handles, sdk_stats, times,
+                          None)
+
+def merge_pull_result(result):
+    """
+    Merge the PullResult of a domain into the global dictionaries
+
+    Only called from the main thread. This is the only place where
+    conn_dict, response_time_dict, raw_cli_stats and raw_sdk_stats are
+    updated after the start
+
+    Parameters:
+    result (PullResult as returned by connect_and_pull_stats)
+
+    Returns:
+    None
+
+    """
+
+    global conn_dict
+    global raw_sdk_stats
+    global raw_cli_stats
+    global response_time_dict
+
+    domain_ip = result.domain_ip
+    conn_dict[domain_ip].update(result.handles)
+    response_time_dict[domain_ip].update(result.times)
+    if result.raw_stats is not None:
+        if result.handle_type == 'cli':
+            raw_cli_stats[domain_ip] = result.raw_stats
+        if result.handle_type == 'sdk':
+            raw_sdk_stats[domain_ip] = result.raw_stats
+    if result.error is not None:
+        logger.error('Exiting {} for {} : {}'.format(result.handle_type,
+                                                     domain_ip, result.error))
+
+def get_ucs_stats(domain_done=None):
+    """
+    Connect to UCS domains and pull stats
+
+    Use the global pickled_connections. If open connections do not exist or
+    dead, open new connections.
+    Each connection is pulled in a thread, which returns a PullResult. The
+    results are merged in this (main) thread as they complete.
+
+    Parameters:
+    domain_done (optional function(domain_ip), called in this thread as soon
+                 as all the pulls of a domain are merged, while the pulls of
+                 other domains continue)
+
+    Returns:
+    None
+
+    """
+
+    global pickled_connections
+    executor_list = []
+    for domain_ip, handles in pickled_connections.items():
+        if domain_ip not in stats_dict:
+            # Not due with --adaptive-interval
+            continue
         for handle_type, handle in handles.items():
             if handle_type == 'cli' or handle_type == 'sdk':
                 list_to_add = []
@@ -576,27 +2372,1316 @@ def get_ucs_stats():
                 list_to_add.append(handle)
                 executor_list.append(list_to_add)
 
-    logger.info('Connect and pull stats: executor_list : {}' \
-                 .format(executor_list))
-    '''
-    Following is a concurrent way of accessing multiple UCS domains,
-    using multithreading
-    '''
-    with \
-        concurrent.futures.ThreadPoolExecutor(max_workers=(len(executor_list)))\
-        as e:
-        for executor in executor_list:
-            e.submit(connect_and_pull_stats, executor)
+    logger.info('Connect and pull stats: executor_list : {}' \
+                 .format(executor_list))
+    if not executor_list:
+        return
+    # Number of pulls not yet merged per domain
+    pending_pulls = Counter(executor[0] for executor in executor_list)
+    # With --async-ssh, CLI pulls run on the event loop of ssh_engine
+    async_list = []
+    if ssh_engine is not None:
+        async_list = [executor for executor in executor_list \
+                        if executor[1] == 'cli']
+        executor_list = [executor for executor in executor_list \
+                            if executor[1] != 'cli']
+    '''
+    Following is a concurrent way of accessing multiple UCS domains,
+    using multithreading
+    '''
+    with \
+        concurrent.futures.ThreadPoolExecutor( \
+                                max_workers=max(1, len(executor_list))) as e:
+        future_to_executor = {e.submit(connect_and_pull_stats, executor): \
+                                executor for executor in executor_list}
+        for executor in async_list:
+            future_to_executor[ssh_engine.submit(executor[0])] = executor
+        for future in concurrent.futures.as_completed(future_to_executor):
+            # Do not keep the PullResult (and raw stats) after merge
+            executor = future_to_executor.pop(future)
+            try:
+                result = future.result()
+            except Exception as exc:
+                logger.exception('Exception in {} pull for {} : {} : {}' \
+                                 .format(executor[1], executor[0], \
+                                         type(exc).__name__, exc))
+            else:
+                merge_pull_result(result)
+                del result
+            pending_pulls[executor[0]] -= 1
+            if domain_done is not None and pending_pulls[executor[0]] == 0:
+                try:
+                    domain_done(executor[0])
+                except Exception as exc:
+                    logger.exception('Exception after pull for {} : {} : {}' \
+                                     .format(executor[0], \
+                                             type(exc).__name__, exc))
+
+    '''
+    Following is a non-concurrent way of accessing multiple UCS domains
+    for executor in executor_list:
+        merge_pull_result(connect_and_pull_stats(executor))
+    '''
+
+def warm_up_connection(domain_ip, handles):
+    """
+    Login (SDK and SSH) to a domain if its session from the previous cycle is
+    not valid anymore. Used before a cycle with --daemon
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    handles (dictionary of cli, sdk and sdk_time from pickled_connections)
+
+    Returns:
+    Dictionary of new handles to update pickled_connections
+
+    """
+
+    new_handles = {}
+    sdk_handle = handles.get('sdk')
+    if sdk_handle is None or not sdk_handle.is_valid():
+        if sdk_handle is not None:
+            login_limiter.release(domain_ip)
+        # Do not keep a released session, even if the login fails
+        sdk_handle = set_ucs_connection(domain_ip, 'sdk')
+        new_handles['sdk'] = sdk_handle
+        new_handles['sdk_time'] = 0 if sdk_handle is None else \
+                                    int(time.time())
+    if not user_args.get('no_ssh') and ssh_engine is None:
+        cli_handle = handles.get('cli')
+        if cli_handle is None or not cli_handle.is_alive():
+            if cli_handle is not None:
+                login_limiter.release(domain_ip)
+            cli_handle = set_ucs_connection(domain_ip, 'cli')
+            new_handles['cli'] = cli_handle
+    return new_handles
+
+def warm_up_connections():
+    """
+    Resolve names and login to domains before a cycle with --daemon, so that
+    the cycle is spent on queries
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    warm_up_start = time.time()
+    resolve_domains()
+    with concurrent.futures.ThreadPoolExecutor( \
+            max_workers=len(pickled_connections)) as e:
+        future_to_domain = {e.submit(warm_up_connection, domain_ip, handles): \
+                domain_ip for domain_ip, handles in pickled_connections.items()}
+        if ssh_engine is not None and not user_args.get('no_ssh'):
+            for domain_ip in pickled_connections:
+                future_to_domain[ssh_engine.submit_warm_up(domain_ip)] = \
+                                                                    domain_ip
+        for future in concurrent.futures.as_completed(future_to_domain):
+            domain_ip = future_to_domain[future]
+            try:
+                pickled_connections[domain_ip].update(future.result())
+            except Exception as exc:
+                logger.exception('Exception in warm up for {} : {} : {}' \
+                                 .format(domain_ip, type(exc).__name__, exc))
+    logger.info('Warm up done in {}s'.format(round(time.time() - \
+                                                   warm_up_start, 3)))
+
+def carry_over_connections():
+    """
+    With --daemon, use the sessions of this cycle in the next cycle
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    for domain_ip in domain_dict:
+        handles = conn_dict.get(domain_ip, {})
+        pickled_connections[domain_ip] = {'cli':handles.get('cli'),
+                                          'sdk':handles.get('sdk'),
+                                          'sdk_time':handles.get('sdk_time', 0)}
+
+def cleanup_ucs_connections():
+    """
+    Clean up UCS connections from the global conn_dict
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+    for domain_ip, handles in conn_dict.items():
+        cli_handle = handles.get('cli')
+        sdk_handle = handles.get('sdk')
+        logger.debug('Disconnect/Logout session for {} : CLI : {}, SDK : {}'. \
+                    format(domain_ip, cli_handle, sdk_handle))
+        # Handle is None if login failed or not allowed by login_limiter
+        if cli_handle is not None:
+            cli_handle.disconnect()
+            login_limiter.release(domain_ip)
+        if sdk_handle is not None:
+            sdk_handle.logout()
+            login_limiter.release(domain_ip)
+    if ssh_engine is not None:
+        ssh_engine.close()
+
+    # Write an empty dictionary in pickle_file for next time
+    pickle_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.pickle'
+    empty_dict = {}
+
+    try:
+        pickle_file = open(pickle_file_name, 'w+b')
+    except Exception as e:
+        logger.exception('Error in opening {} : {} : {}. Exit.' \
+                        .format(pickle_file_name, type(e).__name__, e))
+    else:
+        logger.info('No pickle sessions for next time in {}' \
+                        .format(pickle_file_name))
+        pickle.dump(empty_dict, pickle_file)
+        pickle_file.close()
+
+def pickle_connections():
+    """
+    Pickle the global pickled_connections dictionary
+
+    The saved sessions are to be used next time instead of opening a new
+    session everytime
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    if user_args['dont_save_sessions']:
+        logger.debug('-dss flag. Do not pickle sessions. Clean up now')
+        cleanup_ucs_connections()
+        return
+
+    global conn_dict
+    pickle_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.pickle'
+
+    '''
+    Following block of code sets all the cli_handle to None because they
+    can't be pickled. Leave it as it is until a solution is found
+    Do this at the very end to avoid any access issues with conn_dict
+    '''
+    for domain_ip, handles in conn_dict.items():
+        handles['cli'] = None
+    if ssh_engine is not None:
+        ssh_engine.close()
+
+    try:
+        pickle_file = open(pickle_file_name, 'w+b')
+    except Exception as e:
+        logger.exception('Error in opening {} : {} : {}. Exit.' \
+                        .format(pickle_file_name, type(e).__name__, e))
+    else:
+        logger.info('Pickle sessions for next time in {} : {}' \
+                        .format(pickle_file_name, conn_dict))
+        pickle.dump(conn_dict, pickle_file)
+        pickle_file.close()
+
+###############################################################################
+# END: Connection and Collector functions
+###############################################################################
+
+###############################################################################
+# BEGIN: Counter store
+###############################################################################
+
+def counter_to_int(value):
+    '''
+    Counters are returned by UCS as strings like 1234 or 1234.0
+    Return int or None if the value can not be parsed
+    '''
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return int(float(value))
+        except (TypeError, ValueError):
+            return None
+
+class CounterStore(object):
+    """
+    Columnar store of counters for one UCS domain
+
+    Every record in stats_dict with counters (FI port, backplane port, vif)
+    gets a row. The record carries the row number as counter_row and
+    records[row] points back to the record. Each metric in COUNTER_METRICS
+    is a column of 64-bit signed integers with a matching presence column,
+    so that a counter not returned by UCS is not confused with 0.
+
+    Rates, utilization against the port speed, totals, sums per group (like
+    per chassis) and conversion to text work on full columns. With numpy,
+    these are vectorized array operations on the same memory (no copy).
+
+    """
+
+    def __init__(self):
+        self.records = []
+        self.groups = []
+        self.kinds = []
+        self.columns = {}
+        self.present = {}
+        for metric in COUNTER_METRICS:
+            self.columns[metric] = array('q')
+            self.present[metric] = array('b')
+
+    def __len__(self):
+        return len(self.records)
+
+    def get_row(self, record, group, kind):
+        """
+        Return the row of a record, allocating a new row if required
+
+        Parameters:
+        record (dictionary in stats_dict for a FI port, bp port or vif)
+        group (chassis-1, fex-2, rack-unit-3, FI-A. Used by sum_by_group)
+        kind (fi_port, bp_port or vif)
+
+        Returns:
+        row (int)
+
+        """
+
+        row = record.get('counter_row')
+        if row is None:
+            row = len(self.records)
+            record['counter_row'] = row
+            self.records.append(record)
+            self.groups.append(group)
+            self.kinds.append(kind)
+            for metric in COUNTER_METRICS:
+                self.columns[metric].append(0)
+                self.present[metric].append(0)
+        return row
+
+    def set(self, row, metric, value):
+        val = counter_to_int(value)
+        if val is None:
+            logger.debug('Ignoring non-integer %s:%s for %s',
+                         metric, value, self.records[row])
+            return
+        self.columns[metric][row] = val
+        self.present[metric][row] = 1
+
+    def clear(self, metric):
+        '''
+        Remove the values of a counter from all rows
+        '''
+        self.present[metric] = array('b', bytes(len(self.records)))
+
+    def get(self, row, metric):
+        if row is None or not self.present[metric][row]:
+            return None
+        return self.columns[metric][row]
+
+    def column(self, metric):
+        if numpy is None:
+            return self.columns[metric]
+        return numpy.frombuffer(self.columns[metric], dtype=numpy.int64)
+
+    def mask(self, metric):
+        if numpy is None:
+            return self.present[metric]
+        return numpy.frombuffer(self.present[metric], dtype=numpy.int8) \
+                    .astype(bool)
+
+    def speeds(self):
+        '''
+        Port speed in Gbps per row from oper_speed or admin_speed of the
+        record. 0 for vifs and ports without speed
+        '''
+        speed_list = [r.get('oper_speed', r.get('admin_speed', 0)) \
+                        for r in self.records]
+        if numpy is None:
+            return speed_list
+        return numpy.array(speed_list, dtype=numpy.float64)
+
+    def rates(self, metric, interval):
+        """
+        Per second rate of a delta counter for all rows
+
+        Parameters:
+        metric (one of COUNTER_METRICS)
+        interval (UCS stats collection interval in seconds)
+
+        Returns:
+        list or numpy array of rates, 0 for rows without the counter
+
+        """
+
+        if numpy is None:
+            return [(v / interval if p else 0.0) for v, p in \
+                        zip(self.columns[metric], self.present[metric])]
+        return numpy.where(self.mask(metric), self.column(metric), 0) / \
+                    interval
+
+    def utilization(self, metric, interval):
+        '''
+        Utilization in percent of a bytes counter against the port speed.
+        0 for rows without speed
+        '''
+        rates = self.rates(metric, interval)
+        speeds = self.speeds()
+        if numpy is None:
+            return [(r * 8 * 100 / (s * 1e9) if s else 0.0) for r, s in \
+                        zip(rates, speeds)]
+        util = numpy.zeros(len(self.records))
+        has_speed = speeds > 0
+        util[has_speed] = rates[has_speed] * 8 * 100 / \
+                                (speeds[has_speed] * 1e9)
+        return util
+
+    def total(self, metric, kind=None):
+        '''
+        Sum of a counter over all rows or rows of the given kind
+        '''
+        if numpy is None:
+            return sum(v for v, p, k in zip(self.columns[metric], \
+                        self.present[metric], self.kinds) if p and \
+                        (kind is None or k == kind))
+        select = self.mask(metric)
+        if kind is not None:
+            select = select & (numpy.array(self.kinds) == kind)
+        return int(self.column(metric)[select].sum())
+
+    def sum_by_group(self, metric, kind=None):
+        '''
+        Sum of a counter per group, like per chassis. Returns a dictionary
+        with group as key
+        '''
+        sums = {}
+        if numpy is None:
+            for v, p, g, k in zip(self.columns[metric], self.present[metric],
+                                  self.groups, self.kinds):
+                if p and (kind is None or k == kind):
+                    sums[g] = sums.get(g, 0) + v
+            return sums
+        select = self.mask(metric)
+        if kind is not None:
+            select = select & (numpy.array(self.kinds) == kind)
+        group_names, group_ids = numpy.unique(numpy.array(self.groups),
+                                              return_inverse=True)
+        out = numpy.zeros(len(group_names), dtype=numpy.int64)
+        numpy.add.at(out, group_ids[select], self.column(metric)[select])
+        counts = numpy.bincount(group_ids[select],
+                                minlength=len(group_names))
+        for group, total, count in zip(group_names.tolist(), out.tolist(),
+                                       counts.tolist()):
+            if count:
+                sums[group] = total
+        return sums
+
+    def serialize(self):
+        """
+        Convert all counters to text in bulk, column by column
+
+        Parameters:
+        None
+
+        Returns:
+        List with one dictionary per row. Key is the metric, value is the
+        counter as string. Metrics without a value for the row are missing
+
+        """
+
+        text = [{} for _ in range(len(self.records))]
+        for metric in COUNTER_METRICS:
+            if numpy is None:
+                col = self.columns[metric]
+                for row, p in enumerate(self.present[metric]):
+                    if p:
+                        text[row][metric] = str(col[row])
+            else:
+                mask = self.mask(metric)
+                for row, val in zip(numpy.flatnonzero(mask).tolist(),
+                                    self.column(metric)[mask].tolist()):
+                    text[row][metric] = str(val)
+        return text
+
+    def fold_into_records(self):
+        '''
+        Copy counters back into the stats_dict records. Used only for
+        the dict output format
+        '''
+        for row, counters in enumerate(self.serialize()):
+            self.records[row].update(counters)
+
+def set_counters(domain_ip, record, group, kind, counters):
+    """
+    Store counters of a record in the CounterStore of the domain
+
+    Must be called from the thread parsing the domain.
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    record (dictionary in stats_dict for a FI port, bp port or vif)
+    group (chassis-1, fex-2, rack-unit-3, FI-A)
+    kind (fi_port, bp_port or vif)
+    counters (iterable of (metric, value))
+
+    Returns:
+    None
+
+    """
+
+    store = counter_stores[domain_ip]
+    row = store.get_row(record, group, kind)
+    for metric, value in counters:
+        store.set(row, metric, value)
+
+###############################################################################
+# END: Counter store
+###############################################################################
+
+###############################################################################
+# BEGIN: Topology cache
+###############################################################################
+
+def read_topology_cache():
+    """
+    Read the stitched topology of UCS domains saved by the previous execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global topology_cache
+    global topology_cache_changed
+    topology_cache = read_state_file('topology')
+    topology_cache_changed = False
+
+def save_topology_cache():
+    """
+    Save the stitched topology of UCS domains for the next execution, if it
+    changed
+
+    Only the domains in the input file are saved
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global topology_cache_changed
+    if not topology_cache_changed:
+        return
+    topology_cache_changed = False
+    write_state_file('topology', {domain_ip:topology for domain_ip, topology \
+                        in topology_cache.items() if domain_ip in domain_dict})
+
+def get_topology_hash(items, attrs):
+    '''
+    Return a hash of the given attributes of all the objects of a class.
+    The attributes are joined into one text and hashed once. Per object
+    hashing costs about as much as stitching the topology
+    '''
+    getter = operator.attrgetter(*attrs)
+    try:
+        text = '\x1e'.join(['\x1f'.join(getter(item)) for item in items])
+    except TypeError:
+        # An attribute is not a string
+        text = '\x1e'.join(['\x1f'.join(map(str, getter(item))) \
+                                for item in items])
+    return hashlib.sha1(text.encode('utf-8', 'replace')).hexdigest()
+
+def stitch_fi_server_ports(pathep):
+    """
+    Map IOM backplane ports to FI server ports using FabricPathEp
+
+    Go through FabricPathEp twice, first when locale is chassis and again
+    when locale is server.
+    Read the documentation to understand the logic. It takes a while ...
+
+    Parameters:
+    pathep (managedobjectlist as returned by FabricPathEp)
+
+    Returns:
+    List of [dn of the backplane port, FI server port]
+
+    """
+
+    fi_server_ports = []
+    path_dict = {}
+    for item in pathep:
+        if 'fex' in item.dn:
+            continue
+        # dn format: sys/chassis-1/blade-3/fabric-A/path-1/ep-mux
+        # peer_dn format: sys/chassis-1/slot-2/host/port-5
+        if item.locale == 'chassis' and 'blade' in item.dn:
+            dn_list = (item.dn).split('/')
+            peer_dn_list = (item.peer_dn).split('/')
+            #fi_id = (dn_list[3]).replace('fabric-', '')
+            chassis = dn_list[1]
+            path = chassis + '/' + dn_list[2] + '/' + dn_list[3] + \
+                                '/' + dn_list[4]
+            if item.c_type == 'mux' or \
+                    item.c_type == 'mux-fabricpc-to-hostport':
+                slot_id = peer_dn_list[2]
+                port_id = peer_dn_list[-1]
+            if item.c_type == 'mux-fabricport-to-hostpc' or \
+                    item.c_type == 'mux-fabricpc-to-hostpc':
+                slot_id = peer_dn_list[2]
+                port_id = (peer_dn_list[-1]).upper()
+            path_dict[path] = slot_id + '/host/' + port_id
+
+    for item in pathep:
+        if 'fex' in item.dn:
+            continue
+        # dn format: sys/chassis-1/blade-3/fabric-A/path-1/ep-mux-fabric
+        # peer_dn format: sys/switch-A/slot-1/switch-ether/port-3
+        if item.locale == 'server' and 'blade' in item.dn:
+            dn_list = (item.dn).split('/')
+            peer_dn_list = (item.peer_dn).split('/')
+            chassis = dn_list[1]
+            path = chassis + '/' + dn_list[2] + '/' + dn_list[3] + \
+                                '/' + dn_list[4]
+            if path not in path_dict:
+                continue
+
+            fi_slot = ''
+            fi_port = ''
+            if item.c_type == 'mux-fabric':
+                fi_slot = (peer_dn_list[2]).replace('slot-', '') + '/'
+                fi_port = (peer_dn_list[-1]).replace('port-', '')
+                if len(fi_port) == 1:
+                    fi_port = '0' + fi_port
+            if item.c_type == 'mux-fabricpc':
+                fi_port = (peer_dn_list[-1]).upper()
+
+            # Construct a DN in sys/chassis-2/slot-1/host/port-29/tx-stats
+            # format from slot and port in path_dict
+            fi_server_ports.append(['sys/' + chassis + '/' + path_dict[path],
+                                    fi_slot + fi_port])
+
+    return fi_server_ports
+
+def stitch_pinned_uplinks(dcxvc):
+    """
+    Find pinned uplink and bound veth/vfc of vifs using DcxVc
+
+    DcxVC contains pinned uplink port. If oper_border_port_id == 0, discard
+    if oper_border_slot_id, it is a port-channel
+    else, a physical port
+    dn format: sys/chassis-1/blade-2/fabric-A/path-1/vc-1355
+    dn format: sys/rack-unit-5/fabric-B/path-1/vc-1324
+
+    Parameters:
+    dcxvc (managedobjectlist of classid = DcxVc)
+
+    Returns:
+    List of [dn, vnic, switch_id, pinned uplink, dictionary of bound
+    interfaces]
+
+    """
+
+    pinned_uplinks = []
+    for item in dcxvc:
+        if item.vnic == '' or (int)(item.oper_border_port_id) == 0:
+            continue
+
+        if (int)(item.oper_border_slot_id) == 0:
+            if 'fc' in item.transport:
+                pc_prefix = 'SAN-PC-'
+            if 'ether' in item.transport:
+                pc_prefix = 'LAN-PC-'
+            pinned_uplink = pc_prefix + (str)(item.oper_border_port_id)
+        else:
+            if len(item.oper_border_port_id) == 1:
+                port_id = '0' + (str)(item.oper_border_port_id)
+            else:
+                port_id = (str)(item.oper_border_port_id)
+            pinned_uplink = (str)(item.oper_border_slot_id) + '/' + port_id
+
+        bound = {}
+        if 'fc' in item.transport:
+            bound['bound_vfc'] = 'vfc' + (str)(item.id)
+            bound['bound_veth'] = 'veth' + (str)(item.fcoe_id)
+        if 'ether' in item.transport:
+            bound['bound_veth'] = 'veth' + (str)(item.id)
+
+        pinned_uplinks.append([item.dn, item.vnic, item.switch_id,
+                               pinned_uplink, bound])
+
+    return pinned_uplinks
+
+# Key is the name of a stitched topology, value is a list of the class ID,
+# attributes which decide the topology and the function to stitch it
+topology_types = {
+    'fi_server_ports':['FabricPathEp',
+                       ('dn', 'locale', 'c_type', 'peer_dn'),
+                       stitch_fi_server_ports],
+    'pinned_uplinks':['DcxVc',
+                      ('dn', 'vnic', 'switch_id', 'transport', 'id',
+                       'fcoe_id', 'oper_border_port_id',
+                       'oper_border_slot_id'),
+                      stitch_pinned_uplinks]
+    }
+
+def get_topology(domain_ip, topology_name, items):
+    """
+    Return a stitched topology of a UCS domain from topology_cache
+
+    The topology is stitched again only if the hash of the objects which
+    decide it is different from the cached hash
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    topology_name (key in topology_types)
+    items (managedobjectlist of the class ID of the topology)
+
+    Returns:
+    Stitched topology, as returned by the stitch function
+
+    """
+
+    class_id, attrs, stitch = topology_types[topology_name]
+    topology_hash = get_topology_hash(items, attrs)
+    if domain_ip not in topology_cache:
+        topology_cache[domain_ip] = {}
+    domain_topology = topology_cache[domain_ip]
+    cached = domain_topology.get(topology_name)
+    if cached is not None and cached['hash'] == topology_hash:
+        logger.debug('Topology {} unchanged for {}'.format(topology_name,
+                                                           domain_ip))
+        return cached['topology']
+
+    logger.info('Stitch topology {} for {} from {} {}'.format(topology_name,
+                    domain_ip, len(items), class_id))
+    topology = stitch(items)
+    domain_topology[topology_name] = {'hash':topology_hash,
+                                      'topology':topology}
+    global topology_cache_changed
+    topology_cache_changed = True
+    return topology
+
+###############################################################################
+# END: Topology cache
+###############################################################################
+
+###############################################################################
+# BEGIN: Adaptive polling
+
+def read_domain_schedule():
+    """
+    Read polling intervals of UCS domains saved by the previous execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global domain_schedule
+    domain_schedule = read_state_file('schedule')
+
+def save_domain_schedule():
+    """
+    Save polling intervals of UCS domains for the next execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    if not user_args['adaptive_interval']:
+        return
+    write_state_file('schedule', {domain_ip:schedule for domain_ip, \
+            schedule in domain_schedule.items() if domain_ip in domain_dict})
+
+def get_interval_seconds(interval):
+    '''
+    Convert UCSM interval like 30seconds, 1minute, 2minutes to seconds
+    '''
+    match = re.match(r'(\d+)(second|minute|hour)', interval)
+    if match is None:
+        return None
+    return int(match.group(1)) * {'second':1, 'minute':60,
+                                  'hour':3600}[match.group(2)]
+
+def get_collection_interval(domain_ip, sdk_handle):
+    """
+    Query stats collection policies (adapter, port, chassis, etc.) of a UCS
+    domain, once in COLLECTION_POLICY_REFRESH seconds. UCSM does not update
+    the stats faster than the shortest collection interval
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    sdk_handle (UcsHandle)
+
+    Returns:
+    Dictionary to update response_time_dict. Empty if not queried
+
+    """
+
+    schedule = domain_schedule.get(domain_ip, {})
+    if time.time() - schedule.get('collection_time', 0) < \
+                                            COLLECTION_POLICY_REFRESH:
+        return {}
+    try:
+        policies = sdk_handle.query_classid('StatsCollectionPolicy')
+    except Exception as e:
+        logger.warning('Unable to query StatsCollectionPolicy from {} : {} ' \
+                       ': {}'.format(domain_ip, type(e).__name__, e))
+        return {}
+    intervals = [get_interval_seconds(policy.collection_interval) for \
+                    policy in policies]
+    intervals = [interval for interval in intervals if interval is not None]
+    if not intervals:
+        return {}
+    logger.info('Stats collection interval of {} : {}s'.format(domain_ip, \
+                                                            min(intervals)))
+    return {'collection_interval':min(intervals)}
+
+def skip_domains_not_due():
+    """
+    With --adaptive-interval, remove the domains whose interval is not over
+    yet from this execution. Their sessions are kept as they are
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    # Execution (telegraf or --daemon) may start a bit early
+    now = time.time() + user_args['adaptive_interval'] / 2
+    for domain_ip in domain_dict:
+        next_poll = domain_schedule.get(domain_ip, {}).get('next', 0)
+        if next_poll <= now:
+            continue
+        logger.info('Skip {}. Next poll in {}s'.format(domain_ip, \
+                                            round(next_poll - time.time())))
+        stats_dict.pop(domain_ip, None)
+        counter_stores.pop(domain_ip, None)
+        response_time_dict.pop(domain_ip, None)
+        conn_dict[domain_ip] = dict(pickled_connections.get(domain_ip, {}))
+
+def update_domain_schedule(domain_ip):
+    """
+    Choose the polling interval of a domain after its stats are parsed
+
+    Base interval (--adaptive-interval) is stretched for a slow stats pull,
+    high load or low available memory of an FI and is not shorter than the
+    stats collection interval of UCSM. The interval is saved in
+    domain_schedule and stats_dict as poll_interval
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    None
+
+    """
+
+    base = user_args['adaptive_interval']
+    time_d = response_time_dict[domain_ip]
+    d_dict = stats_dict[domain_ip]
+    schedule = domain_schedule.setdefault(domain_ip, {})
+    if 'collection_interval' in time_d:
+        schedule['collection_interval'] = time_d['collection_interval']
+        schedule['collection_time'] = time.time()
+
+    start_times = [t for t in (time_d['sdk_start'], time_d['cli_start']) if t]
+    if not start_times:
+        # Not pulled. Poll again in the next execution
+        return
+    start_t = min(start_times)
+    reasons = []
+    factor = 1
+    pull_time = max(time_d['sdk_end'], time_d['cli_end']) - start_t
+    if pull_time > base * ADAPTIVE_PULL_SHARE:
+        factor = max(factor, int(pull_time / (base * ADAPTIVE_PULL_SHARE)) + 1)
+        reasons.append('pull:{}s'.format(round(pull_time, 2)))
+    for fi_id in ['A', 'B']:
+        fi_dict = d_dict.get(fi_id, {})
+        if isFloat(fi_dict.get('load')) and \
+                                    float(fi_dict['load']) > FI_LOAD_HIGH:
+            factor = max(factor, 2 * int(float(fi_dict['load']) / FI_LOAD_HIGH))
+            reasons.append('FI-{} load:{}'.format(fi_id, fi_dict['load']))
+        if isFloat(fi_dict.get('mem_available')) and \
+                            float(fi_dict['mem_available']) < FI_MEM_LOW:
+            factor = max(factor, 2)
+            reasons.append('FI-{} mem_available:{}'.format(fi_id, \
+                                                fi_dict['mem_available']))
+    interval = base * min(factor, ADAPTIVE_MAX_FACTOR)
+    collection_interval = schedule.get('collection_interval', 0)
+    if collection_interval > interval:
+        interval = base * ((collection_interval + base - 1) // base)
+        reasons.append('collection:{}s'.format(collection_interval))
+
+    # Come back to a shorter interval one step at a time
+    if interval < schedule.get('interval', base):
+        interval = max(interval, schedule['interval'] // 2)
+    schedule['interval'] = interval
+    schedule['next'] = start_t + interval
+    d_dict['poll_interval'] = interval
+    logger.info('Poll interval of {} : {}s {}'.format(domain_ip, interval, \
+                                                      reasons))
+
+# END: Adaptive polling
+###############################################################################
+
+###############################################################################
+# BEGIN: Collection tick
+
+def read_collection_ticks():
+    """
+    Read stats collection ticks of UCS domains saved by the previous
+    execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global collection_ticks
+    collection_ticks = read_state_file('ticks')
+
+def save_collection_ticks():
+    """
+    Save stats collection ticks of UCS domains for the next execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    if not user_args['tick_aligned']:
+        return
+    write_state_file('ticks', {domain_ip:tick for domain_ip, tick in \
+                        collection_ticks.items() if domain_ip in domain_dict})
+
+def get_time_collected(obj):
+    """
+    Return the latest time_collected of port stats (EtherRxStats) as seconds
+    since epoch. This is the time of UCSM, which may not be in the same time
+    zone or in sync with the local time
+
+    Parameters:
+    obj (dictionary with class ID as key and managedobjectlist as value)
+
+    Returns:
+    Seconds since epoch (float) or None
+
+    """
+
+    latest = max((item.time_collected for item in \
+                    obj.get('EtherRxStats', []) if \
+                    getattr(item, 'time_collected', None)), default=None)
+    if latest is None:
+        return None
+    try:
+        return time.mktime(time.strptime(latest[:19], '%Y-%m-%dT%H:%M:%S'))
+    except ValueError:
+        logger.warning('Unable to parse time_collected : {}'.format(latest))
+        return None
+
+def is_sample_unchanged(domain_ip, obj):
+    """
+    Learn the collection tick of a domain from the time_collected of its
+    stats and tell if the sample was already pulled last time
+
+    interval is the shortest gap between two different samples. offset is
+    the shortest gap between time_collected and the end of the SDK query,
+    which is the difference of the clocks plus a little
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    obj (dictionary with class ID as key and managedobjectlist as value)
+
+    Returns:
+    True if time_collected is same as the last time, else False
+
+    """
+
+    collected = get_time_collected(obj)
+    if collected is None:
+        return False
+    tick = collection_ticks.setdefault(domain_ip, {})
+    last = tick.get('last')
+    if last == collected:
+        return True
+    if last is not None and collected > last:
+        tick['interval'] = min(tick.get('interval', collected - last),
+                               collected - last)
+    offset = response_time_dict[domain_ip]['sdk_end'] - collected
+    if 'offset' not in tick or offset < tick['offset'] or \
+            offset - tick['offset'] > tick.get('interval', 0) + TICK_MAX_WAIT:
+        # Also reset after a change of clock
+        tick['offset'] = offset
+    tick['last'] = collected
+    logger.info('Collection tick of {} : {}'.format(domain_ip, tick))
+    return False
+
+def wait_for_collection_tick(domain_ip):
+    """
+    Wait till TICK_MARGIN seconds after the collection tick of a domain,
+    if the sample of the latest tick is already pulled or the tick is now
+
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+
+    Returns:
+    None
+
+    """
+
+    tick = collection_ticks.get(domain_ip, {})
+    if 'interval' not in tick or tick['interval'] <= 0:
+        return
+    now = time.time()
+    last_tick = tick['last'] + tick['offset']
+    latest_tick = last_tick + \
+            ((now - last_tick) // tick['interval']) * tick['interval']
+    if latest_tick > last_tick and now - latest_tick >= TICK_MARGIN:
+        # New sample is available
+        return
+    next_query = latest_tick + TICK_MARGIN
+    if next_query < now:
+        next_query = next_query + tick['interval']
+    wait = next_query - now
+    if wait > TICK_MAX_WAIT:
+        logger.info('Next collection tick of {} in {}s. Not waiting' \
+                    .format(domain_ip, round(wait, 2)))
+        return
+    logger.info('Wait {}s for collection tick of {}'.format(round(wait, 2), \
+                                                             domain_ip))
+    time.sleep(wait)
+
+# END: Collection tick
+###############################################################################
+
+###############################################################################
+# BEGIN: Capability map
+
+def read_capabilities():
+    """
+    Read capability profiles of UCS domains saved by the previous execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global capabilities
+    capabilities = read_state_file('capabilities')
+
+def save_capabilities():
+    """
+    Save capability profiles of UCS domains for the next execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    write_state_file('capabilities', {domain_ip:capability for domain_ip, \
+            capability in capabilities.items() if domain_ip in domain_dict})
+
+def get_query_class_ids(domain_ip):
+    '''
+    Return class_ids without the ones which always fail on the domain, as
+    per its capability profile
+    '''
+    failed_class_ids = capabilities.get(domain_ip, {}).get( \
+                                                'failed_class_ids', {})
+    query_class_ids = [c for c in class_ids if \
+                        c in CAPABILITY_REQUIRED_CLASS_IDS or \
+                        failed_class_ids.get(c, 0) < CAPABILITY_PROBES]
+    if domain_ip in protection:
+        protect_class_ids = set()
+        for parser, parser_class_ids in get_domain_parsers(domain_ip):
+            protect_class_ids.update(parser_class_ids)
+        query_class_ids = [c for c in query_class_ids \
+                            if c in protect_class_ids]
+    return query_class_ids
+
+def get_cli_stats_types(domain_ip):
+    '''
+    Return the stats types of cli_stats_types which work on the domain, as
+    per its capability profile
+    '''
+    failed_cli = capabilities.get(domain_ip, {}).get('failed_cli', {})
+    return [t for t in cli_stats_types if \
+                failed_cli.get(t, 0) < CAPABILITY_PROBES]
+
+def get_capability(domain_ip):
+    """
+    Return the capability profile of a domain, after the SDK stats of the
+    domain are parsed. Start a new profile if the model or the firmware has
+    changed or the profile is older than CAPABILITY_REPROBE_INTERVAL or
+    saved by an older version
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    Dictionary of the capability profile. If model and firmware are not
+    known, like for a skipped domain, the last profile of the domain. None
+    if the domain has no profile yet
+
+    """
+
+    d_dict = stats_dict[domain_ip]
+    fi_dict = d_dict.get('A', {})
+    if 'model' not in fi_dict or 'ucsm_fw_ver' not in d_dict:
+        return capabilities.get(domain_ip)
+    profile = '{}, {}, {}'.format(fi_dict['model'], d_dict['ucsm_fw_ver'],
+                                  fi_dict.get('fi_fw_sys_ver', ''))
+    capability = capabilities.get(domain_ip, {})
+    if capability.get('profile') != profile or \
+            'failed_class_ids' not in capability or \
+            time.time() - capability.get('probe_time', 0) > \
+                                            CAPABILITY_REPROBE_INTERVAL:
+        if capability.get('profile') not in (None, profile):
+            logger.warning('New profile of {} : {}. Was : {}. Probe all ' \
+                           'again'.format(domain_ip, profile, \
+                                          capability['profile']))
+        capability = {'profile':profile, 'probe_time':time.time(),
+                      'failed_class_ids':{}, 'failed_cli':{}}
+        capabilities[domain_ip] = capability
+    return capability
+
+def update_class_capabilities(domain_ip, failed_class_ids):
+    """
+    Count the class IDs which failed on a domain, due to a query error or
+    parser failure. Reset the count of the other queried class IDs, even
+    if they returned nothing
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    failed_class_ids (list of class IDs which failed in this pull)
+
+    Returns:
+    None
+
+    """
+
+    capability = get_capability(domain_ip)
+    if capability is None:
+        return
+    class_failures = capability['failed_class_ids']
+    for class_id in get_query_class_ids(domain_ip):
+        if class_id not in failed_class_ids or \
+                class_id in CAPABILITY_REQUIRED_CLASS_IDS:
+            class_failures.pop(class_id, None)
+            continue
+        class_failures[class_id] = class_failures.get(class_id, 0) + 1
+        if class_failures[class_id] == CAPABILITY_PROBES:
+            logger.warning('{} failed on {} in {} pulls. Not querying it ' \
+                           'anymore with {}'.format(class_id, domain_ip, \
+                           CAPABILITY_PROBES, capability['profile']))
+
+def update_cli_capabilities(domain_ip, fi_dict):
+    """
+    Count the CLI commands whose output on all the FIs of a domain can not
+    be used. Reset the count of a command with usable output
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    fi_dict (dictionary with FI ID as key and rows of cli_stats_types)
+
+    Returns:
+    List of stats types with usable output
+
+    """
+
+    usable = []
+    for stats_type, stats_item in cli_stats_types.items():
+        outputs = [stats_type_dict[stats_type] for stats_type_dict in \
+                    fi_dict.values() if stats_type in stats_type_dict]
+        if not outputs:
+            continue
+        if all(output is not None for output in outputs):
+            usable.append(stats_type)
+        else:
+            logger.warning('Unusable output of {} from {}'.format( \
+                                                stats_item[0], domain_ip))
+        capability = get_capability(domain_ip)
+        if capability is None:
+            continue
+        failed_cli = capability['failed_cli']
+        if stats_type in usable:
+            failed_cli.pop(stats_type, None)
+            continue
+        failed_cli[stats_type] = failed_cli.get(stats_type, 0) + 1
+        if failed_cli[stats_type] == CAPABILITY_PROBES:
+            logger.warning('Unusable output of {} from {} in {} pulls. Not ' \
+                           'running it anymore with {}'.format( \
+                           stats_item[0], domain_ip, CAPABILITY_PROBES, \
+                           capability['profile']))
+    return usable
+
+# END: Capability map
+###############################################################################
+
+###############################################################################
+# BEGIN: Protection mode
+
+def read_protection():
+    """
+    Read the domains in protection mode from the previous execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global protection
+    protection = read_state_file('protection')
+
+def save_protection():
+    """
+    Save the domains in protection mode for the next execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
 
+    write_state_file('protection', {domain_ip:state for domain_ip, state in \
+                            protection.items() if domain_ip in domain_dict})
+
+def get_domain_parsers(domain_ip):
     '''
-    Following is a non-concurrent way of accessing multiple UCS domains
-    for executor in executor_list:
-        connect_and_pull_stats(executor)
+    Return sdk_parsers, only the ones for PROTECT_MEASUREMENTS if the domain
+    is in protection mode
     '''
+    if domain_ip not in protection:
+        return sdk_parsers
+    parser_names = set()
+    for measurement in PROTECT_MEASUREMENTS:
+        parser_names.update(MEASUREMENT_PARSERS[measurement])
+    return [(parser, parser_class_ids) for parser, parser_class_ids in \
+                sdk_parsers if parser.__name__ in parser_names]
+
+def update_protection(domain_ip):
+    """
+    Start or end protection mode of a domain using load and mem_available
+    of its FIs from SwSystemStats. Start as soon as an FI is beyond
+    --protect-load or --protect-mem. End after PROTECT_RECOVER_POLLS polls
+    within the thresholds by PROTECT_HYSTERESIS
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    None
 
-def cleanup_ucs_connections():
     """
-    Clean up UCS connections from the global conn_dict
+
+    d_dict = stats_dict[domain_ip]
+    load_high = user_args['protect_load']
+    mem_low = user_args['protect_mem']
+    reasons = []
+    within_hysteresis = True
+    known = False
+    for fi_id in ['A', 'B']:
+        fi_dict = d_dict.get(fi_id, {})
+        if isFloat(fi_dict.get('load')):
+            known = True
+            load = float(fi_dict['load'])
+            if load > load_high:
+                reasons.append('FI-{} load:{}'.format(fi_id, fi_dict['load']))
+            if load > load_high * PROTECT_HYSTERESIS:
+                within_hysteresis = False
+        if isFloat(fi_dict.get('mem_available')):
+            known = True
+            mem_available = float(fi_dict['mem_available'])
+            if mem_available < mem_low:
+                reasons.append('FI-{} mem_available:{}'.format(fi_id, \
+                                                fi_dict['mem_available']))
+            if mem_available < mem_low / PROTECT_HYSTERESIS:
+                within_hysteresis = False
+    if not known:
+        # SwSystemStats not pulled. Keep the current mode
+        return
+
+    state = protection.get(domain_ip)
+    if reasons:
+        if state is None:
+            logger.warning('Protection mode for {} : {}. Pull only {}' \
+                           .format(domain_ip, reasons, PROTECT_MEASUREMENTS))
+            state = {'since':time.time()}
+            protection[domain_ip] = state
+        state['reasons'] = reasons
+        state['recover_count'] = 0
+    elif state is not None:
+        if within_hysteresis:
+            state['recover_count'] = state.get('recover_count', 0) + 1
+        else:
+            state['recover_count'] = 0
+        if state['recover_count'] >= PROTECT_RECOVER_POLLS:
+            logger.warning('Protection mode ends for {} after {}s' \
+                           .format(domain_ip, \
+                                   round(time.time() - state['since'])))
+            del protection[domain_ip]
+            state = None
+    d_dict['protected'] = 0 if state is None else 1
+
+# END: Protection mode
+###############################################################################
+
+###############################################################################
+# BEGIN: Hot-port lane
+
+def read_hot_port_config():
+    """
+    Read the hotports file with the ports to pull in the hot lane, in
+    addition to the busiest ports. Read in every full cycle and can be
+    changed without restart
 
     Parameters:
     None
@@ -605,73 +3690,306 @@ def cleanup_ucs_connections():
     None
 
     """
-    for domain_ip, handles in conn_dict.items():
-        cli_handle = handles['cli']
-        sdk_handle = handles['sdk']
-        logger.debug('Disconnect/Logout session for {} : CLI : {}, SDK : {}'. \
-                    format(domain_ip, cli_handle, sdk_handle))
-        cli_handle.disconnect()
-        sdk_handle.logout()
-
-    # Write an empty dictionary in pickle_file for next time
-    pickle_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.pickle'
-    empty_dict = {}
 
+    global hot_port_config
+    hot_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.hotports'
+    hot_port_config = {}
     try:
-        pickle_file = open(pickle_file_name, 'w+b')
+        with open(hot_file_name, 'r') as hot_file:
+            hot_port_config = json.load(hot_file)
+    except FileNotFoundError:
+        return
     except Exception as e:
-        logger.exception('Error in opening {} : {} : {}. Exit.' \
-                        .format(pickle_file_name, type(e).__name__, e))
-    else:
-        logger.info('No pickle sessions for next time in {}' \
-                        .format(pickle_file_name))
-        pickle.dump(empty_dict, pickle_file)
-        pickle_file.close()
+        logger.error('Error in loading {} : {} : {}. Only busiest ports are ' \
+                     'hot'.format(hot_file_name, type(e).__name__, e))
 
-def pickle_connections():
+def get_pfc_port_name(dn):
     """
-    Pickle the global pickled_connections dictionary
+    Return the name of a port in the output of
+    show interface priority-flow-control for the dn of the port
 
-    The saved sessions are to be used next time instead of opening a new
-    session everytime
+    sys/switch-A/slot-1/switch-ether/port-49 : Ethernet1/49
+    sys/switch-A/slot-1/switch-ether/aggr-port-25/port-1 : Br-Ethernet1/25/1
+    sys/chassis-1/slot-1/host/port-3 : Ethernet1/1/3
+    sys/fex-2/slot-1/host/port-3 : Ethernet2/1/3
 
     Parameters:
-    None
+    dn (dn of FI port or backplane port)
+
+    Returns:
+    Port name or None
+
+    """
+
+    dn_list = dn.split('/')
+    if '/switch-ether/' in dn:
+        slot_id = dn_list[2].replace('slot-', '')
+        if 'aggr-port' in dn:
+            return 'Br-Ethernet' + slot_id + '/' + \
+                    dn_list[4].replace('aggr-port-', '') + '/' + \
+                    dn_list[5].replace('port-', '')
+        return 'Ethernet' + slot_id + '/' + dn_list[4].replace('port-', '')
+    if '/host/port-' in dn:
+        c_id = dn_list[1].replace('chassis-', '').replace('fex-', '')
+        return 'Ethernet' + c_id + '/1/' + dn_list[4].replace('port-', '')
+    return None
+
+def select_hot_ports(domain_ip, obj):
+    """
+    Select the hot ports of a domain using the objects of the full cycle.
+    These are the ports in the hotports file and the --hot-ports busiest
+    (rx + tx bytes) FI and backplane ports
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    obj (dictionary with class ID as key and managedobjectlist as value)
 
     Returns:
     None
 
     """
 
-    if user_args['dont_save_sessions']:
-        logger.debug('-dss flag. Do not pickle sessions. Clean up now')
-        cleanup_ucs_connections()
-        return
+    port_bytes = Counter()
+    for item in obj.get('EtherRxStats', []) + obj.get('EtherTxStats', []):
+        port_dn = item.dn.rsplit('/', 1)[0]
+        if '/switch-ether/' not in port_dn and '/host/port-' not in port_dn:
+            continue
+        delta = counter_to_int(item.total_bytes_delta)
+        if delta is not None:
+            port_bytes[port_dn] += delta
+    bp_fi_id = {item.dn:item.switch_id for item in \
+                    obj.get('EtherServerIntFIo', [])}
+
+    dn_list = list(hot_port_config.get('domains', {}).get(domain_ip, []))
+    busiest = [port_dn for port_dn, _ in port_bytes.most_common() \
+                if port_dn not in dn_list]
+    dn_list = dn_list + busiest[:user_args['hot_port_count']]
+
+    ports = []
+    for port_dn in dn_list:
+        pfc_name = get_pfc_port_name(port_dn)
+        if pfc_name is None:
+            logger.warning('Not a FI or backplane port for hot lane of {} : ' \
+                           '{}'.format(domain_ip, port_dn))
+            continue
+        if '/switch-ether/' in port_dn:
+            fi_id = get_fi_id_from_dn(port_dn)
+        else:
+            fi_id = bp_fi_id.get(port_dn, '')
+        ports.append({'dn':port_dn, 'fi_id':fi_id, 'pfc_name':pfc_name})
+    hot_ports[domain_ip] = {'location':stats_dict[domain_ip]['location'],
+                            'ports':ports}
+    logger.info('Hot ports of {} : {}'.format(domain_ip, dn_list))
 
-    global conn_dict
-    pickle_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + '.pickle'
+def pull_hot_ports(domain_ip, handles):
+    """
+    Pull rx/tx bytes (SDK) and PFC counters (CLI) of the hot ports of a
+    domain on the sessions of the full cycle
 
-    '''
-    Following block of code sets all the cli_handle to None because they
-    can't be pickled. Leave it as it is until a solution is found
-    Do this at the very end to avoid any access issues with conn_dict
-    '''
-    for domain_ip, handles in conn_dict.items():
-        handles['cli'] = None
+    UCSM refreshes rx/tx bytes only on its collection interval. Bytes are
+    written only when time_collected changes, so that a sample is not
+    repeated in every pull of the lane
 
-    try:
-        pickle_file = open(pickle_file_name, 'w+b')
-    except Exception as e:
-        logger.exception('Error in opening {} : {} : {}. Exit.' \
-                        .format(pickle_file_name, type(e).__name__, e))
-    else:
-        logger.info('Pickle sessions for next time in {} : {}' \
-                        .format(pickle_file_name, conn_dict))
-        pickle.dump(conn_dict, pickle_file)
-        pickle_file.close()
+    Must be multithreading aware.
+
+    Parameters:
+    domain_ip (IP Address of UCS domain)
+    handles (dictionary of cli and sdk from conn_dict)
+
+    Returns:
+    List of lines in InfluxDB Line Protocol
+
+    """
+
+    ports = hot_ports[domain_ip]['ports']
+    fields = {port['dn']:{} for port in ports}
+    sdk_handle = handles.get('sdk')
+    collected = hot_port_collected.setdefault(domain_ip, {})
+    if sdk_handle is not None:
+        for class_id, rn, metric in \
+                [('EtherRxStats', 'rx-stats', 'bytes_rx_delta'),
+                 ('EtherTxStats', 'tx-stats', 'bytes_tx_delta')]:
+            filter_str = '(dn, "^({})/{}$", type="re")'.format( \
+                            '|'.join(port['dn'] for port in ports), rn)
+            for item in sdk_handle.query_classid(class_id, filter_str):
+                port_dn = item.dn.rsplit('/', 1)[0]
+                if port_dn not in fields or \
+                        collected.get(item.dn) == item.time_collected:
+                    continue
+                collected[item.dn] = item.time_collected
+                fields[port_dn][metric] = item.total_bytes_delta
+
+    cli_handle = handles.get('cli')
+    pfc_command = cli_stats_types['pfc_stats'][0]
+    pfc_outputs = {}
+    fi_list = [fi_id for fi_id in ['A', 'B'] \
+                if any(port['fi_id'] == fi_id for port in ports)]
+    if user_args.get('no_ssh'):
+        fi_list = []
+    if ssh_engine is not None and fi_list:
+        fi_tables = ssh_engine.run(domain_ip, {fi_id:['pfc_stats'] for \
+                                   fi_id in fi_list}, reuse_only=True)
+        pfc_outputs = {fi_id:tables[0] for fi_id, tables in \
+                        fi_tables.items()}
+    elif cli_handle is not None:
+        for fi_id in fi_list:
+            cli_handle.send_command('connect nxos ' + fi_id, expect_string='#')
+            pfc_outputs[fi_id] = read_cli_table(domain_ip, cli_handle,
+                                    cli_handle.find_prompt(), pfc_command,
+                                    CliTableReader('pfc_stats'))
+            cli_handle.send_command('exit', expect_string='#')
+    metrics = cli_stats_types['pfc_stats'][2]['metrics']
+    for fi_id, rows in pfc_outputs.items():
+        pfc_names = {port['pfc_name']:port['dn'] for port in ports \
+                        if port['fi_id'] == fi_id}
+        for row in rows or []:
+            if row[0] in pfc_names:
+                fields[pfc_names[row[0]]].update(zip(metrics, row[1:]))
+
+    location = hot_ports[domain_ip]['location']
+    lines = []
+    for port in ports:
+        port_fields = fields[port['dn']]
+        if not port_fields:
+            continue
+        lines.append('HotPortStats,domain=' + \
+            domain_ip + ',fi_id=' + port['fi_id'] + ',location=' + \
+            location + ',port=' + port['dn'] + ' ' + \
+            ','.join(metric + '=' + (str)(value) for metric, value in \
+                        sorted(port_fields.items())) + '\n')
+    return lines
+
+def run_hot_lane(until):
+    """
+    Pull the hot ports of all the domains every --hot-lane seconds until
+    the given time. Used between full cycles with --daemon
 
+    Parameters:
+    until (time to stop, before warm up of the next full cycle)
+
+    Returns:
+    None
+
+    """
+
+    interval = user_args['hot_lane']
+    next_pull_time = time.time() + interval
+    while next_pull_time < until:
+        time.sleep(max(0, next_pull_time - time.time()))
+        pull_start = time.time()
+        domain_list = [domain_ip for domain_ip in hot_ports \
+                        if domain_ip in domain_dict and \
+                        domain_ip not in protection and \
+                        hot_ports[domain_ip]['ports']]
+        if not domain_list:
+            return
+        with concurrent.futures.ThreadPoolExecutor( \
+                max_workers=len(domain_list)) as e:
+            future_to_domain = {e.submit(pull_hot_ports, domain_ip, \
+                                    conn_dict.get(domain_ip, {})): \
+                                domain_ip for domain_ip in domain_list}
+            for future in concurrent.futures.as_completed(future_to_domain):
+                domain_ip = future_to_domain[future]
+                try:
+                    write_influxdb_lp(future.result())
+                except Exception as exc:
+                    logger.exception('Exception in hot lane for {} : {} : {}' \
+                                     .format(domain_ip, type(exc).__name__, \
+                                             exc))
+        logger.info('Hot lane pulled {} domains in {}s'.format( \
+                        len(domain_list), round(time.time() - pull_start, 3)))
+        next_pull_time = next_pull_time + interval
+        while next_pull_time < time.time():
+            next_pull_time = next_pull_time + interval
+
+# END: Hot-port lane
 ###############################################################################
-# END: Connection and Collector functions
+
+###############################################################################
+# BEGIN: IOM/FEX CLI
+
+def read_iom_targets():
+    """
+    Read the chassis and FEX of UCS domains found by the previous execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global iom_targets
+    iom_targets = read_state_file('iom')
+
+def save_iom_targets():
+    """
+    Save the chassis and FEX of UCS domains for the next execution
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    write_state_file('iom', {domain_ip:targets for domain_ip, targets in \
+                                iom_targets.items() if domain_ip in domain_dict})
+
+def update_iom_targets(domain_ip):
+    """
+    Find the chassis and FEX with backplane ports of a domain and the FI
+    connected to each IOM/FEX, after its SDK stats are parsed. Used by the
+    IOM/FEX CLI of the next pull
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    None
+
+    """
+
+    d_dict = stats_dict[domain_ip]
+    # On UCS mini, server ports are FI ports
+    if 'UCS-FI-M-' in d_dict['A'].get('model', ''):
+        return
+    targets = {}
+    for prefix, c_dict in [('chassis-', d_dict['chassis']),
+                           ('fex-', d_dict['fex'])]:
+        for c_name, per_c_dict in c_dict.items():
+            for port_dict in per_c_dict.get('bp_ports', {}).values():
+                # Port channels of host ports are keyed as PC-<id>
+                port_ids = [port_id for port_id in port_dict \
+                                if port_id.isdigit()]
+                if not port_ids:
+                    continue
+                # All ports of a IOM/FEX are expected to carry same fi_id
+                fi_id = port_dict[port_ids[0]].get('fi_id')
+                if fi_id not in ('A', 'B'):
+                    continue
+                last_port = max(int(port_id) for port_id in port_ids)
+                targets.setdefault(fi_id, []).append( \
+                            [c_name.replace(prefix, ''), last_port])
+    if targets:
+        iom_targets[domain_ip] = targets
+
+def get_iom_pull_types(domain_ip):
+    '''
+    Return the stats types of cli_stats_types with chassis scope to pull
+    from a domain with --iom-cli
+    '''
+    if not user_args.get('iom_cli') or ssh_engine is None or \
+            user_args.get('no_ssh') or domain_ip in protection or \
+            'BackplanePortStats' not in enabled_measurements or \
+            not iom_targets.get(domain_ip):
+        return []
+    return [t for t in get_cli_stats_types(domain_ip) \
+                if cli_stats_types[t][2]['scope'] == 'chassis']
+
+# END: IOM/FEX CLI
 ###############################################################################
 
 ###############################################################################
@@ -690,7 +4008,7 @@ def isFloat(val):
     try:
         float(val)
         return True
-    except ValueError:
+    except (TypeError, ValueError):
         return False
 
 def get_speed_num_from_string(speed, item):
@@ -718,14 +4036,6 @@ def get_speed_num_from_string(speed, item):
                            stack_info=True)
             return 0
 
-def fill_fi_port_common_items(port_dict, item):
-    port_dict['if_role'] = item.if_role
-    port_dict['oper_state'] = item.oper_state
-    port_dict['admin_state'] = item.admin_state
-    # name carries description
-    port_dict['name'] = item.name
-    port_dict['oper_speed'] = get_speed_num_from_string(item.oper_speed, item)
-
 def get_vif_dict_from_dn(domain_ip, dn):
     global stats_dict
     d_dict = stats_dict[domain_ip]
@@ -775,7 +4085,7 @@ def get_vif_dict_from_dn(domain_ip, dn):
         adaptor_dict = per_blade_dict['adaptors']
 
     if adaptor not in adaptor_dict:
-        logger.debug('adaptor not in per_chassis_dict:{}'.format(adaptor))
+        logger.debug('adaptor not in per_chassis_dict:%s', adaptor)
         return None
     per_adaptor_dict = adaptor_dict[adaptor]
     if 'vifs' not in per_adaptor_dict:
@@ -847,8 +4157,8 @@ def fill_ru_dict(item, ru_dict):
             peer_type = 'FI'
             peer = ((str)(peer_dn_list[1])).replace('switch', 'FI')
     else:
-        logger.debug('Unable to decode peer_dn:{}, dn:{}'. \
-                    format(item.peer_dn, item.dn))
+        logger.debug('Unable to decode peer_dn:%s, dn:%s',
+                     item.peer_dn, item.dn)
     per_vif_dict['peer'] = peer
     per_vif_dict['peer_type'] = peer_type
     per_vif_dict['peer_port'] = peer_port
@@ -912,8 +4222,8 @@ def fill_chassis_dict(item, domain_ip):
         # peer_dn:sys/chassis-17/slot-2/shared-io-module/fabric/port-5
         if 'UCS-S' in per_blade_dict['model'] or \
             'UCSC-C3K-M4SRB' in per_blade_dict['model']:
-            logger.debug('Found S-series {} FI-{} for dn:{}'. \
-                            format(per_blade_dict['model'], fi_id, item.dn))
+            logger.debug('Found S-series %s FI-%s for dn:%s',
+                         per_blade_dict['model'], fi_id, item.dn)
             slot = blade.replace('blade-', '')
             fi_port_dict = fi_dict['fi_ports']
             for fi_port, per_fi_port_dict in fi_port_dict.items():
@@ -926,14 +4236,14 @@ def fill_chassis_dict(item, domain_ip):
                         ((per_fi_port_dict['peer_port']).split('/'))[0]
                     if per_fi_port_dict['peer'] == chassis and \
                         fi_port_peer_slot == slot:
-                        logger.debug('Found peer chassis {} and slot {}'. \
-                            format(chassis, fi_port_peer_slot))
+                        logger.debug('Found peer chassis %s and slot %s',
+                                     chassis, fi_port_peer_slot)
                         peer_type = 'FI'
                         peer_port = fi_port
                         peer = 'FI-' + fi_id
                         break
-            logger.debug('FI Server ports: peer port:{}, peer_type:{}'. \
-                            format(peer_port, peer_type))
+            logger.debug('FI Server ports: peer port:%s, peer_type:%s',
+                         peer_port, peer_type)
             # If not found connected to FI, try FEX
             if peer_type == 'unknown':
                 fex_dict = d_dict['fex']
@@ -957,14 +4267,14 @@ def fill_chassis_dict(item, domain_ip):
                                     ((per_bp_port_dict['peer_port']).split('/'))[0]
                                 if per_bp_port_dict['peer'] == chassis and \
                                     bp_port_peer_slot == slot:
-                                    logger.debug('Found peer chassis {} and slot {}'. \
-                                        format(chassis, bp_port_peer_slot))
+                                    logger.debug('Found peer chassis %s and slot %s',
+                                                 chassis, bp_port_peer_slot)
                                     peer_type = 'FEX'
                                     peer_port = bp_slot_id + '/' + bp_port_id
                                     peer = fex_id
                                     break
-            logger.debug('FEX BP ports: peer port:{}, peer_type:{}'. \
-                            format(peer_port, peer_type))
+            logger.debug('FEX BP ports: peer port:%s, peer_type:%s',
+                         peer_port, peer_type)
         else:
             # peer_dn format: sys/chassis-1/slot-1/host/port-3
             peer_dn_list = (item.peer_dn).split('/')
@@ -981,7 +4291,7 @@ def fill_chassis_dict(item, domain_ip):
             peer_type = 'IOM'
             peer = 'IOM-' + peer_slot
     else:
-        logger.debug('Unable to find blade model for dn:{}'.format(item.dn))
+        logger.debug('Unable to find blade model for dn:%s', item.dn)
 
     # Fill up now
     per_vif_dict['peer_port'] = peer_port
@@ -1173,6 +4483,462 @@ def get_fi_port_dict(d_dict, dn, transport):
 
     return port_dict
 
+'''
+Declarative mapping of UCS class IDs to records in stats_dict
+
+A record map is a list of entries, one per class ID, in the order of
+processing. Each entry is a dictionary with:
+  class_id : Class ID as returned by query_classids
+  tag      : Name used for tracing
+  dn_has   : (optional) Handle an object only if its dn has any of these
+  locate   : function(domain_ip, d_dict, item) returning (record, group)
+             record is the dictionary in stats_dict to fill (None if
+             invalid) and group is for CounterStore (FI-A, chassis-1, etc.)
+  const    : (optional) dictionary of constant values to fill
+  copy     : (optional) list of (record key, object attribute) to copy as is
+  convert  : (optional) list of (record key, object attribute, function)
+             function(value, item) returns the value to fill
+  counters : (optional) list of (metric, object attribute) for CounterStore
+  kind     : Kind of record in CounterStore, if counters are given
+  post     : (optional) function(record, item) for anything else
+compile_record_maps() compiles every entry into a handler function, once.
+'''
+
+def locate_fi(domain_ip, d_dict, item):
+    fi_id = get_fi_id_from_dn(item.dn)
+    if fi_id is None:
+        return None, None
+    return d_dict[fi_id], 'FI-' + fi_id
+
+def fi_port_locator(transport, dn_attr='dn'):
+    '''
+    Return a locator for FI ports from dn (or ep_dn for port-channel members)
+    '''
+    def locate(domain_ip, d_dict, item):
+        dn = getattr(item, dn_attr)
+        return get_fi_port_dict(d_dict, dn, transport), \
+                    'FI-' + (str)(get_fi_id_from_dn(dn))
+    return locate
+
+def bp_port_locator(create_new, dn_attr='dn'):
+    '''
+    Return a locator for backplane ports from dn (or ep_dn for port-channel
+    members)
+    '''
+    def locate(domain_ip, d_dict, item):
+        dn = getattr(item, dn_attr)
+        return get_bp_port_dict_from_dn(domain_ip, dn, create_new), \
+                    (dn.split('/'))[1]
+    return locate
+
+def locate_blade(domain_ip, d_dict, item):
+    # dn format: sys/chassis-1/blade-8
+    dn_list = (item.dn).split('/')
+    chassis = (str)(dn_list[1])
+    blade = (str)(dn_list[2])
+    chassis_dict = d_dict['chassis']
+    # By this time, the stats_dict should be fully initialized for all
+    # available chassis and blades. Still make sure of unexpected behavior
+    if chassis not in chassis_dict:
+        chassis_dict[chassis] = {}
+    per_chassis_dict = chassis_dict[chassis]
+    if 'blades' not in per_chassis_dict:
+        per_chassis_dict['blades'] = {}
+    blade_dict = per_chassis_dict['blades']
+    if blade not in blade_dict:
+        blade_dict[blade] = {}
+    return blade_dict[blade], chassis
+
+def locate_ru(domain_ip, d_dict, item):
+    # dn format: sys/rack-unit-2
+    ru = (str)(((item.dn).split('/'))[-1])
+    ru_dict = d_dict['ru']
+    if ru not in ru_dict:
+        ru_dict[ru] = {}
+    return ru_dict[ru], ru
+
+def get_service_profile(assigned_to_dn, item):
+    # assigned_to_dn format: org-root/ls-SP-blade-m200-8
+    # assigned_to_dn format: org-root/org-HX3AF240b/ls-rack-unit-8
+    service_profile = re.sub(r"^ls-(.*)", r"\1", ((assigned_to_dn.split('/'))[-1]))
+    if 'none' in item.association or len(service_profile) == 0:
+        service_profile = 'Unknown'
+    return service_profile
+
+def get_oper_state_code(oper_state, item):
+    # Numbers might be handy in front-end representations/color coding
+    if 'ok' in oper_state:
+        return 0
+    return 1
+
+def get_uplink_channel(dn, item):
+    # dn: fabric/san/B/pc-3/ep-slot-1-port-1 gives SAN-PC-3
+    dn_list = dn.split('/')
+    return (dn_list[1] + '-' + dn_list[3]).upper()
+
+def get_server_channel(dn, item):
+    # dn: fabric/server/sw-B/pc-1154/ep-slot-1-port-1 gives PC-1154
+    return ((dn.split('/'))[3]).upper()
+
+def get_bp_channel(dn, item):
+    # dn: sys/chassis-1/slot-1/host/pc-1290/ep-slot-1-port-27 gives PC-1290
+    return ((dn.split('/'))[4]).upper()
+
+def fill_fi_server_port_peer(port_dict, item):
+    # peer_dn: sys/chassis-1/slot-2/fabric/port-1 (B)
+    # peer_dn: sys/rack-unit-5/adaptor-1/ext-eth-1 (C)
+    # peer_dn: sys/chassis-2/slot-1/shared-io-module/fabric/port-4 (S)
+    # peer_dn: sys/fex-3/slot-1/fabric/port-1 (F)
+    if 'server' not in (str)(item.if_role):
+        return
+    peer_dn_list = (item.peer_dn).split('/')
+    peer, peer_type, peer_port = 'unknown', 'unknown', '0/0'
+    if 'rack-unit' in (str)(item.peer_dn):
+        peer = (str)(peer_dn_list[1])
+        peer_type = 'rack'
+        slot = (str)(peer_dn_list[-2]).replace('adaptor-','')
+        port = ((str)(peer_dn_list[-1])).replace('ext-eth-', '')
+        if len(port) == 1:
+            port = '0' + port
+        peer_port = slot + '/' + port
+    if 'chassis' in (str)(item.peer_dn):
+        peer = (str)(peer_dn_list[1])
+        peer_type = 'chassis'
+        slot = ((str)(peer_dn_list[2])).replace('slot-', '')
+        port = ((str)(peer_dn_list[-1])).replace('port-', '')
+        if len(port) == 1:
+            port = '0' + port
+        peer_port = slot + '/' + port
+        # For S-series, chassis format: S-chassis
+        if 'shared-io-module' in (str)(item.peer_dn):
+            peer_type = 'S-chassis'
+    if 'fex' in (str)(item.peer_dn):
+        peer = (str)(peer_dn_list[1])
+        peer_type = 'FEX'
+        slot = ((str)(peer_dn_list[2])).replace('slot-', '')
+        port = ((str)(peer_dn_list[-1])).replace('port-', '')
+        if len(port) == 1:
+            port = '0' + port
+        peer_port = slot + '/' + port
+    port_dict['peer'] = peer
+    port_dict['peer_type'] = peer_type
+    port_dict['peer_port'] = peer_port
+
+def fill_bp_port_peer(port_dict, item):
+    # peer_dn: sys/chassis-1/blade-8/adaptor-2/ext-eth-5
+    # peer_dn: sys/rack-unit-2/adaptor-1/ext-eth-2
+    # peer_dn: sys/chassis-17/slot-2/shared-io-module/fabric/port-5
+    peer_dn_list = (item.peer_dn).split('/')
+    if len(peer_dn_list) < 3:
+        if 'up' in (str)(item.oper_state):
+            logger.warning('oper_state up still unable to decode ' \
+                'peer_dn:{}, dn:{}'.format(item.peer_dn, item.dn))
+        else:
+            logger.debug('Unable to decode peer_dn:%s, dn:%s, oper_state:%s',
+                         item.peer_dn, item.dn, item.oper_state)
+        return
+    peer, peer_type, peer_port = 'unknown', 'unknown', '0/0'
+    # FEX connected to rack-unit
+    if 'rack-unit' in (str)(item.peer_dn):
+        peer = (str)(peer_dn_list[-3])
+        peer_type = 'rack'
+        slot = ((str)(peer_dn_list[-2])).replace('adaptor-', '')
+        port = ((str)(peer_dn_list[-1])).replace('ext-eth-', '')
+        if len(port) == 1:
+            port = '0' + port
+        peer_port = slot + '/' + port
+    # IOM within 5108 chassis
+    if 'chassis' in (str)(item.peer_dn):
+        peer = (str)(peer_dn_list[-3])
+        peer_type = 'blade'
+        slot = ((str)(peer_dn_list[-2])).replace('adaptor-', '')
+        port = ((str)(peer_dn_list[-1])).replace('ext-eth-', '')
+        if len(port) == 1:
+            port = '0' + port
+        peer_port = slot + '/' + port
+        # FEX Connected to S-series
+        if 'shared-io-module' in (str)(item.peer_dn):
+            peer = (str)(peer_dn_list[1])
+            peer_type = 'S-chassis'
+            slot = ((str)(peer_dn_list[2])).replace('slot-', '')
+            port = ((str)(peer_dn_list[-1])).replace('port-', '')
+            if len(port) == 1:
+                port = '0' + port
+            peer_port = slot + '/' + port
+    port_dict['peer'] = peer
+    port_dict['peer_type'] = peer_type
+    port_dict['peer_port'] = peer_port
+
+# Common for FcPIo, EtherPIo, FabricFcSanPc, FabricEthLanPc, FabricDceSwSrvPc
+# name carries description
+FI_PORT_COMMON_COPY = [('if_role', 'if_role'),
+                       ('oper_state', 'oper_state'),
+                       ('admin_state', 'admin_state'),
+                       ('name', 'name')]
+
+SERVER_COPY = [('association', 'association'),
+               ('oper_state', 'oper_state'),
+               ('operability', 'operability'),
+               ('admin_state', 'admin_state'),
+               ('model', 'model'),
+               ('num_cores', 'num_of_cores'),
+               ('num_cpus', 'num_of_cpus'),
+               ('memory', 'available_memory'),
+               ('serial', 'serial'),
+               ('num_adaptors', 'num_of_adaptors'),
+               ('num_vEths', 'num_of_eth_host_ifs'),
+               ('num_vFCs', 'num_of_fc_host_ifs')]
+
+SERVER_CONVERT = [('service_profile', 'assigned_to_dn', get_service_profile),
+                  ('oper_state_code', 'oper_state', get_oper_state_code)]
+
+'''
+For port-channel members (FabricFcSanPcEp, FabricEthLanPcEp,
+FabricDceSwSrvPcEp, EtherServerIntFIoPcEp) ep_dn carries the dn of the
+physical port.
+For member of a port-channel, set channel=<port_name_of_PC>
+For non-member or a port-channel, set channel=No
+For PC interfaces, do not set channel at all
+'''
+record_maps = {
+    'fi_env':[
+        {'class_id':'NetworkElement', 'tag':'net_elem', 'locate':locate_fi,
+         'copy':[('total_memory', 'total_memory'),
+                 ('oob_if_ip', 'oob_if_ip'),
+                 ('serial', 'serial'),
+                 ('model', 'model')]},
+        {'class_id':'SwSystemStats', 'tag':'system_stats',
+         'locate':locate_fi,
+         'copy':[('load', 'load'), ('mem_available', 'mem_available')]},
+        {'class_id':'MgmtEntity', 'tag':'mgmt_t', 'locate':locate_fi,
+         'copy':[('leadership', 'leadership'), ('ha_ready', 'ha_ready')]},
+        ],
+    'fi_stats':[
+        # dn: sys/switch-B/slot-1/switch-fc/port-9
+        {'class_id':'FcPIo', 'tag':'fcpio',
+         'locate':fi_port_locator('FC'), 'const':{'transport':'FC'},
+         'copy':FI_PORT_COMMON_COPY,
+         'convert':[('oper_speed', 'oper_speed', get_speed_num_from_string)]},
+        # dn: fabric/san/B/pc-3
+        {'class_id':'FabricFcSanPc', 'tag':'sanpc',
+         'locate':fi_port_locator('FC'), 'const':{'transport':'FC'},
+         'copy':FI_PORT_COMMON_COPY,
+         'convert':[('oper_speed', 'oper_speed', get_speed_num_from_string)]},
+        {'class_id':'FabricFcSanPcEp', 'tag':'sanpcep',
+         'locate':fi_port_locator('FC', 'ep_dn'),
+         'convert':[('channel', 'dn', get_uplink_channel)]},
+        # dn: sys/switch-B/slot-1/switch-ether/port-9
+        # EtherPIo also contains ports between IOM and blades. Handle them
+        # in parse_backplane_port_stats
+        {'class_id':'EtherPIo', 'tag':'ethpio', 'dn_has':['switch-'],
+         'locate':fi_port_locator('Eth'), 'const':{'transport':'Eth'},
+         'copy':FI_PORT_COMMON_COPY,
+         'convert':[('oper_speed', 'oper_speed', get_speed_num_from_string)],
+         'post':fill_fi_server_port_peer},
+        # FabricEthLanPc does not carry correct oper_speed. Use bandwidth
+        {'class_id':'FabricEthLanPc', 'tag':'lanpc',
+         'locate':fi_port_locator('Eth'), 'const':{'transport':'Eth'},
+         'copy':FI_PORT_COMMON_COPY,
+         'convert':[('oper_speed', 'bandwidth', get_speed_num_from_string)]},
+        {'class_id':'FabricEthLanPcEp', 'tag':'lanpcep',
+         'locate':fi_port_locator('Eth', 'ep_dn'),
+         'convert':[('channel', 'dn', get_uplink_channel)]},
+        # FabricDceSwSrvPc and FabricDceSwSrvPcEp are for port-channels
+        # between FI and IOMs
+        {'class_id':'FabricDceSwSrvPc', 'tag':'srvpc',
+         'locate':fi_port_locator('Eth'), 'const':{'transport':'Eth'},
+         'copy':FI_PORT_COMMON_COPY,
+         'convert':[('oper_speed', 'oper_speed', get_speed_num_from_string)]},
+        {'class_id':'FabricDceSwSrvPcEp', 'tag':'srvpcep',
+         'locate':fi_port_locator('Eth', 'ep_dn'),
+         'convert':[('channel', 'dn', get_server_channel)]},
+        {'class_id':'FcStats', 'tag':'fcstats',
+         'locate':fi_port_locator('FC'), 'kind':'fi_port',
+         'counters':[('bytes_rx_delta', 'bytes_rx_delta'),
+                     ('bytes_tx_delta', 'bytes_tx_delta')]},
+        {'class_id':'FcErrStats', 'tag':'fcerr',
+         'locate':fi_port_locator('FC'), 'kind':'fi_port',
+         'counters':[('discard_rx_delta', 'discard_rx_delta'),
+                     ('discard_tx_delta', 'discard_tx_delta'),
+                     ('crc_rx_delta', 'crc_rx_delta'),
+                     ('sync_losses_delta', 'sync_losses_delta'),
+                     ('signal_losses_delta', 'signal_losses_delta'),
+                     ('link_failures_delta', 'link_failures_delta')]},
+        # Ether*Stats also contain stats of backplane ports between IOM and
+        # blades. Handle them in parse_backplane_port_stats
+        {'class_id':'EtherRxStats', 'tag':'ethrx', 'dn_has':['switch-'],
+         'locate':fi_port_locator('Eth'), 'kind':'fi_port',
+         'counters':[('bytes_rx_delta', 'total_bytes_delta')]},
+        {'class_id':'EtherTxStats', 'tag':'ethtx', 'dn_has':['switch-'],
+         'locate':fi_port_locator('Eth'), 'kind':'fi_port',
+         'counters':[('bytes_tx_delta', 'total_bytes_delta')]},
+        {'class_id':'EtherErrStats', 'tag':'etherr', 'dn_has':['switch-'],
+         'locate':fi_port_locator('Eth'), 'kind':'fi_port',
+         'counters':[('out_discard_delta', 'out_discard_delta'),
+                     ('fcs_delta', 'fcs_delta')]},
+        {'class_id':'EtherLossStats', 'tag':'ethloss', 'dn_has':['switch-'],
+         'locate':fi_port_locator('Eth'), 'kind':'fi_port',
+         'counters':[('giants_delta', 'giants_delta')]},
+        ],
+    'compute_inventory':[
+        {'class_id':'ComputeBlade', 'tag':'blade', 'locate':locate_blade,
+         'copy':SERVER_COPY, 'convert':SERVER_CONVERT},
+        {'class_id':'ComputeRackUnit', 'tag':'ru', 'locate':locate_ru,
+         'copy':SERVER_COPY, 'convert':SERVER_CONVERT},
+        ],
+    'backplane_ports':[
+        # dn:sys/chassis-1/slot-2/host/port-30
+        # dn:sys/fex-3/slot-1/host/port-29
+        {'class_id':'EtherServerIntFIo', 'tag':'srv_fio',
+         'locate':bp_port_locator(True), 'const':{'channel':'No'},
+         'copy':[('fi_id', 'switch_id'),
+                 ('admin_state', 'admin_state'),
+                 ('oper_state', 'oper_state')],
+         'convert':[('admin_speed', 'admin_speed', get_speed_num_from_string)],
+         'post':fill_bp_port_peer},
+        # dn format: sys/chassis-1/slot-1/host/pc-1290
+        {'class_id':'EtherServerIntFIoPc', 'tag':'srv_fiopc',
+         'locate':bp_port_locator(True),
+         'copy':[('fi_id', 'switch_id'), ('oper_state', 'oper_state')],
+         'convert':[('oper_speed', 'oper_speed', get_speed_num_from_string)]},
+        # dn format: sys/chassis-1/slot-1/host/pc-1290/ep-slot-1-port-27
+        {'class_id':'EtherServerIntFIoPcEp', 'tag':'srv_fiopcep',
+         'locate':bp_port_locator(False, 'ep_dn'),
+         'convert':[('channel', 'dn', get_bp_channel)]},
+        # dn format: sys/chassis-2/slot-1/host/port-29/rx-stats
+        # Ether*Stats also contain stats of FI ports. Handle them with FI ports
+        {'class_id':'EtherRxStats', 'tag':'ethrx',
+         'dn_has':['chassis-', 'fex'],
+         'locate':bp_port_locator(False), 'kind':'bp_port',
+         'counters':[('bytes_rx_delta', 'total_bytes_delta')]},
+        {'class_id':'EtherTxStats', 'tag':'ethtx',
+         'dn_has':['chassis-', 'fex'],
+         'locate':bp_port_locator(False), 'kind':'bp_port',
+         'counters':[('bytes_tx_delta', 'total_bytes_delta')]},
+        {'class_id':'EtherErrStats', 'tag':'etherr',
+         'dn_has':['chassis-', 'fex'],
+         'locate':bp_port_locator(False), 'kind':'bp_port',
+         'counters':[('out_discard_delta', 'out_discard_delta'),
+                     ('fcs_delta', 'fcs_delta')]},
+        ]
+    }
+
+# Key is the name of record map, value is a list of (class ID, handler)
+compiled_record_maps = {}
+
+def make_attr_getter(attrs):
+    '''
+    Return a function which returns a tuple of the attributes of an object.
+    operator.attrgetter returns a tuple only for more than one attribute
+    '''
+    if len(attrs) == 1:
+        attr = attrs[0]
+        return lambda item: (getattr(item, attr),)
+    return operator.attrgetter(*attrs)
+
+def make_dn_filter(dn_has):
+    if len(dn_has) == 1:
+        first = dn_has[0]
+        return lambda dn: first in dn
+    if len(dn_has) == 2:
+        first, second = dn_has
+        return lambda dn: first in dn or second in dn
+    return lambda dn: any(s in dn for s in dn_has)
+
+def compile_record_handler(entry):
+    """
+    Compile an entry of a record map into a handler function
+
+    Everything that does not depend on the object (attribute names, keys,
+    filters, constants) is worked out here once. Attributes to copy are
+    read in one call using operator.attrgetter.
+
+    Parameters:
+    entry (dictionary, as described above record_maps)
+
+    Returns:
+    handler(domain_ip, d_dict, items, trace)
+
+    """
+
+    tag = entry['tag']
+    locate = entry['locate']
+    dn_filter = make_dn_filter(entry['dn_has']) if 'dn_has' in entry else None
+    const = dict(entry.get('const', {}))
+    copy_keys = tuple(key for key, attr in entry.get('copy', []))
+    copy_getter = make_attr_getter([attr for key, attr in \
+                        entry['copy']]) if copy_keys else None
+    convert = tuple(entry.get('convert', []))
+    metrics = tuple(metric for metric, attr in entry.get('counters', []))
+    counter_getter = make_attr_getter([attr for metric, attr in \
+                        entry['counters']]) if metrics else None
+    kind = entry.get('kind')
+    post = entry.get('post')
+
+    def handler(domain_ip, d_dict, items, trace):
+        for item in items:
+            if dn_filter is not None and not dn_filter(item.dn):
+                continue
+            if trace:
+                trace(tag, item.dn)
+            record, group = locate(domain_ip, d_dict, item)
+            if record is None:
+                logger.error('Invalid record in {} for {}\n{}'. \
+                             format(tag, domain_ip, item))
+                continue
+            if const:
+                record.update(const)
+            if copy_getter is not None:
+                record.update(zip(copy_keys, copy_getter(item)))
+            for key, attr, func in convert:
+                record[key] = func(getattr(item, attr), item)
+            if counter_getter is not None:
+                set_counters(domain_ip, record, group, kind,
+                             zip(metrics, counter_getter(item)))
+            if post is not None:
+                post(record, item)
+
+    handler.__name__ = 'handle_' + entry['class_id'] + '_' + tag
+    return handler
+
+def compile_record_maps():
+    """
+    Compile all the record maps into handler functions. Call once
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    for map_name, record_map in record_maps.items():
+        compiled_record_maps[map_name] = \
+            [(entry['class_id'], compile_record_handler(entry)) \
+                for entry in record_map]
+        logger.debug('Compiled record map {} : {}'.format(map_name, \
+                        [c for c, h in compiled_record_maps[map_name]]))
+
+def apply_record_map(domain_ip, map_name, mo_lists, trace):
+    """
+    Fill stats_dict for a domain using a compiled record map
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    map_name (key in record_maps)
+    mo_lists (dictionary with class ID as key and managedobjectlist as value)
+    trace (as returned by get_tracer)
+
+    Returns:
+    None
+
+    """
+
+    d_dict = stats_dict[domain_ip]
+    for class_id, handler in compiled_record_maps[map_name]:
+        handler(domain_ip, d_dict, mo_lists[class_id], trace)
+
 def parse_fi_env_stats(domain_ip, top_sys, net_elem, system_stats, fw, mgmt_t):
     """
     Use the output of query_classid from UCS to update global stats_dict
@@ -1191,11 +4957,13 @@ def parse_fi_env_stats(domain_ip, top_sys, net_elem, system_stats, fw, mgmt_t):
     """
 
     global stats_dict
+    trace = get_tracer(domain_ip)
     d_dict = stats_dict[domain_ip]
 
     logger.info('Parse env_stats for {}'.format(domain_ip))
     for item in top_sys:
-        logger.debug('In top_sys for {}:{}'.format(domain_ip, item.name))
+        if trace:
+            trace('top_sys', item.name)
         d_dict['mode'] = item.mode
         d_dict['name'] = item.name
         uptime_list = (item.system_up_time).split(':')
@@ -1204,49 +4972,25 @@ def parse_fi_env_stats(domain_ip, top_sys, net_elem, system_stats, fw, mgmt_t):
                         ((int)(uptime_list[2]) * 60) + (int)(uptime_list[3])
         d_dict['uptime'] = uptime
 
-    for item in net_elem:
-        logger.debug('In net_elem for {}:{}'.format(domain_ip, item.dn))
-        fi_id = get_fi_id_from_dn(item.dn)
-        if fi_id is None:
-            logger.error('Unknown FI ID from {}\n{}'.format(domain_ip, item))
-            continue
-        fi_dict = d_dict[fi_id]
-        fi_dict['total_memory'] = item.total_memory
-        fi_dict['oob_if_ip'] = item.oob_if_ip
-        fi_dict['serial'] = item.serial
-        fi_dict['model'] = item.model
-
-    for item in system_stats:
-        logger.debug('In system_stats for {}:{}'.format(domain_ip, item.dn))
-        fi_id = get_fi_id_from_dn(item.dn)
-        if fi_id is None:
-            logger.error('Unknow FI ID from {}\n{}'.format(domain_ip, item))
-            continue
-        fi_dict = d_dict[fi_id]
-        fi_dict['load'] = item.load
-        fi_dict['mem_available'] = item.mem_available
-
     for item in fw:
         if 'sys/mgmt/fw-system' in item.dn:
-            logger.debug('In fw for {}:{}'.format(domain_ip, item.dn))
+            if trace:
+                trace('fw', item.dn)
             d_dict['ucsm_fw_ver'] = item.version
         if 'sys/switch-A/mgmt/fw-system' in item.dn:
-            logger.debug('In fw for {}:{}'.format(domain_ip, item.dn))
+            if trace:
+                trace('fw', item.dn)
             d_dict['A']['fi_fw_sys_ver'] = item.version
         if 'sys/switch-B/mgmt/fw-system' in item.dn:
-            logger.debug('In fw for {}:{}'.format(domain_ip, item.dn))
+            if trace:
+                trace('fw', item.dn)
             d_dict['B']['fi_fw_sys_ver'] = item.version
 
-    for item in mgmt_t:
-        logger.debug('In mgmt_t for {}:{}'.format(domain_ip, item.dn))
-        fi_id = get_fi_id_from_dn(item.dn)
-        if fi_id is None:
-            logger.error('Unknow FI ID from {}\n{}'.format(domain_ip, item))
-            continue
-        fi_dict = d_dict[fi_id]
-        fi_dict['leadership'] = item.leadership
-        fi_dict['ha_ready'] = item.ha_ready
-
+    apply_record_map(domain_ip, 'fi_env',
+                     {'NetworkElement':net_elem,
+                      'SwSystemStats':system_stats,
+                      'MgmtEntity':mgmt_t}, trace)
+
     logger.info('Done: Parse env_stats for {}'.format(domain_ip))
 
 def parse_fi_stats(domain_ip, fcpio, sanpc, sanpcep, fcstats, fcerr, ethpio,
@@ -1282,222 +5026,24 @@ def parse_fi_stats(domain_ip, fcpio, sanpc, sanpcep, fcstats, fcerr, ethpio,
     """
 
     global stats_dict
-    d_dict = stats_dict[domain_ip]
+    trace = get_tracer(domain_ip)
 
     logger.info('Parse fi_stats for {}'.format(domain_ip))
-    for item in fcpio:
-        logger.debug('In fcpio for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'FC')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip,
-                                                               item))
-            continue
-        port_dict['transport'] = 'FC'
-        fill_fi_port_common_items(port_dict, item)
-
-    for item in sanpc:
-        logger.debug('In sanpc for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'FC')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip,
-                                                               item))
-            continue
-        port_dict['transport'] = 'FC'
-        fill_fi_port_common_items(port_dict, item)
-
-    for item in sanpcep:
-        '''
-        Populate port-channel information for this port
-        Passon ep_dn from FabricFcSanPcEp which contains the dn of the
-        physical port.
-        For member of a port-channel, set channel=<port_name_of_PC>
-        For non-member or a port-channel, set channel=No
-        For PC interfaces, do not set channel at all
-        '''
-        logger.debug('In sanpcep for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.ep_dn, 'FC')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['channel'] = ((item.dn.split('/'))[1] + '-' \
-                                    +(item.dn.split('/'))[3]).upper()
-
-    # dn: sys/switch-B/slot-1/switch-ether/port-9
-    for item in ethpio:
-        # ethrx also contains stats for stats of traces between IOM and blades
-        # handle them in parse_backplane_port_stats
-        if 'switch-' not in item.dn:
-            continue
-        logger.debug('In ethpio for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip,
-                                                               item))
-            continue
-        port_dict['transport'] = 'Eth'
-        fill_fi_port_common_items(port_dict, item)
-        # peer_dn: sys/chassis-1/slot-2/fabric/port-1 (B)
-        # peer_dn: sys/rack-unit-5/adaptor-1/ext-eth-1 (C)
-        # peer_dn: sys/chassis-2/slot-1/shared-io-module/fabric/port-4 (S)
-        # peer_dn: sys/fex-3/slot-1/fabric/port-1 (F)
-        if 'server' in (str)(item.if_role):
-            peer_dn_list = (item.peer_dn).split('/')
-            peer, peer_type, peer_port = 'unknown', 'unknown', '0/0'
-            if 'rack-unit' in (str)(item.peer_dn):
-                peer = (str)(peer_dn_list[1])
-                peer_type = 'rack'
-                slot = (str)(peer_dn_list[-2]).replace('adaptor-','')
-                port = ((str)(peer_dn_list[-1])).replace('ext-eth-', '')
-                if len(port) == 1:
-                    port = '0' + port
-                peer_port = slot + '/' + port
-            if 'chassis' in (str)(item.peer_dn):
-                peer = (str)(peer_dn_list[1])
-                peer_type = 'chassis'
-                slot = ((str)(peer_dn_list[2])).replace('slot-', '')
-                port = ((str)(peer_dn_list[-1])).replace('port-', '')
-                if len(port) == 1:
-                    port = '0' + port
-                peer_port = slot + '/' + port
-                # For S-series, chassis format: S-chassis
-                if 'shared-io-module' in (str)(item.peer_dn):
-                    peer_type = 'S-chassis'
-            if 'fex' in (str)(item.peer_dn):
-                peer = (str)(peer_dn_list[1])
-                peer_type = 'FEX'
-                slot = ((str)(peer_dn_list[2])).replace('slot-', '')
-                port = ((str)(peer_dn_list[-1])).replace('port-', '')
-                if len(port) == 1:
-                    port = '0' + port
-                peer_port = slot + '/' + port
-            port_dict['peer'] = peer
-            port_dict['peer_type'] = peer_type
-            port_dict['peer_port'] = peer_port
-
-    for item in lanpc:
-        logger.debug('In lanpc for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['transport'] = 'Eth'
-        fill_fi_port_common_items(port_dict, item)
-        # FabricEthLanPc does not carry correct oper_speed. Use bandwidth
-        port_dict['oper_speed'] = get_speed_num_from_string(item.bandwidth, item)
-
-    for item in lanpcep:
-        '''
-        Populate port-channel information for this port
-        Pass ep_dn from FabricEthLanPcEp which contains the dn of the
-        physical port.
-        For member of a port-channel, set channel=<port_name_of_PC>
-        For non-member or a port-channel, set channel=No
-        For PC interfaces, do not set channel at all
-        '''
-        logger.debug('In lanpcep for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.ep_dn, 'Eth')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['channel'] = ((item.dn.split('/'))[1] + '-' \
-                                    +(item.dn.split('/'))[3]).upper()
-
-    for item in srvpc:
-        logger.debug('In srvpc for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['transport'] = 'Eth'
-        fill_fi_port_common_items(port_dict, item)
-
-    for item in srvpcep:
-        '''
-        Populate port-channel information for this port
-        Passon ep_dn from FabricDceSwSrvPcEp which contains the dn of the
-        physical port.
-        For member of a port-channel, set channel=<port_name_of_PC>
-        For non-member or a port-channel, set channel=No
-        For PC interfaces, do not set channel at all
-        '''
-        logger.debug('In srvpcep for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.ep_dn, 'Eth')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['channel'] = ((item.dn.split('/'))[3]).upper()
-
-    for item in fcstats:
-        logger.debug('In fcstats for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'FC')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['bytes_rx_delta'] = item.bytes_rx_delta
-        port_dict['bytes_tx_delta'] = item.bytes_tx_delta
-
-    for item in fcerr:
-        logger.debug('In fcerr for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'FC')
-        if port_dict is None:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['discard_rx_delta'] = item.discard_rx_delta
-        port_dict['discard_tx_delta'] = item.discard_tx_delta
-        port_dict['crc_rx_delta'] = item.crc_rx_delta
-        port_dict['sync_losses_delta'] = item.sync_losses_delta
-        port_dict['signal_losses_delta'] = item.signal_losses_delta
-        port_dict['link_failures_delta'] = item.link_failures_delta
-
-    for item in ethrx:
-        # ethrx also contains stats of backplane ports between IOM and blades
-        # handle them in parse_backplane_port_stats
-        if 'switch-' not in item.dn:
-            continue
-        logger.debug('In ethrx for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if not port_dict:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['bytes_rx_delta'] = item.total_bytes_delta
-
-    for item in ethtx:
-        # ethtx also contains stats of backplane ports between IOM and blades
-        # handle them in parse_backplane_port_stats
-        if 'switch-' not in item.dn:
-            continue
-        logger.debug('In ethtx for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if not port_dict:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['bytes_tx_delta'] = item.total_bytes_delta
-
-    for item in etherr:
-        # Also contains stats of backplane ports between IOM and blades
-        # handle them in parse_backplane_port_stats
-        if 'switch-' not in item.dn:
-            continue
-        logger.debug('In etherr for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if not port_dict:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['out_discard_delta'] = item.out_discard_delta
-        port_dict['fcs_delta'] = item.fcs_delta
-
-    for item in ethloss:
-        # Also contains stats of backplane ports between IOM and blades
-        # handle them in parse_backplane_port_stats
-        if 'switch-' not in item.dn:
-            continue
-        logger.debug('In ethloss for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_fi_port_dict(d_dict, item.dn, 'Eth')
-        if not port_dict:
-            logger.error('Invalid port_dict for {}\n{}'.format(domain_ip, item))
-            continue
-        port_dict['giants_delta'] = item.giants_delta
-
+    apply_record_map(domain_ip, 'fi_stats',
+                     {'FcPIo':fcpio,
+                      'FabricFcSanPc':sanpc,
+                      'FabricFcSanPcEp':sanpcep,
+                      'EtherPIo':ethpio,
+                      'FabricEthLanPc':lanpc,
+                      'FabricEthLanPcEp':lanpcep,
+                      'FabricDceSwSrvPc':srvpc,
+                      'FabricDceSwSrvPcEp':srvpcep,
+                      'FcStats':fcstats,
+                      'FcErrStats':fcerr,
+                      'EtherRxStats':ethrx,
+                      'EtherTxStats':ethtx,
+                      'EtherErrStats':etherr,
+                      'EtherLossStats':ethloss}, trace)
     logger.info('Done: Parse fi_stats for {}'.format(domain_ip))
 
 def parse_compute_inventory(domain_ip, blade, ru):
@@ -1515,93 +5061,12 @@ def parse_compute_inventory(domain_ip, blade, ru):
     """
 
     global stats_dict
-    d_dict = stats_dict[domain_ip]
-    chassis_dict = d_dict['chassis']
-    ru_dict = d_dict['ru']
-
-    logger.info('Parse compute blades for {}'.format(domain_ip))
-
-    # dn format: sys/chassis-1/blade-8
-    # assigned_to_dn format: org-root/ls-SP-blade-m200-8
-    for item in blade:
-        logger.debug('In blade for {}:{}'.format(domain_ip, item.dn))
-        dn_list = (item.dn).split('/')
-        chassis = (str)(dn_list[1])
-        blade = (str)(dn_list[2])
-
-        service_profile = re.sub(r"^ls-(.*)", r"\1",(((item.assigned_to_dn).split('/'))[-1]))
-        if 'none' in item.association or len(service_profile) == 0:
-            service_profile = 'Unknown'
-        # Numbers might be handy in front-end representations/color coding
-        if 'ok' in item.oper_state:
-            oper_state_code = 0
-        else:
-            oper_state_code = 1
-        # By this time, the stats_dict should be fully initialized for all
-        # available chassis and blades. Still make sure of unexpected behavior
-        if chassis not in chassis_dict:
-            chassis_dict[chassis] = {}
-        per_chassis_dict = chassis_dict[chassis]
-        if 'blades' not in per_chassis_dict:
-            per_chassis_dict['blades'] = {}
-        blade_dict = per_chassis_dict['blades']
-        if blade not in blade_dict:
-            blade_dict[blade] = {}
-        per_blade_dict = blade_dict[blade]
-        per_blade_dict['service_profile'] = service_profile
-        per_blade_dict['association'] = item.association
-        per_blade_dict['oper_state'] = item.oper_state
-        per_blade_dict['oper_state_code'] = oper_state_code
-        per_blade_dict['operability'] = item.operability
-        per_blade_dict['admin_state'] = item.admin_state
-        per_blade_dict['model'] = item.model
-        per_blade_dict['num_cores'] = item.num_of_cores
-        per_blade_dict['num_cpus'] = item.num_of_cpus
-        per_blade_dict['memory'] = item.available_memory
-        per_blade_dict['serial'] = item.serial
-        per_blade_dict['num_adaptors'] = item.num_of_adaptors
-        per_blade_dict['num_vEths'] = item.num_of_eth_host_ifs
-        per_blade_dict['num_vFCs'] = item.num_of_fc_host_ifs
-
-    logger.info('Done: Parse compute blades for {}'.format(domain_ip))
-
-    logger.info('Parse rack units for {}'.format(domain_ip))
-
-    # dn format: sys/rack-unit-2
-    # assigned_to_dn format: org-root/org-HX3AF240b/ls-rack-unit-8
-    for item in ru:
-        logger.debug('In fill_per_ru for {}:{}'.format(domain_ip, item.dn))
-        dn_list = (item.dn).split('/')
-        ru = (str)(dn_list[-1])
-        service_profile = re.sub(r"^ls-(.*)", r"\1",(((item.assigned_to_dn).split('/'))[-1]))
-        if 'none' in item.association or len(service_profile) == 0:
-            service_profile = 'Unknown'
-        # Numbers might be handy in front-end representations/color coding
-        if 'ok' in item.oper_state:
-            oper_state_code = 0
-        else:
-            oper_state_code = 1
+    trace = get_tracer(domain_ip)
 
-        if ru not in ru_dict:
-            ru_dict[ru] = {}
-        per_ru_dict = ru_dict[ru]
-
-        per_ru_dict['service_profile'] = service_profile
-        per_ru_dict['association'] = item.association
-        per_ru_dict['oper_state'] = item.oper_state
-        per_ru_dict['oper_state_code'] = oper_state_code
-        per_ru_dict['operability'] = item.operability
-        per_ru_dict['admin_state'] = item.admin_state
-        per_ru_dict['model'] = item.model
-        per_ru_dict['num_cores'] = item.num_of_cores
-        per_ru_dict['num_cpus'] = item.num_of_cpus
-        per_ru_dict['memory'] = item.available_memory
-        per_ru_dict['serial'] = item.serial
-        per_ru_dict['num_adaptors'] = item.num_of_adaptors
-        per_ru_dict['num_vEths'] = item.num_of_eth_host_ifs
-        per_ru_dict['num_vFCs'] = item.num_of_fc_host_ifs
-
-    logger.info('Done: Parse rack units for {}'.format(domain_ip))
+    logger.info('Parse compute inventory for {}'.format(domain_ip))
+    apply_record_map(domain_ip, 'compute_inventory',
+                     {'ComputeBlade':blade, 'ComputeRackUnit':ru}, trace)
+    logger.info('Done: Parse compute inventory for {}'.format(domain_ip))
 
 def parse_vnic_stats(domain_ip, vnic_stats, host_ethif, host_fcif, dcxvc):
     """
@@ -1620,75 +5085,56 @@ def parse_vnic_stats(domain_ip, vnic_stats, host_ethif, host_fcif, dcxvc):
     """
 
     global stats_dict
+    trace = get_tracer(domain_ip)
     d_dict = stats_dict[domain_ip]
     ru_dict = d_dict['ru']
 
     logger.info('Parse vnic_stats for {}'.format(domain_ip))
     for item in host_fcif:
-        logger.debug('In host_fcif for {}:{}'.format(domain_ip, item.dn))
+        if trace:
+            trace('host_fcif', item.dn)
         if 'rack-unit' in item.dn:
             fill_ru_dict(item, ru_dict)
         else:
             fill_chassis_dict(item, domain_ip)
 
     for item in host_ethif:
-        logger.debug('In host_ethif for {}:{}'.format(domain_ip, item.dn))
+        if trace:
+            trace('host_ethif', item.dn)
         if 'rack-unit' in item.dn:
             fill_ru_dict(item, ru_dict)
         else:
             fill_chassis_dict(item, domain_ip)
 
     '''
-    DcxVC contains pinned uplink port. If oper_border_port_id == 0, discard
-    if oper_border_slot_id, it is a port-channel
-    else, a physical port
-    dn format: sys/chassis-1/blade-2/fabric-A/path-1/vc-1355
-    dn format: sys/rack-unit-5/fabric-B/path-1/vc-1324
+    Pinned uplink and bound veth/vfc from DcxVc, stitched only when changed
     Important: Even though dcxvc contains fi_id, do not use it. Fill fi_id from
     host_ethif or host_fcif due to failover scenario and active VC
     '''
 
-    for item in dcxvc:
-        if item.vnic == '' or (int)(item.oper_border_port_id) == 0:
-            continue
-
-        logger.debug('In dcxvc for {}:{}'.format(domain_ip, item.dn))
-        vif_name = item.vnic
+    for dn, vif_name, switch_id, pinned_uplink, bound in \
+            get_topology(domain_ip, 'pinned_uplinks', dcxvc):
+        if trace:
+            trace('dcxvc', dn)
 
-        vif_dict = get_vif_dict_from_dn(domain_ip, item.dn)
+        vif_dict = get_vif_dict_from_dn(domain_ip, dn)
         if vif_dict is None:
             continue
         per_vif_dict = vif_dict[vif_name]
         if per_vif_dict is None:
             continue
-        if per_vif_dict['fi_id'] != item.switch_id:
-            logger.debug('Ignoring inactive dcxvc for {}'.format(item.dn))
+        if per_vif_dict['fi_id'] != switch_id:
+            logger.debug('Ignoring inactive dcxvc for %s', dn)
             continue
 
-        if (int)(item.oper_border_slot_id) == 0:
-            if 'fc' in item.transport:
-                pc_prefix = 'SAN-PC-'
-            if 'ether' in item.transport:
-                pc_prefix = 'LAN-PC-'
-            pinned_uplink = pc_prefix + (str)(item.oper_border_port_id)
-        else:
-            if len(item.oper_border_port_id) == 1:
-                port_id = '0' + (str)(item.oper_border_port_id)
-            else:
-                port_id = (str)(item.oper_border_port_id)
-            pinned_uplink = (str)(item.oper_border_slot_id) + '/' + port_id
-
         per_vif_dict['pinned_fi_uplink'] = pinned_uplink
-        if 'fc' in item.transport:
-            per_vif_dict['bound_vfc'] = 'vfc' + (str)(item.id)
-            per_vif_dict['bound_veth'] = 'veth' + (str)(item.fcoe_id)
-        if 'ether' in item.transport:
-            per_vif_dict['bound_veth'] = 'veth' + (str)(item.id)
+        per_vif_dict.update(bound)
 
     # dn format: sys/chassis-1/blade-2/adaptor-1/host-fc-4/vnic-stats
     # dn format: sys/rack-unit-5/adaptor-1/host-eth-6/vnic-stats
     for item in vnic_stats:
-        logger.debug('In vnic_stats for {}:{}'.format(domain_ip, item.dn))
+        if trace:
+            trace('vnic_stats', item.dn)
         if (item.dn).startswith('vmm'):
             logger.info('VM-FEX not supported. Skipping. {}:{}'. \
                         format(domain_ip, item.dn))
@@ -1701,12 +5147,13 @@ def parse_vnic_stats(domain_ip, vnic_stats, host_ethif, host_fcif, dcxvc):
         for vif_name, per_vif_dict in vif_dict.items():
             if per_vif_dict['rn'] == rn:
                 break
-        per_vif_dict['bytes_rx_delta'] = item.bytes_rx_delta
-        per_vif_dict['bytes_tx_delta'] = item.bytes_tx_delta
-        per_vif_dict['errors_rx_delta'] = item.errors_rx_delta
-        per_vif_dict['errors_tx_delta'] = item.errors_tx_delta
-        per_vif_dict['dropped_rx_delta'] = item.dropped_rx_delta
-        per_vif_dict['dropped_tx_delta'] = item.dropped_tx_delta
+        set_counters(domain_ip, per_vif_dict, (item.dn.split('/'))[1], 'vif',
+                     (('bytes_rx_delta', item.bytes_rx_delta),
+                      ('bytes_tx_delta', item.bytes_tx_delta),
+                      ('errors_rx_delta', item.errors_rx_delta),
+                      ('errors_tx_delta', item.errors_tx_delta),
+                      ('dropped_rx_delta', item.dropped_rx_delta),
+                      ('dropped_tx_delta', item.dropped_tx_delta)))
 
     logger.info('Done: Parse vnic_stats for {}'.format(domain_ip))
 
@@ -1732,213 +5179,138 @@ def parse_backplane_port_stats(domain_ip, srv_fio, srv_fiopc, srv_fiopcep,
     """
 
     global stats_dict
-    d_dict = stats_dict[domain_ip]
-    chassis_dict = d_dict['chassis']
+    trace = get_tracer(domain_ip)
 
     logger.info('Parse backplane ports stats for {}'.format(domain_ip))
-    # dn:sys/chassis-1/slot-2/host/port-30
-    # dn:sys/fex-3/slot-1/host/port-29
-    # ep_dn: sys/chassis-1/slot-2/host/pc-1285
-    for item in srv_fio:
-        logger.debug('In srv_fio for {}:{}, peer_dn:{}'. \
-                    format(domain_ip, item.dn, item.peer_dn))
-        port_dict = get_bp_port_dict_from_dn(domain_ip, item.dn, True)
-        if port_dict is None:
-            logger.error('Invalid bp_port_dict for {}:{}' \
-                         .format(domain_ip, item))
-            continue
-        port_dict['fi_id'] = item.switch_id
-        port_dict['admin_state'] = item.admin_state
-        port_dict['admin_speed'] = \
-                        get_speed_num_from_string(item.admin_speed, item)
-        port_dict['oper_state'] = item.oper_state
-        port_dict['channel'] = 'No'
-
-        # peer_dn: sys/chassis-1/blade-8/adaptor-2/ext-eth-5
-        # peer_dn: sys/rack-unit-2/adaptor-1/ext-eth-2
-        # peer_dn: sys/chassis-17/slot-2/shared-io-module/fabric/port-5
-        peer_dn_list = (item.peer_dn).split('/')
-        if len(peer_dn_list) < 3:
-            if 'up' in (str)(item.oper_state):
-                logger.warning('oper_state up still unable to decode ' \
-                    'peer_dn:{}, dn:{}'.format(item.peer_dn, item.dn))
-            else:
-                logger.debug('Unable to decode peer_dn:{}, dn:{}, ' \
-                'oper_state:{}'.format(item.peer_dn, item.dn, item.oper_state))
-        else:
-            peer, peer_type, peer_port = 'unknown', 'unknown', '0/0'
-            # FEX connected to rack-unit
-            if 'rack-unit' in (str)(item.peer_dn):
-                peer = (str)(peer_dn_list[-3])
-                peer_type = 'rack'
-                slot = ((str)(peer_dn_list[-2])).replace('adaptor-', '')
-                port = ((str)(peer_dn_list[-1])).replace('ext-eth-', '')
-                if len(port) == 1:
-                    port = '0' + port
-                peer_port = slot + '/' + port
-            # IOM within 5108 chassis
-            if 'chassis' in (str)(item.peer_dn):
-                peer = (str)(peer_dn_list[-3])
-                peer_type = 'blade'
-                slot = ((str)(peer_dn_list[-2])).replace('adaptor-', '')
-                port = ((str)(peer_dn_list[-1])).replace('ext-eth-', '')
-                if len(port) == 1:
-                    port = '0' + port
-                peer_port = slot + '/' + port
-                # FEX Connected to S-series
-                if 'shared-io-module' in (str)(item.peer_dn):
-                    peer = (str)(peer_dn_list[1])
-                    peer_type = 'S-chassis'
-                    slot = ((str)(peer_dn_list[2])).replace('slot-', '')
-                    port = ((str)(peer_dn_list[-1])).replace('port-', '')
-                    if len(port) == 1:
-                        port = '0' + port
-                    peer_port = slot + '/' + port
-            port_dict['peer'] = peer
-            port_dict['peer_type'] = peer_type
-            port_dict['peer_port'] = peer_port
-
-    # dn format: sys/chassis-1/slot-1/host/pc-1290
-    for item in srv_fiopc:
-        logger.debug('In srv_fiopc for {}:{}'.format(domain_ip, item.dn))
-        port_dict = get_bp_port_dict_from_dn(domain_ip, item.dn, True)
-        if port_dict is None:
-            logger.error('Invalid bp_port_dict for {}:{}' \
-                         .format(domain_ip, item))
-            continue
-        port_dict['fi_id'] = item.switch_id
-        port_dict['oper_speed'] = \
-                        get_speed_num_from_string(item.oper_speed, item)
-        port_dict['oper_state'] = item.oper_state
-
-    # dn format: sys/chassis-1/slot-1/host/pc-1290/ep-slot-1-port-27
-    for item in srv_fiopcep:
-        logger.debug('In srv_fiopcep for {}:{}'.format(domain_ip, item.dn))
-        '''
-        Populate port-channel information for this port
-        Passon ep_dn from EtherServerIntFIoPcEp which contains the dn of the
-        backplane port.
-        For member of a port-channel, set channel=<port_name_of_PC>
-        For non-member or a port-channel, set channel=No
-        For PC interfaces, do not set channel at all
-        '''
-
-        port_dict = get_bp_port_dict_from_dn(domain_ip, item.ep_dn, False)
-        if port_dict is None:
-            logger.error('Invalid bp_port_dict for {}:{}' \
-                         .format(domain_ip, item))
-            continue
-        port_dict['channel'] = (((item.dn).split('/'))[4]).upper()
-
-    # dn format: sys/chassis-2/slot-1/host/port-29/rx-stats
-    for item in ethrx:
-        # ethrx also contains stats of FI ports. Handle them with FI ports
-        if 'chassis-' in item.dn or 'fex' in item.dn:
-            logger.debug('In ethrx for {}:{}'.format(domain_ip, item.dn))
-            port_dict = get_bp_port_dict_from_dn(domain_ip, item.dn, False)
-            if port_dict is None:
-                logger.error('Invalid bp_port_dict for {}:{}' \
-                         .format(domain_ip, item))
-                continue
-            port_dict['bytes_rx_delta'] = item.total_bytes_delta
-
-    # dn format: sys/chassis-2/slot-1/host/port-29/tx-stats
-    for item in ethtx:
-        # ethrx also contains stats of FI ports. Handle them with FI ports
-        if 'chassis-' in item.dn or 'fex' in item.dn:
-            logger.debug('In ethtx for {}:{}'.format(domain_ip, item.dn))
-            port_dict = get_bp_port_dict_from_dn(domain_ip, item.dn, False)
-            if port_dict is None:
-                logger.error('Invalid bp_port_dict for {}:{}' \
-                         .format(domain_ip, item))
-                continue
-            port_dict['bytes_tx_delta'] = item.total_bytes_delta
-
-    for item in etherr:
-        # etherr also contains stats of FI ports. Handle them with FI ports
-        if 'chassis-' in item.dn or 'fex' in item.dn:
-            logger.debug('In etherr for {}:{}'.format(domain_ip, item.dn))
-            port_dict = get_bp_port_dict_from_dn(domain_ip, item.dn, False)
-            if not port_dict:
-                logger.error('Invalid port_dict for {}:{}'.format(domain_ip, item))
-                continue
-            port_dict['out_discard_delta'] = item.out_discard_delta
-            port_dict['fcs_delta'] = item.fcs_delta
+    apply_record_map(domain_ip, 'backplane_ports',
+                     {'EtherServerIntFIo':srv_fio,
+                      'EtherServerIntFIoPc':srv_fiopc,
+                      'EtherServerIntFIoPcEp':srv_fiopcep,
+                      'EtherRxStats':ethrx,
+                      'EtherTxStats':ethtx,
+                      'EtherErrStats':etherr}, trace)
 
     '''
-    Following code looks up FabricPathEp to find mapping between IOM backplane
-    port and FI server ports (which is connected to IOM fabric port)
-    Go through it twice, first when locale is chassis and again when locale is
-    server
-    Read the documentation to understand the logic. It takes a while ...
+    Mapping between IOM backplane port and FI server ports (which is connected
+    to IOM fabric port) from FabricPathEp, stitched only when changed
     '''
 
-    path_dict = {}
-    for item in pathep:
-        logger.debug('In pathep for {}:{}'.format(domain_ip, item.dn))
-        if 'fex' in item.dn:
+    for bp_dn, fi_server_port in \
+            get_topology(domain_ip, 'fi_server_ports', pathep):
+        if trace:
+            trace('pathep', bp_dn)
+        port_dict = get_bp_port_dict_from_dn(domain_ip, bp_dn, False)
+        if port_dict is None:
+            logger.warning('Invalid bp_port_dict for {}:{}' \
+                         .format(domain_ip, bp_dn))
             continue
-        # dn format: sys/chassis-1/blade-3/fabric-A/path-1/ep-mux
-        # peer_dn format: sys/chassis-1/slot-2/host/port-5
-        if item.locale == 'chassis' and 'blade' in item.dn:
-            dn_list = (item.dn).split('/')
-            peer_dn_list = (item.peer_dn).split('/')
-            #fi_id = (dn_list[3]).replace('fabric-', '')
-            chassis = dn_list[1]
-            path = chassis + '/' + dn_list[2] + '/' + dn_list[3] + \
-                                '/' + dn_list[4]
-            if item.c_type == 'mux' or \
-                    item.c_type == 'mux-fabricpc-to-hostport':
-                slot_id = peer_dn_list[2]
-                port_id = peer_dn_list[-1]
-            if item.c_type == 'mux-fabricport-to-hostpc' or \
-                    item.c_type == 'mux-fabricpc-to-hostpc':
-                slot_id = peer_dn_list[2]
-                port_id = (peer_dn_list[-1]).upper()
-            path_dict[path] = slot_id + '/host/' + port_id
+        port_dict['fi_server_port'] = fi_server_port
 
-    for item in pathep:
-        logger.debug('In pathep - 2 for {}:{}'.format(domain_ip, item.dn))
-        if 'fex' in item.dn:
-            continue
-        # dn format: sys/chassis-1/blade-3/fabric-A/path-1/ep-mux-fabric
-        # peer_dn format: sys/switch-A/slot-1/switch-ether/port-3
-        if item.locale == 'server' and 'blade' in item.dn:
-            dn_list = (item.dn).split('/')
-            peer_dn_list = (item.peer_dn).split('/')
-            #fi_id = (dn_list[3]).replace('fabric-', '')
-            chassis = dn_list[1]
-            path = chassis + '/' + dn_list[2] + '/' + dn_list[3] + \
-                                '/' + dn_list[4]
-            if path not in path_dict:
-                continue
-            # Construct a DN in sys/chassis-2/slot-1/host/port-29/tx-stats
-            # format from slot and port in path_dict
-            dn_for_port_dict = 'sys/' + chassis + '/' + path_dict[path]
-            port_dict = get_bp_port_dict_from_dn(domain_ip, dn_for_port_dict, False)
-            if port_dict is None:
-                logger.warning('Invalid bp_port_dict for {}:{}' \
-                             .format(domain_ip, item.dn))
-                continue
+    logger.info('Done: Parse backplane ports stats for {}'.format(domain_ip))
 
-            fi_slot = ''
-            fi_port = ''
-            if item.c_type == 'mux-fabric':
-                fi_slot = (peer_dn_list[2]).replace('slot-', '') + '/'
-                fi_port = (peer_dn_list[-1]).replace('port-', '')
-                if len(fi_port) == 1:
-                    fi_port = '0' + fi_port
-            if item.c_type == 'mux-fabricpc':
-                fi_port = (peer_dn_list[-1]).upper()
 
-            port_dict['fi_server_port'] = fi_slot + fi_port
+def capture_parse_failure(domain_ip, parser_name, obj, parser_class_ids, e):
+    """
+    Save the raw objects used by a failed parser in a diagnostics file
 
-    logger.info('Done: Parse backplane ports stats for {}'.format(domain_ip))
+    The objects are streamed into a gzip file, one at a time, up to
+    DIAG_FILE_SIZE bytes of text. Only a pointer to the file is logged.
+    Only the latest DIAG_FILE_NUMBER diagnostics files are kept.
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    parser_name (Name of the failed parser function)
+    obj (dictionary of class ID and managedobjectlist for the domain)
+    parser_class_ids (list of class IDs used by the parser)
+    e (Exception raised by the parser)
+
+    Returns:
+    None
+
+    """
 
+    diag_file_name = diag_file_prefix + '_' + domain_ip + '_' + \
+                        parser_name + '_' + \
+                        time.strftime('%Y%m%d-%H%M%S') + '.txt.gz'
+    written = 0
+    truncated = False
+    try:
+        with gzip.open(diag_file_name, 'wt') as diag_file:
+            diag_file.write('{} : {} : {} : {}\n'.format(domain_ip, \
+                            parser_name, type(e).__name__, e))
+            for class_id in parser_class_ids:
+                diag_file.write('----- {} -----\n'.format(class_id))
+                for item in obj.get(class_id, []):
+                    item_str = (str)(item)
+                    if written + len(item_str) > DIAG_FILE_SIZE:
+                        truncated = True
+                        break
+                    diag_file.write(item_str)
+                    written = written + len(item_str)
+                if truncated:
+                    diag_file.write('----- Truncated at {} bytes -----\n' \
+                                    .format(written))
+                    break
+    except Exception as diag_e:
+        logger.exception('{} failed for {} : {} : {}. Unable to write {} : ' \
+                         '{} : {}'.format(parser_name, domain_ip, \
+                         type(e).__name__, e, diag_file_name, \
+                         type(diag_e).__name__, diag_e))
+        return
 
-def parse_raw_sdk_stats():
+    logger.exception('{} failed for {} : {} : {}. Raw objects ({} bytes{}) ' \
+                     'in {}'.format(parser_name, domain_ip, type(e).__name__, \
+                     e, written, (', truncated' if truncated else ''), \
+                     diag_file_name))
+
+    # Keep the latest DIAG_FILE_NUMBER files only
+    diag_files = sorted(glob.glob(diag_file_prefix + '_*.txt.gz'),
+                        key=os.path.getmtime)
+    for old_file in diag_files[:-DIAG_FILE_NUMBER]:
+        try:
+            os.remove(old_file)
+        except OSError:
+            pass
+
+# Parser functions and the class IDs passed to them, in order
+sdk_parsers = [(parse_fi_env_stats, ['TopSystem',
+                                     'NetworkElement',
+                                     'SwSystemStats',
+                                     'FirmwareRunning',
+                                     'MgmtEntity']),
+               (parse_fi_stats, ['FcPIo',
+                                 'FabricFcSanPc',
+                                 'FabricFcSanPcEp',
+                                 'FcStats',
+                                 'FcErrStats',
+                                 'EtherPIo',
+                                 'FabricEthLanPc',
+                                 'FabricEthLanPcEp',
+                                 'EtherRxStats',
+                                 'EtherTxStats',
+                                 'EtherErrStats',
+                                 'EtherLossStats',
+                                 'FabricDceSwSrvPc',
+                                 'FabricDceSwSrvPcEp']),
+               (parse_compute_inventory, ['ComputeBlade',
+                                          'ComputeRackUnit']),
+               (parse_backplane_port_stats, ['EtherServerIntFIo',
+                                             'EtherServerIntFIoPc',
+                                             'EtherServerIntFIoPcEp',
+                                             'EtherRxStats',
+                                             'EtherTxStats',
+                                             'EtherErrStats',
+                                             'EtherLossStats',
+                                             'FabricPathEp']),
+               (parse_vnic_stats, ['AdaptorVnicStats',
+                                   'AdaptorHostEthIf',
+                                   'AdaptorHostFcIf',
+                                   'DcxVc'])
+              ]
+
+def read_measurement_config():
     """
-    Update stats_dict by parsing raw_sdk_stats
+    Read the measurements file to disable measurements and fields
 
     Parameters:
     None
@@ -1948,174 +5320,172 @@ def parse_raw_sdk_stats():
 
     """
 
-    global raw_sdk_stats
+    global measurement_config
+    config_file_name = FILENAME_PREFIX + '_' + INPUT_FILE_PREFIX + \
+                                                        '.measurements'
+    measurement_config = {}
+    try:
+        with open(config_file_name, 'r') as config_file:
+            measurement_config = json.load(config_file)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        logger.error('Error in loading {} : {} : {}. All measurements are ' \
+                     'enabled'.format(config_file_name, type(e).__name__, e))
+        return
+    logger.warning('Measurements configured by {} : {}'.format( \
+                                    config_file_name, measurement_config))
+
+def plan_queries():
+    """
+    Find the parser functions, class IDs and CLI commands required for the
+    enabled measurements. Update sdk_parsers and class_ids to only these
+
+    Parameters:
+    None
+
+    Returns:
+    None
+
+    """
+
+    global class_ids
+    global sdk_parsers
+    global enabled_measurements
+
+    disabled = measurement_config.get('disable', [])
+    for measurement in list(disabled) + \
+                        list(measurement_config.get('exclude_fields', {})):
+        if measurement not in MEASUREMENT_PARSERS:
+            logger.warning('Unknown measurement {} in measurements file. ' \
+                           'Known:{}'.format(measurement, \
+                                             list(MEASUREMENT_PARSERS)))
+    enabled_measurements = [m for m in MEASUREMENT_PARSERS \
+                                if m not in disabled]
+    if not enabled_measurements:
+        logger.error('All measurements are disabled. Exiting.')
+        sys.exit()
+
+    parser_names = set()
+    for measurement in enabled_measurements:
+        parser_names.update(MEASUREMENT_PARSERS[measurement])
+    sdk_parsers = [(parser, parser_class_ids) for parser, parser_class_ids \
+                    in sdk_parsers if parser.__name__ in parser_names]
+    planned_class_ids = set()
+    for parser, parser_class_ids in sdk_parsers:
+        planned_class_ids.update(parser_class_ids)
+    class_ids = [c for c in class_ids if c in planned_class_ids]
+
+    if not set(enabled_measurements) & set(CLI_MEASUREMENTS) and \
+            not user_args['no_ssh']:
+        logger.info('CLI (SSH) is not required for {}'.format( \
+                                                    enabled_measurements))
+        user_args['no_ssh'] = True
+    if disabled:
+        logger.info('Planned {} parsers and {} class IDs : {}'.format( \
+                    len(sdk_parsers), len(class_ids), class_ids))
+
+def parse_raw_sdk_stats(domain_ip, obj):
+    """
+    Update stats_dict by parsing raw_sdk_stats of a domain
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    obj (dictionary with class ID as key and managedobjectlist as value)
+
+    Returns:
+    None
+
+    """
+
     global class_ids
 
     if user_args.get('raw_dump'):
         current_log_level = logger.level
         logger.setLevel(logging.DEBUG)
-        logger.info('Printing raw dump')
-        for domain_ip, rsp in raw_sdk_stats.items():
-            for class_id, obj in rsp.items():
-                for items in obj:
-                    logger.debug('{} :\n{}'. \
-                        format(domain_ip, items))
+        logger.info('Printing raw dump for {}'.format(domain_ip))
+        for class_id, mo_list in obj.items():
+            for items in mo_list:
+                logger.debug('{} :\n{}'. \
+                    format(domain_ip, items))
         logger.info('Printing raw dump - DONE')
         logger.setLevel(current_log_level)
 
-    for domain_ip, obj in raw_sdk_stats.items():
-        logger.info('Start parsing SDK stats for {}'.format(domain_ip))
-        # There is a strange issue where every 2 hours come of the UCS doamins
-        # do not return anything, resulting in empty obj dict. Check for the
-        # condition to avoid KeyError exception. Log it properly
-        if Counter(class_ids) != Counter(obj.keys()):
-            logger.error('Missing returned class ID(s) from {}. Skipping...' \
-                         'Value:\n{}'.format(domain_ip, obj))
-            continue
+    logger.info('Start parsing SDK stats for {}'.format(domain_ip))
+    # There is a strange issue where every 2 hours come of the UCS doamins
+    # do not return anything, resulting in empty obj dict. Check for the
+    # condition to avoid KeyError exception. Log it properly
+    # Missing class IDs are already queried again by query_missing_class_ids
+    if Counter(class_ids) != Counter(obj.keys()):
+        missing_class_ids = [c for c in class_ids if c not in obj]
+        logger.error('Missing returned class ID(s) from {}. Skipping...' \
+                     'Missing:{}'.format(domain_ip, missing_class_ids))
+        # Nothing returned is an issue of the domain, not of the class IDs
+        if len(missing_class_ids) < len(get_query_class_ids(domain_ip)):
+            update_class_capabilities(domain_ip, missing_class_ids)
+        return
 
-        try:
-            parse_fi_env_stats(domain_ip,
-                               obj['TopSystem'],
-                               obj['NetworkElement'],
-                               obj['SwSystemStats'],
-                               obj['FirmwareRunning'],
-                               obj['MgmtEntity'])
-        except Exception as e:
-            s = ''
-            for item in obj['TopSystem']:
-                s = s + (str)(item)
-            for item in obj['NetworkElement']:
-                s = s + (str)(item)
-            for item in obj['SwSystemStats']:
-                s = s + (str)(item)
-            for item in obj['FirmwareRunning']:
-                s = s + (str)(item)
-            for item in obj['MgmtEntity']:
-                s = s + (str)(item)
-            logger.exception('parse_fi_env_stats:{}\n{}'.format(e, s))
+    if user_args.get('hot_lane') and user_args.get('daemon_interval'):
+        select_hot_ports(domain_ip, obj)
 
+    failed_class_ids = set()
+    parsed_class_ids = set()
+    for parser, parser_class_ids in get_domain_parsers(domain_ip):
         try:
-            parse_fi_stats(domain_ip,
-                           obj['FcPIo'],
-                           obj['FabricFcSanPc'],
-                           obj['FabricFcSanPcEp'],
-                           obj['FcStats'],
-                           obj['FcErrStats'],
-                           obj['EtherPIo'],
-                           obj['FabricEthLanPc'],
-                           obj['FabricEthLanPcEp'],
-                           obj['EtherRxStats'],
-                           obj['EtherTxStats'],
-                           obj['EtherErrStats'],
-                           obj['EtherLossStats'],
-                           obj['FabricDceSwSrvPc'],
-                           obj['FabricDceSwSrvPcEp'])
+            parser(domain_ip, *[obj[class_id] for class_id in \
+                                                    parser_class_ids])
+            parsed_class_ids.update(parser_class_ids)
         except Exception as e:
-            s = ''
-            for item in obj['FcPIo']:
-                s = s + (str)(item)
-            for item in obj['FabricFcSanPc']:
-                s = s + (str)(item)
-            for item in obj['FabricFcSanPcEp']:
-                s = s + (str)(item)
-            for item in obj['FcStats']:
-                s = s + (str)(item)
-            for item in obj['FcErrStats']:
-                s = s + (str)(item)
-            for item in obj['EtherPIo']:
-                s = s + (str)(item)
-            for item in obj['FabricEthLanPc']:
-                s = s + (str)(item)
-            for item in obj['FabricEthLanPcEp']:
-                s = s + (str)(item)
-            for item in obj['EtherRxStats']:
-                s = s + (str)(item)
-            for item in obj['EtherTxStats']:
-                s = s + (str)(item)
-            for item in obj['EtherErrStats']:
-                s = s + (str)(item)
-            for item in obj['EtherLossStats']:
-                s = s + (str)(item)
-            for item in obj['FabricDceSwSrvPc']:
-                s = s + (str)(item)
-            for item in obj['FabricDceSwSrvPcEp']:
-                s = s + (str)(item)
-            logger.exception('parse_fi_stats:{}\n{}'.format(e, s))
+            capture_parse_failure(domain_ip, parser.__name__, obj,
+                                  parser_class_ids, e)
+            failed_class_ids.update(parser_class_ids)
 
-        try:
-            parse_compute_inventory(domain_ip,
-                                    obj['ComputeBlade'],
-                                    obj['ComputeRackUnit'])
-        except Exception as e:
-            s = ''
-            for item in obj['ComputeBlade']:
-                s = s + (str)(item)
-            for item in obj['ComputeRackUnit']:
-                s = s + (str)(item)
-            logger.exception('parse_compute_inventory:{}\n{}'.format(e, s))
+    # A class ID used by a working parser is still required
+    update_class_capabilities(domain_ip,
+                              list(failed_class_ids - parsed_class_ids))
 
-        try:
-            parse_backplane_port_stats(domain_ip,
-                                       obj['EtherServerIntFIo'],
-                                       obj['EtherServerIntFIoPc'],
-                                       obj['EtherServerIntFIoPcEp'],
-                                       obj['EtherRxStats'],
-                                       obj['EtherTxStats'],
-                                       obj['EtherErrStats'],
-                                       obj['EtherLossStats'],
-                                       obj['FabricPathEp'])
-        except Exception as e:
-            s = ''
-            for item in obj['EtherServerIntFIo']:
-                s = s + (str)(item)
-            for item in obj['EtherServerIntFIoPc']:
-                s = s + (str)(item)
-            for item in obj['EtherServerIntFIoPcEp']:
-                s = s + (str)(item)
-            for item in obj['EtherRxStats']:
-                s = s + (str)(item)
-            for item in obj['EtherTxStats']:
-                s = s + (str)(item)
-            for item in obj['EtherErrStats']:
-                s = s + (str)(item)
-            for item in obj['EtherLossStats']:
-                s = s + (str)(item)
-            for item in obj['FabricPathEp']:
-                s = s + (str)(item)
-            logger.exception('parse_backplane_port_stats:{}\n{}'.format(e, s))
+def get_iom_port(d_dict, fi_id, c_id, port_id, cache, fex=True):
+    '''
+    Return the backplane port record and the chassis or FEX of an IOM/FEX
+    port connected to the FI. None if not found. cache has the IOM slot ID
+    per chassis and FEX for the FI
+    '''
+    chassis_id = 'chassis-' + c_id
+    fex_id = 'fex-' + c_id
+    if chassis_id in d_dict['chassis']:
+        group = chassis_id
+        per_c_dict = d_dict['chassis'][chassis_id]
+    elif fex and fex_id in d_dict['fex']:
+        group = fex_id
+        per_c_dict = d_dict['fex'][fex_id]
+    else:
+        logger.warning('Unable to find chassis or FEX with id {}'.format(c_id))
+        return None, None
+    if 'bp_ports' not in per_c_dict:
+        logger.warning('{} found but not bp_ports'.format(group))
+        return None, None
+    bp_port_dict = per_c_dict['bp_ports']
+    if group not in cache:
+        cache[group] = None
+        for iom_slot, port_dict in bp_port_dict.items():
+            # All ports of a IOM/FEX are expected to carry same fi_id
+            for per_bp_port_dict in port_dict.values():
+                if per_bp_port_dict.get('fi_id') == fi_id:
+                    cache[group] = iom_slot
+                break
+    if cache[group] is None:
+        return None, None
+    if len(port_id) == 1:
+        port_id = '0' + port_id
+    return bp_port_dict[cache[group]].get(port_id), group
 
-        try:
-            parse_vnic_stats(domain_ip,
-                             obj['AdaptorVnicStats'],
-                             obj['AdaptorHostEthIf'],
-                             obj['AdaptorHostFcIf'],
-                             obj['DcxVc'])
-        except Exception as e:
-            s = ''
-            for item in obj['AdaptorVnicStats']:
-                s = s + (str)(item)
-            for item in obj['AdaptorHostEthIf']:
-                s = s + (str)(item)
-            for item in obj['AdaptorHostFcIf']:
-                s = s + (str)(item)
-            for item in obj['DcxVc']:
-                s = s + (str)(item)
-            logger.exception('parse_vnic_stats:{}\n{}'.format(e, s))
-
-def parse_pfc_stats(pfc_output, domain_ip, fi_id):
-    """
-    Parse PFC stats
-
-    Here is a sample output of the command
-    ============================================================
-    Port               Mode Oper(VL bmap)  RxPPP      TxPPP
-    ============================================================
-
-    Ethernet1/1        Auto Off           0          0
-    Vethernet9547      Auto Off           0          0
-    Ethernet1/1/2      Auto Off           0          0
-    Ethernet7/1/33     Auto Off           0          0
-    Br-Ethernet1/17/1  Auto Off           373112640  5422273
+def locate_cli_port(domain_ip, d_dict, fi_id, port_name, cache):
+    """
+    Return the record in stats_dict for a port name in NX-OS CLI output
+
+    Ethernet1/1        : FI port 1/01
+    Br-Ethernet1/17/1  : Breakout FI port 1/17/01
+    Ethernet1/1/2      : backplane port (also Eth1/1/2)
 
     backplane port between IOM/FEX and server port
     is reported in x/y/z format, where
@@ -2145,165 +5515,299 @@ def parse_pfc_stats(pfc_output, domain_ip, fi_id):
       }
 
     Parameters:
-    pfc_output (Output of NX-OS command for PFC stats)
-    domain_ip (IP address of UCS domain on which command was executed)
-    fi_id (A or B)
+    domain_ip (IP address of UCS domain)
+    d_dict (stats_dict of the domain)
+    fi_id (A or B, on which command was executed)
+    port_name (first column of the output)
+    cache (dictionary kept for all the rows of an output)
+
+    Returns:
+    Tuple of record (None if not found), group and kind for CounterStore
+
+    """
+
+    port_list = port_name.split('/')
+    fi_port_dict = d_dict[fi_id]['fi_ports']
+    if port_name.startswith('Eth') and len(port_list) == 2:
+        # port on FI
+        slot_id = (port_list[0]).replace('Ethernet', '')
+        port_id = port_list[1]
+        # Prefix single digit port number with 0 to help sorting
+        if len(port_id) == 1:
+            port_id = '0' + port_id
+        key = slot_id + '/' + port_id
+        if key in fi_port_dict:
+            return fi_port_dict[key], 'FI-' + fi_id, 'fi_port'
+        logger.debug('%s not found in fi_port_dict for %s', key, domain_ip)
+        # On UCS mini, FI (server) ports are bp_ports on chassis-1
+        if 'UCS-FI-M-' in d_dict[fi_id].get('model', 'unknown'):
+            record, group = get_iom_port(d_dict, fi_id, '1', port_list[-1],
+                                         cache, fex=False)
+            return record, group, 'bp_port'
+    elif port_name.startswith('Br-') and len(port_list) == 3:
+        # Breakout port on FI
+        slot_id = (port_list[0]).replace('Br-Ethernet', '')
+        port_id = port_list[1]
+        if len(port_id) == 1:
+            port_id = '0' + port_id
+        sub_port_id = port_list[2]
+        if len(sub_port_id) == 1:
+            sub_port_id = '0' + sub_port_id
+        key = slot_id + '/' + port_id + '/' + sub_port_id
+        if key in fi_port_dict:
+            return fi_port_dict[key], 'FI-' + fi_id, 'fi_port'
+        logger.debug('%s not found in fi_port_dict for %s', key, domain_ip)
+    elif port_name.startswith('Eth') and len(port_list) == 3:
+        if 'BackplanePortStats' in enabled_measurements:
+            # Eth1/1/2 in some outputs
+            c_id = (port_list[0]).replace('Ethernet', '').replace('Eth', '')
+            record, group = get_iom_port(d_dict, fi_id, c_id, port_list[-1],
+                                         cache)
+            return record, group, 'bp_port'
+    return None, None, None
+
+'''
+Declarative description of tables in NX-OS CLI output
+
+A CLI table map is a dictionary with stats type as key. Each entry is for
+one NX-OS command whose output has a row per port. Entry has:
+  command       : NX-OS command, run on both the FIs
+  tag           : Name used for tracing
+  marker        : Text in the header line. Rows are after this line. An
+                  output without it can not be used (see Capability map)
+  section       : (optional) For an output in blocks per port instead of a
+                  table. A line ending with this starts the block of the
+                  port named by its first word. counters are then (metric,
+                  label) for lines like 'label : value' in the block. Values
+                  of the same label in a block are added, like the ones of
+                  every qos-group. min_columns and port_column are not used
+  min_columns   : Rows with less columns (after split) are skipped
+  skip_prefixes : (optional) Skip rows with the port name starting with these
+  end_prefix    : (optional) Rows end at a line starting with this, like
+                  the header of the next table
+  port_column   : Column with the port name
+  counters      : list of (metric, column) for CounterStore. Column from the
+                  end is negative, for rows with variable number of columns
+  locate        : function(domain_ip, d_dict, fi_id, port_name, cache)
+                  returning (record, group, kind). Skip the row if record is
+                  None
+  scope         : (optional) fi (default) to run once on NX-OS of each FI.
+                  chassis to run for each chassis and FEX with --iom-cli,
+                  with {c_id} and {last_port} in command
+To pull a new command, add its entry here and its metrics in COUNTER_METRICS.
+compile_cli_table_maps() compiles every entry into a parser, once.
+'''
+cli_table_maps = {
+    # ============================================================
+    # Port               Mode Oper(VL bmap)  RxPPP      TxPPP
+    # ============================================================
+    #
+    # Ethernet1/1        Auto Off           0          0
+    # Vethernet9547      Auto Off           0          0
+    # Ethernet1/1/2      Auto On  (8)       0          0
+    # Br-Ethernet1/17/1  Auto Off           373112640  5422273
+    'pfc_stats':{'command':'show interface priority-flow-control',
+                 'tag':'pfc', 'marker':'RxPPP', 'min_columns':5,
+                 'skip_prefixes':['Veth'], 'port_column':0,
+                 'counters':[('pause_rx', -2), ('pause_tx', -1)],
+                 'locate':locate_cli_port},
+    # Host ports of an IOM/FEX. More tables follow with the same ports
+    # ------------------------------------------------------------------------
+    # Port          Align-Err    FCS-Err   Xmit-Err    Rcv-Err  UnderSize OutDiscards
+    # ------------------------------------------------------------------------
+    # Eth1/1/1              0          0          0          0          0           0
+    'iom_err_stats':{'command':'show interface ethernet {c_id}/1/1-{last_port}'
+                                ' counters errors',
+                     'tag':'iomerr', 'marker':'OutDiscards', 'min_columns':7,
+                     'end_prefix':'Port', 'port_column':0,
+                     'counters':[('hif_xmit_err', 3), ('hif_rcv_err', 4),
+                                 ('hif_out_discards', 6)],
+                     'locate':locate_cli_port, 'scope':'chassis'},
+    # Ethernet1/1 queuing information:
+    #   TX Queuing
+    #     qos-group  sched-type  oper-bandwidth
+    #         0       WRR             50
+    #   RX Queuing
+    #     qos-group 0
+    #     q-size: 360640, HW MTU: 1500 (1500 configured)
+    #     drop-type: drop, xon: 0, xoff: 360640
+    #     Statistics:
+    #         Pkts received over the port             : 3217
+    #         ...
+    #         Pkts discarded on ingress               : 12
+    #         Per-priority-pause status               : Rx (Inactive), Tx ...
+    #     qos-group 1
+    #     ...
+    'queuing_stats':{'command':'show queuing interface',
+                     'tag':'queuing', 'marker':'queuing information:',
+                     'section':' queuing information:',
+                     'skip_prefixes':['Veth'],
+                     'counters':[('queue_discard_rx',
+                                  'Pkts discarded on ingress')],
+                     'locate':locate_cli_port}
+    }
+
+# Key is the name of the stat, value is a list with first member as the NX-OS
+# command, 2nd member as function to process the rows of the output (as
+# dispatcher) and 3rd member as the table for CliTableReader.
+# Filled by compile_cli_table_maps()
+cli_stats_types = {}
+
+def compile_cli_table(entry):
+    '''
+    Compile an entry of cli_table_maps into the table used by CliTableReader
+    '''
+    skip_prefixes = tuple(entry.get('skip_prefixes', []))
+    section = entry.get('section')
+    if section is None:
+        counter_getter = operator.itemgetter(*[column for metric, column in \
+                                                entry['counters']])
+        if len(entry['counters']) == 1:
+            single_getter = counter_getter
+            counter_getter = lambda row: (single_getter(row),)
+        labels = {}
+    else:
+        counter_getter = None
+        # Index in the row of the counter of a label
+        labels = {label:index + 1 for index, (metric, label) in \
+                    enumerate(entry['counters'])}
+    return {'marker':entry['marker'],
+            'section':section,
+            'labels':labels,
+            'min_columns':entry.get('min_columns', 0),
+            'skip_prefixes':skip_prefixes,
+            # Port name is at the start of the line. Skip before split
+            'skip_early':bool(skip_prefixes) and \
+                            entry.get('port_column', 0) == 0,
+            'port_column':entry.get('port_column', 0),
+            'end_prefix':entry.get('end_prefix'),
+            'scope':entry.get('scope', 'fi'),
+            'metrics':tuple(metric for metric, column in entry['counters']),
+            'counter_getter':counter_getter}
+
+class CliTableReader(object):
+    """
+    Read the rows of a table of cli_table_maps from CLI output, line by
+    line, while the output is received
+
+    Lines before the header line, short lines and skipped ports (like
+    Vethernet) are dropped as they come. Only the port name and the
+    counter columns of a row are kept as a tuple, extracted in one call
+    using operator.itemgetter. rows is None until the header line is read,
+    i.e. if the output can not be used. For an output in blocks per port,
+    a row is added at the start of a block and its counters are added up
+    as the lines of the block are read.
+    """
+
+    def __init__(self, stats_type):
+        self.table = cli_stats_types[stats_type][2]
+        self.rows = None
+        self.row = None
+        self.done = False
+
+    def feed(self, line):
+        table = self.table
+        if self.done:
+            return
+        if self.rows is None:
+            if table['marker'] not in line:
+                return
+            self.rows = []
+            if table['section'] is None:
+                return
+        if table['section'] is not None:
+            self.feed_section(line)
+            return
+        if table['end_prefix'] and line.startswith(table['end_prefix']):
+            self.done = True
+            return
+        if table['skip_early'] and line.startswith(table['skip_prefixes']):
+            return
+        row = line.split()
+        if len(row) < table['min_columns']:
+            return
+        port_name = row[table['port_column']]
+        if table['skip_prefixes'] and \
+                port_name.startswith(table['skip_prefixes']):
+            return
+        self.rows.append((port_name,) + table['counter_getter'](row))
+
+    def feed_section(self, line):
+        '''
+        Read a line of an output in blocks per port
+        '''
+        table = self.table
+        if line.rstrip().endswith(table['section']):
+            port_name = line.split()[0]
+            self.row = None
+            if table['skip_prefixes'] and \
+                    port_name.startswith(table['skip_prefixes']):
+                return
+            self.row = [port_name] + [0] * len(table['metrics'])
+            self.rows.append(self.row)
+            return
+        if self.row is None:
+            return
+        label, separator, value = line.partition(':')
+        index = table['labels'].get(label.strip())
+        if index is None:
+            return
+        value = counter_to_int(value)
+        if value is not None:
+            self.row[index] = self.row[index] + value
+
+    def feed_text(self, text):
+        '''
+        Read a complete output. Return rows
+        '''
+        for line in text.splitlines():
+            self.feed(line)
+        return self.rows
+
+def compile_cli_table_parser(stats_type, entry, table):
+    """
+    Compile an entry of cli_table_maps into a parser function for the rows
+    read by CliTableReader
+
+    Parameters:
+    stats_type (key in cli_table_maps)
+    entry (dictionary, as described above cli_table_maps)
+    table (as returned by compile_cli_table)
 
     Returns:
-    None
+    parser(rows, domain_ip, fi_id)
 
     """
 
-    global stats_dict
-    d_dict = stats_dict[domain_ip]
-    fi_port_dict = d_dict[fi_id]['fi_ports']
-    chassis_dict = d_dict['chassis']
-    fex_dict = d_dict['fex']
-    iom_slot_id = 0 # Invalid. Update it later
-    chassis_id = 0 # Invalid. Update it later
-    if 'model' in d_dict[fi_id]:
-        fi_model = d_dict[fi_id]['model']
-    else:
-        fi_model = 'unknown'
-
-    logger.info('Parse pause stats for {}, {}'.format(domain_ip, fi_model))
-    logger.debug('{} - FI-{} - show interface priority\n{}\n'. \
-                 format(domain_ip, fi_id, pfc_output))
-    pfc_op = pfc_output.splitlines()
-    for lines in pfc_op:
-        line = lines.split()
-        # skip the Vethernet
-        if len(line) < 5 or line[0].startswith('Veth'):
-            continue
-
-        port_list = line[0].split('/')
-        if line[0].startswith('Eth') and len(port_list) == 2:
-            # port on FI
-            # line[0] is port name, -2 is RX, -1 is TX PFC stats
-            # Ethernet1/3        Auto Off           2          0
-            slot_id = (port_list[0]).replace('Ethernet', '')
-            port_id = port_list[1]
-            # Prefix single digit port number with 0 to help sorting
-            if len(port_id) == 1:
-                port_id = '0' + port_id
-            key = slot_id + '/' + port_id
-            if key not in fi_port_dict:
-                logger.debug('{} not found in fi_port_dict for {}'. \
-                            format(key, domain_ip))
-                # On UCS mini, FI (server) ports are bp_ports on chassis-1
-                if 'UCS-FI-M-' in fi_model:
-                    c_id = '1'
-                    chassis_id = 'chassis-' + c_id
-                    # Do not continue if chassis_dict is not initialized
-                    # Something else might be wrong
-                    if chassis_id in chassis_dict:
-                        logger.debug('M - Found {} in {}'.format(key, \
-                                                                 chassis_id))
-                        per_chassis_dict = chassis_dict[chassis_id]
-                        if 'bp_ports' not in per_chassis_dict:
-                            logger.warning('...but not bp_ports')
-                            continue
-                        bp_port_dict = per_chassis_dict['bp_ports']
-                    else:
-                        logger.warning('M - Unable to find chassis {}'. \
-                                        format(chassis_id))
-                        continue
-                    for iom_slot, port_dict in bp_port_dict.items():
-                        for iom_port, per_bp_port_dict in port_dict.items():
-                            # Do not run this loop more than once. All ports of
-                            # a IOM are expected to carry same fi_id
-                            if per_bp_port_dict['fi_id'] == fi_id:
-                                iom_slot_id = iom_slot
-                            else:
-                                pass
-                            break
-                    port_id = port_list[-1]
-                    if len(port_id) == 1:
-                        port_id = '0' + port_id
-                    iom_slot_dict = bp_port_dict[iom_slot_id]
-                    if port_id not in iom_slot_dict:
-                        continue
-                    per_bp_port_dict = iom_slot_dict[port_id]
-                    logger.debug('M - {} in {} IOM port {}/{}'. \
-                                format(domain_ip, chassis_id, iom_slot_id, \
-                                       port_id))
-                    per_bp_port_dict['pause_rx'] = line[-2]
-                    per_bp_port_dict['pause_tx'] = line[-1]
-                continue
-            logger.debug('FI port {}:{}:{}'.format(key, domain_ip, fi_id))
-            fi_port_dict[key]['pause_rx'] = line[-2]
-            fi_port_dict[key]['pause_tx'] = line[-1]
-        elif line[0].startswith('Br-') and len(port_list) == 3:
-            # Breakout port on FI
-            # line[0] is port name, -2 is RX, -1 is TX PFC stats
-            # Br-Ethernet1/17/1  Auto Off           373112640  5422273
-            slot_id = (port_list[0]).replace('Br-Ethernet', '')
-            port_id = port_list[1]
-            # Prefix single digit port number with 0 to help sorting
-            if len(port_id) == 1:
-                port_id = '0' + port_id
-            sub_port_id = port_list[2]
-            if len(sub_port_id) == 1:
-                sub_port_id = '0' + sub_port_id
-            port_id = port_id + '/' + sub_port_id
-            key = slot_id + '/' + port_id
-            if key not in fi_port_dict:
-                logger.debug('{} not found in fi_port_dict for {}'. \
-                            format(key, domain_ip))
-                continue
-            logger.debug('FI port {}:{}:{}'.format(key, domain_ip, fi_id))
-            fi_port_dict[key]['pause_rx'] = line[-2]
-            fi_port_dict[key]['pause_tx'] = line[-1]
-        elif line[0].startswith('Eth') and len(port_list) == 3:
-            c_id = (port_list[0]).replace('Ethernet', '')
-            chassis_id = 'chassis-' + c_id
-            fex_id = 'fex-' + c_id
-            # Do not continue if chassis_dict is not initialized
-            # Something else might be wrong
-            if chassis_id in chassis_dict:
-                logger.debug('Found {}'.format(chassis_id))
-                per_chassis_dict = chassis_dict[chassis_id]
-                if 'bp_ports' not in per_chassis_dict:
-                    logger.warning('...but not bp_ports')
-                    continue
-                bp_port_dict = per_chassis_dict['bp_ports']
-            elif fex_id in fex_dict:
-                logger.debug('Found {}'.format(fex_id))
-                per_fex_dict = fex_dict[fex_id]
-                if 'bp_ports' not in per_fex_dict:
-                    logger.warning('...but not bp_ports')
-                    continue
-                bp_port_dict = per_fex_dict['bp_ports']
-            else:
-                logger.warning('Unable to find chassis or FEX with id {}'. \
-                                format(c_id))
-                continue
-            for iom_slot, port_dict in bp_port_dict.items():
-                for iom_port, per_bp_port_dict in port_dict.items():
-                    # Do not run this loop more than once. All ports of
-                    # a IOM/FEX are expected to carry same fi_id
-                    if per_bp_port_dict['fi_id'] == fi_id:
-                        iom_slot_id = iom_slot
-                    else:
-                        pass
-                    break
-            port_id = port_list[-1]
-            if len(port_id) == 1:
-                port_id = '0' + port_id
-            iom_slot_dict = bp_port_dict[iom_slot_id]
-            if port_id not in iom_slot_dict:
+    tag = entry['tag']
+    metrics = table['metrics']
+    locate = entry['locate']
+
+    def parser(rows, domain_ip, fi_id):
+        logger.info('Parse {} for {} FI-{}, rows:{}'.format(stats_type, \
+                                            domain_ip, fi_id, len(rows)))
+        trace = get_tracer(domain_ip)
+        d_dict = stats_dict[domain_ip]
+        cache = {}
+        for row in rows:
+            port_name = row[0]
+            if trace:
+                trace(tag, 'FI-' + fi_id + ':' + port_name)
+            record, group, kind = locate(domain_ip, d_dict, fi_id, port_name,
+                                         cache)
+            if record is None:
                 continue
-            per_bp_port_dict = iom_slot_dict[port_id]
-            logger.debug('IOM/FEX port {}:{}:{}:{}'.format(domain_ip, \
-                         c_id, iom_slot_id, port_id))
-            per_bp_port_dict['pause_rx'] = line[-2]
-            per_bp_port_dict['pause_tx'] = line[-1]
+            set_counters(domain_ip, record, group, kind,
+                         zip(metrics, row[1:]))
+        logger.info('Done: Parse {} for {}'.format(stats_type, domain_ip))
 
-    logger.info('Done: Parse pause stats for {}'.format(domain_ip))
+    parser.__name__ = 'parse_' + stats_type
+    return parser
 
-def parse_raw_cli_stats():
+def compile_cli_table_maps():
     """
-    Update stats_dict by parsing raw_cli_stats
+    Compile cli_table_maps into parsers and tables in cli_stats_types.
+    Call once
 
     Parameters:
     None
@@ -2313,23 +5817,93 @@ def parse_raw_cli_stats():
 
     """
 
+    for stats_type, entry in cli_table_maps.items():
+        table = compile_cli_table(entry)
+        cli_stats_types[stats_type] = [entry['command'],
+                                       compile_cli_table_parser(stats_type,
+                                                        entry, table),
+                                       table]
+    logger.debug('Compiled CLI table maps : {}'.format(list(cli_stats_types)))
+
+def parse_raw_cli_stats(domain_ip, fi_dict):
+    """
+    Update stats_dict by parsing raw_cli_stats of a domain
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    fi_dict (dictionary with FI ID as key and rows of cli_stats_types)
+
+    Returns:
+    None
+
+    """
+
     if user_args.get('no_ssh'):
         logger.info('Skipping parsing of CLI metrics due to --no-ssh flag')
         return
 
-    global raw_cli_stats
+    logger.info('parse_raw_cli_stats for {}'.format(domain_ip))
+    usable = update_cli_capabilities(domain_ip, fi_dict)
+    for fi_id, stats_type_dict in fi_dict.items():
+        logger.info('FI - {}'.format(fi_id))
+        for t, o in stats_type_dict.items():
+            if t not in usable:
+                continue
+            logger.info('Stats type - {}'.format(t))
+            cli_stats_types[t][1](o, domain_ip, fi_id)
+
+def parse_domain_stats(domain_ip):
+    """
+    Update stats_dict for a domain using its raw_sdk_stats and raw_cli_stats
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    None
+
+    """
 
-    for domain_ip, fi_dict in raw_cli_stats.items():
-        logger.info('parse_raw_cli_stats for {}'.format(domain_ip))
-        for fi_id, stats_type_dict in fi_dict.items():
-            logger.info('FI - {}'.format(fi_id))
-            for t, o in stats_type_dict.items():
-                logger.info('Stats type - {}'.format(t))
-                cli_stats_types[t][1](o, domain_ip, fi_id)
+    # Remove the raw stats of the domain before parsing. Only stats_dict and
+    # counter_stores are needed after this and the objects are released as
+    # soon as parsing of the domain is done. With --pipelined, memory is
+    # then bounded by the largest domain, not by the number of domains
+    sdk_obj = raw_sdk_stats.pop(domain_ip, None)
+    unchanged_samples.discard(domain_ip)
+    if sdk_obj is not None and user_args.get('tick_aligned') and \
+            is_sample_unchanged(domain_ip, sdk_obj):
+        logger.info('Same sample as the last time for {}. Skip *_delta ' \
+                    'counters'.format(domain_ip))
+        unchanged_samples.add(domain_ip)
+    if sdk_obj is not None:
+        parse_raw_sdk_stats(domain_ip, sdk_obj)
+        del sdk_obj
+        if user_args.get('iom_cli'):
+            update_iom_targets(domain_ip)
+    cli_obj = raw_cli_stats.pop(domain_ip, None)
+    if cli_obj is not None:
+        parse_raw_cli_stats(domain_ip, cli_obj)
+        del cli_obj
+
+    store = counter_stores[domain_ip]
+    if domain_ip in unchanged_samples:
+        # Already written for the last sample. CLI counters are new
+        for metric in COUNTER_METRICS:
+            if metric.endswith('_delta'):
+                store.clear(metric)
+    logger.info('Counters for {}: rows:{}, FI rx bytes:{}, FI tx bytes:{}'\
+                .format(domain_ip, len(store),
+                        store.total('bytes_rx_delta', 'fi_port'),
+                        store.total('bytes_tx_delta', 'fi_port')))
+
+    if user_args.get('protect_load'):
+        update_protection(domain_ip)
+    if user_args.get('adaptive_interval'):
+        update_domain_schedule(domain_ip)
 
 def update_stats_dict():
     """
-    Update stats_dict
+    Update stats_dict for all the domains
 
     Parameters:
     None
@@ -2338,10 +5912,12 @@ def update_stats_dict():
     None
 
     """
-    global raw_sdk_stats
 
-    parse_raw_sdk_stats()
-    parse_raw_cli_stats()
+    for domain_ip in stats_dict:
+        parse_domain_stats(domain_ip)
+
+    logger.debug('Raw stats left after parsing: SDK:{}, CLI:{}'. \
+                 format(list(raw_sdk_stats.keys()), list(raw_cli_stats.keys())))
 
 ###############################################################################
 # END: Parser functions
@@ -2351,28 +5927,60 @@ def update_stats_dict():
 # BEGIN: Output functions
 ###############################################################################
 
-def influxdb_lp_server_fields(server_dict, server_fields):
-    server_fields = server_fields + \
-        'admin_state="' + server_dict['admin_state'] + '"' + \
-        ',association="' + server_dict['association'] + '"' + \
-        ',operability="' + server_dict['operability'] + '"' + \
-        ',oper_state="' + server_dict['oper_state'] + '"' + \
-        ',oper_state_code=' + \
-                (str)(server_dict['oper_state_code']) + \
-        ',memory=' + server_dict['memory'] + \
-        ',model="' + server_dict['model'] + '"' + \
-        ',num_adaptors=' + server_dict['num_adaptors'] + \
-        ',num_cores=' + server_dict['num_cores'] + \
-        ',num_cpus=' + server_dict['num_cpus'] + \
-        ',num_vEths=' + server_dict['num_vEths'] + \
-        ',num_vFCs=' + server_dict['num_vFCs'] + \
-        ',serial="' + server_dict['serial'] + '"'
-
-    server_fields = server_fields + '\n'
-
-    return server_fields
-
-def influxdb_lp_vnic(per_vif_dict, vnic_tags, vnic_fields):
+# Counters written as fields, in order, per measurement. Counters of a
+# record not returned by UCS are left out
+FI_PORT_COUNTER_FIELDS = ('bytes_rx_delta', 'bytes_tx_delta', 'crc_rx_delta',
+                          'discard_rx_delta', 'discard_tx_delta',
+                          'link_failures_delta', 'pause_rx', 'pause_tx',
+                          'sync_losses_delta', 'signal_losses_delta',
+                          'out_discard_delta', 'fcs_delta',
+                          'queue_discard_rx')
+VNIC_COUNTER_FIELDS = ('bytes_rx_delta', 'bytes_tx_delta', 'errors_rx_delta',
+                       'errors_tx_delta', 'dropped_rx_delta',
+                       'dropped_tx_delta')
+BP_PORT_COUNTER_FIELDS = ('pause_rx', 'pause_tx', 'out_discard_delta',
+                          'fcs_delta', 'hif_xmit_err', 'hif_rcv_err',
+                          'hif_out_discards', 'queue_discard_rx')
+
+def get_lp_line(series, fields, excluded):
+    '''
+    Return a line of InfluxDB Line Protocol from the series (measurement and
+    tags) and a list of (field, value), without the excluded fields. None
+    if no field is left
+    '''
+    if excluded:
+        fields = [field for field in fields if field[0] not in excluded]
+    if not fields:
+        return None
+    return series + ' ' + ','.join([key + '=' + value for key, value in \
+                                        fields]) + '\n'
+
+def influxdb_lp_server_fields(server_dict):
+    return [('admin_state', '"' + server_dict['admin_state'] + '"'),
+            ('association', '"' + server_dict['association'] + '"'),
+            ('operability', '"' + server_dict['operability'] + '"'),
+            ('oper_state', '"' + server_dict['oper_state'] + '"'),
+            ('oper_state_code', (str)(server_dict['oper_state_code'])),
+            ('memory', server_dict['memory']),
+            ('model', '"' + server_dict['model'] + '"'),
+            ('num_adaptors', server_dict['num_adaptors']),
+            ('num_cores', server_dict['num_cores']),
+            ('num_cpus', server_dict['num_cpus']),
+            ('num_vEths', server_dict['num_vEths']),
+            ('num_vFCs', server_dict['num_vFCs']),
+            ('serial', '"' + server_dict['serial'] + '"')]
+
+def get_counter_text(counter_text, record):
+    '''
+    Return counters of a record as a dictionary of metric:string, from the
+    output of CounterStore.serialize()
+    '''
+    row = record.get('counter_row')
+    if row is None:
+        return {}
+    return counter_text[row]
+
+def influxdb_lp_vnic(per_vif_dict, counters, vnic_tags):
     if 'peer_type' in per_vif_dict:
         if per_vif_dict['peer_type'] != 'unknown':
             vnic_tags = vnic_tags + ',peer_type=' + \
@@ -2392,30 +6000,12 @@ def influxdb_lp_vnic(per_vif_dict, vnic_tags, vnic_fields):
         vnic_tags = vnic_tags + \
             ',bound_veth=' + per_vif_dict['bound_veth']
 
-    if 'bytes_rx_delta' in per_vif_dict:
-        vnic_fields = vnic_fields + 'bytes_rx_delta=' + \
-                        per_vif_dict['bytes_rx_delta']
-    if 'bytes_tx_delta' in per_vif_dict:
-        vnic_fields = vnic_fields + ',bytes_tx_delta=' + \
-                        per_vif_dict['bytes_tx_delta']
-    if 'errors_rx_delta' in per_vif_dict:
-        vnic_fields = vnic_fields + ',errors_rx_delta=' + \
-                        per_vif_dict['errors_rx_delta']
-    if 'errors_tx_delta' in per_vif_dict:
-        vnic_fields = vnic_fields + ',errors_tx_delta=' + \
-                        per_vif_dict['errors_tx_delta']
-    if 'dropped_rx_delta' in per_vif_dict:
-        vnic_fields = vnic_fields + ',dropped_rx_delta=' + \
-                        per_vif_dict['dropped_rx_delta']
-    if 'dropped_tx_delta' in per_vif_dict:
-        vnic_fields = vnic_fields + ',dropped_tx_delta=' + \
-                        per_vif_dict['dropped_tx_delta']
-
-    vnic_fields = vnic_fields + '\n'
+    vnic_fields = [(metric, counters[metric]) for metric in \
+                    VNIC_COUNTER_FIELDS if metric in counters]
 
     return (vnic_tags, vnic_fields)
 
-def influxdb_lp_bp_ports(per_bp_port_dict, bp_tags, bp_fields):
+def influxdb_lp_bp_ports(per_bp_port_dict, counters, bp_tags):
     if 'peer_type' in per_bp_port_dict:
        if per_bp_port_dict['peer_type'] != 'unknown':
             bp_tags = bp_tags + ',peer_type=' + \
@@ -2433,36 +6023,20 @@ def influxdb_lp_bp_ports(per_bp_port_dict, bp_tags, bp_fields):
                     per_bp_port_dict['fi_server_port']
 
 
+    bp_fields = []
     if 'oper_speed' in per_bp_port_dict:
-        bp_fields = bp_fields + 'speed=' + \
-                    (str)(per_bp_port_dict['oper_speed'])
-    if 'admin_speed' in per_bp_port_dict:
-        bp_fields = bp_fields + 'speed=' + \
-                    (str)(per_bp_port_dict['admin_speed'])
-    if 'bytes_rx_delta' in per_bp_port_dict:
-        bp_fields = bp_fields + ',bytes_rx_delta=' + \
-                    per_bp_port_dict['bytes_rx_delta']
-    if 'bytes_tx_delta' in per_bp_port_dict:
-        bp_fields = bp_fields + ',bytes_tx_delta=' + \
-                    per_bp_port_dict['bytes_tx_delta']
+        bp_fields.append(('speed', (str)(per_bp_port_dict['oper_speed'])))
+    elif 'admin_speed' in per_bp_port_dict:
+        bp_fields.append(('speed', (str)(per_bp_port_dict['admin_speed'])))
+    if 'bytes_rx_delta' in counters:
+        bp_fields.append(('bytes_rx_delta', counters['bytes_rx_delta']))
+    if 'bytes_tx_delta' in counters:
+        bp_fields.append(('bytes_tx_delta', counters['bytes_tx_delta']))
     if 'oper_state' in per_bp_port_dict:
-        bp_fields = bp_fields + ',oper_state="' + \
-                    per_bp_port_dict['oper_state'] + '"'
-    if 'pause_rx' in per_bp_port_dict:
-        bp_fields = bp_fields + ',pause_rx=' + \
-                    per_bp_port_dict['pause_rx']
-    if 'pause_tx' in per_bp_port_dict:
-        bp_fields = bp_fields + ',pause_tx=' + \
-                    per_bp_port_dict['pause_tx']
-    if 'out_discard_delta' in per_bp_port_dict:
-        bp_fields = bp_fields + \
-                    ',out_discard_delta='+\
-                        per_bp_port_dict['out_discard_delta']
-    if 'fcs_delta' in per_bp_port_dict:
-        bp_fields = bp_fields + \
-                    ',fcs_delta='+\
-                        per_bp_port_dict['fcs_delta']
-    bp_fields = bp_fields + '\n'
+        bp_fields.append(('oper_state', \
+                          '"' + per_bp_port_dict['oper_state'] + '"'))
+    bp_fields.extend([(metric, counters[metric]) for metric in \
+                        BP_PORT_COUNTER_FIELDS if metric in counters])
 
     return (bp_tags, bp_fields)
 
@@ -2476,9 +6050,22 @@ InfluxDB Line Protocol Reference
 * Do double quote field values that are strings
 * Performance tips: sort by tag key
 '''
-def print_output_in_influxdb_lp():
-    global stats_dict
-    final_print_string = ''
+def get_influxdb_lp(domain_ip, d_dict):
+    """
+    Generate InfluxDB Line Protocol for a domain, one line at a time
+
+    Disabled measurements and excluded fields of the measurements file are
+    skipped while the lines are built
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+    d_dict (stats_dict of the domain)
+
+    Returns:
+    Generator of lines in InfluxDB Line Protocol
+
+    """
+
     fi_id_list = ['A', 'B']
 
     server_prefix = 'Servers,domain='
@@ -2487,143 +6074,124 @@ def print_output_in_influxdb_lp():
     fi_server_port_prefix = 'FIServerPortStats,domain='
     fi_uplink_port_prefix = 'FIUplinkPortStats,domain='
 
-    for domain_ip, d_dict in stats_dict.items():
-        if 'mode' not in d_dict:
-            logger.warning('Unable to print InfluxDB Line Protocol for {}' \
-                            .format(domain_ip))
-            logger.debug('d_dict : \n {}'.format(json.dumps(d_dict, indent=2)))
-            continue
-        location = d_dict['location']
-        mode = d_dict['mode']
-        name = d_dict['name']
-        uptime = d_dict['uptime']
-        for fi_id in fi_id_list:
-            fi_dict = d_dict[fi_id]
-
-            # Build insert string for FIEnvStats
+    if 'mode' not in d_dict:
+        logger.warning('Unable to print InfluxDB Line Protocol for {}' \
+                        .format(domain_ip))
+        logger.debug('d_dict : \n {}'.format(json.dumps(d_dict, indent=2)))
+        return
+    # Excluded fields of the enabled measurements
+    exclude_fields = measurement_config.get('exclude_fields', {})
+    excluded = {m:set(exclude_fields.get(m, [])) for m in enabled_measurements}
+    # Convert all the counters of the domain to text at once
+    counter_text = counter_stores[domain_ip].serialize()
+    location = d_dict['location']
+    mode = d_dict['mode']
+    name = d_dict['name']
+    uptime = d_dict['uptime']
+    for fi_id in fi_id_list:
+        fi_dict = d_dict[fi_id]
+
+        # Build insert string for FIEnvStats
+        if 'FIEnvStats' in enabled_measurements:
             fi_env_prefix = 'FIEnvStats,domain='
             fi_env_tags = ','
-            fi_env_fields = ' '
             fi_env_prefix = fi_env_prefix + domain_ip
             fi_env_tags = fi_env_tags + 'fi_id=' + fi_id + ',location=' + \
                             location
-            fi_env_fields = fi_env_fields + 'load=' + fi_dict['load'] + \
-                    ',total_memory=' + fi_dict['total_memory'] + \
-                    ',mem_available=' + fi_dict['mem_available'] + \
-                    ',model="' + fi_dict['model'] + '"' + \
-                    ',serial="' + fi_dict['serial'] + '"' + \
-                    ',oob_if_ip="' + fi_dict['oob_if_ip'] + '"' + \
-                    ',mode="' + mode + '"' + ',name="' + name + '"' + \
-                    ',ucsm_fw_ver="' + d_dict['ucsm_fw_ver'] + '"' + \
-                    ',fi_fw_sys_ver="' + fi_dict['fi_fw_sys_ver'] + '"' + \
-                    ',ha_ready="' + fi_dict['ha_ready'] + '"' + \
-                    ',leadership="' + fi_dict['leadership'] + '"' + \
-                    ',sys_uptime=' + (str)(uptime) + \
-                    ',utm_collector_ver="' + __version__ + '"'
-            fi_env_fields = fi_env_fields + '\n'
-            final_print_string = final_print_string + fi_env_prefix + \
-                                        fi_env_tags + fi_env_fields
-            # Done: Build insert string for FIEnvStats
-
-            # Build insert string for FIServerPortStats and FIUplinkPortStats
-            '''
-            The per_fi_port_dict can have different keys and may require
-            multiple if-checks. This logic is coded but commented below.
-            Checks are:
-            - Only server ports have peer_chassis, peer_iom_slot, peer_iom_port
-            - Only Eth ports can have pause stats
-            - PC do not have pause stats
-            - Only uplink PC have tx and rx bytes. Server PC do not have
-            - etc.
-            The other logic can be to just check for the existence of a key
-            before printing it. This logic is also coded below
-            '''
-
-            fi_port_dict = fi_dict['fi_ports']
-            for fi_port, per_fi_port_dict in fi_port_dict.items():
-                fi_port_tags = ','
-                fi_port_fields = ' '
-                fi_port_tags = fi_port_tags + 'fi_id=' + fi_id
-                if 'channel' in per_fi_port_dict:
-                    fi_port_tags = fi_port_tags + ',channel=' + \
-                                    per_fi_port_dict['channel']
-                fi_port_tags = fi_port_tags + ',location=' + location
-                if 'peer_type' in per_fi_port_dict:
-                    if per_fi_port_dict['peer_type'] != 'unknown':
-                        fi_port_tags = fi_port_tags + ',peer_type=' + \
-                                per_fi_port_dict['peer_type'] + \
-                                ',peer=' + per_fi_port_dict['peer'] + \
-                                ',peer_port=' + per_fi_port_dict['peer_port']
-
-                fi_port_tags = fi_port_tags + ',port=' + fi_port + \
-                                ',transport=' + per_fi_port_dict['transport']
-
-                fi_port_fields = fi_port_fields + \
-                'admin_state="' + per_fi_port_dict['admin_state'] + '",' + \
-                'description="' + per_fi_port_dict['name'] + '",' + \
-                'oper_speed=' + (str)(per_fi_port_dict['oper_speed']) + ',' + \
-                'oper_state="' + (str)(per_fi_port_dict['oper_state']) + '"'
-
-                if 'bytes_rx_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',bytes_rx_delta=' + \
-                                    per_fi_port_dict['bytes_rx_delta']
-                if 'bytes_tx_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',bytes_tx_delta=' + \
-                                    per_fi_port_dict['bytes_tx_delta']
-                if 'crc_rx_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',crc_rx_delta=' + \
-                                    per_fi_port_dict['crc_rx_delta']
-                if 'discard_rx_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',discard_rx_delta=' + \
-                                    per_fi_port_dict['discard_rx_delta']
-                if 'discard_tx_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',discard_tx_delta=' + \
-                                    per_fi_port_dict['discard_tx_delta']
-                if 'link_failures_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',link_failures_delta='+\
-                                    per_fi_port_dict['link_failures_delta']
-                if 'pause_rx' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',pause_rx=' + \
-                                    per_fi_port_dict['pause_rx']
-                if 'pause_tx' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',pause_tx=' + \
-                                    per_fi_port_dict['pause_tx']
-                if 'sync_losses_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',sync_losses_delta=' + \
-                                    per_fi_port_dict['sync_losses_delta']
-                if 'signal_losses_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',signal_losses_delta='+\
-                                    per_fi_port_dict['signal_losses_delta']
-                if 'out_discard_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',out_discard_delta='+\
-                                    per_fi_port_dict['out_discard_delta']
-                if 'fcs_delta' in per_fi_port_dict:
-                    fi_port_fields = fi_port_fields + ',fcs_delta='+\
-                                    per_fi_port_dict['fcs_delta']
-                # Ports will role server goes in FIServerPortStats, rest all
-                # ports go into FIUplinkPortStats, including unknown
-                if per_fi_port_dict['if_role'] == 'server':
-                    fi_port_prefix = fi_server_port_prefix
-                else:
-                    fi_port_prefix = fi_uplink_port_prefix
-
-                fi_port_prefix = fi_port_prefix + domain_ip
-                fi_port_fields = fi_port_fields + '\n'
-                final_print_string = final_print_string + fi_port_prefix + \
-                                        fi_port_tags + fi_port_fields
-            # Done: Build insert string FIServerPortStats and FIUplinkPortStats
+            fi_env_fields = [('load', fi_dict['load']),
+                ('total_memory', fi_dict['total_memory']),
+                ('mem_available', fi_dict['mem_available']),
+                ('model', '"' + fi_dict['model'] + '"'),
+                ('serial', '"' + fi_dict['serial'] + '"'),
+                ('oob_if_ip', '"' + fi_dict['oob_if_ip'] + '"'),
+                ('mode', '"' + mode + '"'), ('name', '"' + name + '"'),
+                ('ucsm_fw_ver', '"' + d_dict['ucsm_fw_ver'] + '"'),
+                ('fi_fw_sys_ver', '"' + fi_dict['fi_fw_sys_ver'] + '"'),
+                ('ha_ready', '"' + fi_dict['ha_ready'] + '"'),
+                ('leadership', '"' + fi_dict['leadership'] + '"'),
+                ('sys_uptime', (str)(uptime)),
+                ('utm_collector_ver', '"' + __version__ + '"')]
+            if 'poll_interval' in d_dict:
+                fi_env_fields.append(('poll_interval', \
+                                      (str)(d_dict['poll_interval'])))
+            if 'protected' in d_dict:
+                fi_env_fields.append(('protected', \
+                                      (str)(d_dict['protected'])))
+            line = get_lp_line(fi_env_prefix + fi_env_tags, fi_env_fields,
+                               excluded['FIEnvStats'])
+            if line:
+                yield line
+        # Done: Build insert string for FIEnvStats
+
+        # Build insert string for FIServerPortStats and FIUplinkPortStats
+        '''
+        The per_fi_port_dict can have different keys and may require
+        multiple if-checks. This logic is coded but commented below.
+        Checks are:
+        - Only server ports have peer_chassis, peer_iom_slot, peer_iom_port
+        - Only Eth ports can have pause stats
+        - PC do not have pause stats
+        - Only uplink PC have tx and rx bytes. Server PC do not have
+        - etc.
+        The other logic can be to just check for the existence of a key
+        before printing it. This logic is also coded below
+        '''
 
-        # Build insert string for blade servers - Servers, Vnic, Backplane, etc.
-        chassis_dict = d_dict['chassis']
-        for chassis_id, per_chassis_dict in chassis_dict.items():
-            if 'blades' not in per_chassis_dict:
+        fi_port_dict = fi_dict['fi_ports']
+        for fi_port, per_fi_port_dict in fi_port_dict.items():
+            # Ports will role server goes in FIServerPortStats, rest all
+            # ports go into FIUplinkPortStats, including unknown
+            if per_fi_port_dict['if_role'] == 'server':
+                measurement = 'FIServerPortStats'
+                fi_port_prefix = fi_server_port_prefix
+            else:
+                measurement = 'FIUplinkPortStats'
+                fi_port_prefix = fi_uplink_port_prefix
+            if measurement not in enabled_measurements:
                 continue
-            blade_dict = per_chassis_dict['blades']
-            for blade_id, per_blade_dict in blade_dict.items():
-                # Build insert string for BladeServers
+            counters = get_counter_text(counter_text, per_fi_port_dict)
+            fi_port_tags = ','
+            fi_port_tags = fi_port_tags + 'fi_id=' + fi_id
+            if 'channel' in per_fi_port_dict:
+                fi_port_tags = fi_port_tags + ',channel=' + \
+                                per_fi_port_dict['channel']
+            fi_port_tags = fi_port_tags + ',location=' + location
+            if 'peer_type' in per_fi_port_dict:
+                if per_fi_port_dict['peer_type'] != 'unknown':
+                    fi_port_tags = fi_port_tags + ',peer_type=' + \
+                            per_fi_port_dict['peer_type'] + \
+                            ',peer=' + per_fi_port_dict['peer'] + \
+                            ',peer_port=' + per_fi_port_dict['peer_port']
+
+            fi_port_tags = fi_port_tags + ',port=' + fi_port + \
+                            ',transport=' + per_fi_port_dict['transport']
+
+            fi_port_fields = [
+            ('admin_state', '"' + per_fi_port_dict['admin_state'] + '"'),
+            ('description', '"' + per_fi_port_dict['name'] + '"'),
+            ('oper_speed', (str)(per_fi_port_dict['oper_speed'])),
+            ('oper_state', '"' + (str)(per_fi_port_dict['oper_state']) + '"')]
+            fi_port_fields.extend([(metric, counters[metric]) for metric in \
+                                FI_PORT_COUNTER_FIELDS if metric in counters])
+
+            fi_port_prefix = fi_port_prefix + domain_ip
+            line = get_lp_line(fi_port_prefix + fi_port_tags, fi_port_fields,
+                               excluded[measurement])
+            if line:
+                yield line
+        # Done: Build insert string FIServerPortStats and FIUplinkPortStats
+
+    # Build insert string for blade servers - Servers, Vnic, Backplane, etc.
+    chassis_dict = d_dict['chassis']
+    for chassis_id, per_chassis_dict in chassis_dict.items():
+        if 'blades' not in per_chassis_dict:
+            continue
+        blade_dict = per_chassis_dict['blades']
+        for blade_id, per_blade_dict in blade_dict.items():
+            # Build insert string for BladeServers
+            if 'Servers' in enabled_measurements:
                 blade_prefix = server_prefix + domain_ip
                 blade_tags = ','
-                blade_fields = ' '
                 blade_tags = blade_tags + 'chassis=' + chassis_id + \
                             ',id=' + blade_id + \
                             ',location=' + location + \
@@ -2631,111 +6199,24 @@ def print_output_in_influxdb_lp():
                                 per_blade_dict['service_profile'] + \
                             ',type=' + 'blade'
 
-                blade_fields = influxdb_lp_server_fields(per_blade_dict, \
-                                                         blade_fields)
-
-                final_print_string = final_print_string + \
-                    blade_prefix + blade_tags + blade_fields
-                # Done: Build insert string for BladeServers
-
-                # This is a strict check before going any deeper. Candidate
-                # for re-visit. If this check is removed, check the presence
-                # of keys in VnicState before filling in the values because
-                # keys may be missing like fi_id, uplink_port, etc.
-                if 'ok' not in per_blade_dict['oper_state'] or \
-                    'associated' not in per_blade_dict['association']:
-                    continue
-                if 'adaptors' not in per_blade_dict:
-                    continue
-                adaptor_dict = per_blade_dict['adaptors']
-                # Build insert string for VnicStats
-                for adaptor_id, per_adaptor_dict in adaptor_dict.items():
-                    if 'vifs' not in per_adaptor_dict:
-                        continue
-                    vif_dict = per_adaptor_dict['vifs']
-                    for vif_name, per_vif_dict in vif_dict.items():
-                        if 'up' not in per_vif_dict['link_state']:
-                            continue
-                        v_prefix = vnic_prefix + domain_ip
-                        vnic_tags = ','
-                        vnic_fields = ' '
-                        vnic_tags = vnic_tags + 'adaptor=' + adaptor_id + \
-                            ',chassis=' + chassis_id + \
-                            ',domain_name=' + name + \
-                            ',location=' + location + \
-                            ',server=' + blade_id + \
-                            ',service_profile=' + \
-                                    per_blade_dict['service_profile'] + \
-                            ',transport=' + per_vif_dict['transport'] + \
-                            ',vif_name=' + vif_name
-
-                        vnic_tags, vnic_fields = \
-                        influxdb_lp_vnic(per_vif_dict, vnic_tags, vnic_fields)
-                        final_print_string = final_print_string + v_prefix \
-                                                + vnic_tags + vnic_fields
-                # Done: Build insert string for VnicStats
-
-            # Build insert string for BackplanePortStats
-            if 'bp_ports' not in per_chassis_dict:
-                continue
-            bp_port_dict = per_chassis_dict['bp_ports']
-            for iom_slot_id, iom_slot_dict in bp_port_dict.items():
-                for bp_port_id, per_bp_port_dict in iom_slot_dict.items():
-                    bp_prefix = bp_port_prefix + domain_ip
-                    bp_tags = ','
-                    bp_fields = ' '
-                    bp_tags = bp_tags + 'bp_port=' + iom_slot_id + '/' + \
-                        bp_port_id + ',chassis=' + chassis_id + \
-                        ',fi_id=' + per_bp_port_dict['fi_id'] + \
-                        ',location=' + location
-                    if 'peer_type' in per_bp_port_dict:
-                        if per_bp_port_dict['peer_type'] != 'unknown':
-                            bp_tags = bp_tags + ',peer_type=' + \
-                                per_bp_port_dict['peer_type'] + \
-                                ',peer=' + per_bp_port_dict['peer'] + \
-                                ',peer_port=' + per_bp_port_dict['peer_port']
-                        per_blade_dict = \
-                                blade_dict[per_bp_port_dict['peer']]
-                        bp_tags = bp_tags + ',peer_service_profile=' + \
-                                    per_blade_dict['service_profile']
-                    bp_tags, bp_fields = \
-                                influxdb_lp_bp_ports(per_bp_port_dict, \
-                                                     bp_tags, bp_fields)
-
-                    final_print_string = final_print_string + bp_prefix \
-                                            + bp_tags + bp_fields
-            # Done: Build insert string for BackplanePortStats
-
-        # Build insert string for rack servers - Servers, Vnic, Backplane, etc.
-        ru_dict = d_dict['ru']
-        for ru_id, per_ru_dict in ru_dict.items():
-            # Build insert string for Rack Servers
-            rack_prefix = server_prefix + domain_ip
-            rack_tags = ','
-            rack_fields = ' '
-            rack_tags = rack_tags + 'service_profile=' + \
-                            per_ru_dict['service_profile'] + \
-                        ',location=' + location + \
-                        ',id=' + ru_id + \
-                        ',type=' + 'rack'
-
-            rack_fields = influxdb_lp_server_fields(per_ru_dict, \
-                                                     rack_fields)
-
-            final_print_string = final_print_string + \
-                rack_prefix + rack_tags + rack_fields
-            # Done: Build insert string for Rack Servers
+                line = get_lp_line(blade_prefix + blade_tags,
+                                   influxdb_lp_server_fields(per_blade_dict),
+                                   excluded['Servers'])
+                if line:
+                    yield line
+            # Done: Build insert string for BladeServers
 
             # This is a strict check before going any deeper. Candidate
             # for re-visit. If this check is removed, check the presence
             # of keys in VnicState before filling in the values because
             # keys may be missing like fi_id, uplink_port, etc.
-            if 'ok' not in per_ru_dict['oper_state'] or \
-                'associated' not in per_ru_dict['association']:
+            if 'ok' not in per_blade_dict['oper_state'] or \
+                'associated' not in per_blade_dict['association']:
                 continue
-            if 'adaptors' not in per_ru_dict:
+            if 'adaptors' not in per_blade_dict or \
+                    'VnicStats' not in enabled_measurements:
                 continue
-            adaptor_dict = per_ru_dict['adaptors']
+            adaptor_dict = per_blade_dict['adaptors']
             # Build insert string for VnicStats
             for adaptor_id, per_adaptor_dict in adaptor_dict.items():
                 if 'vifs' not in per_adaptor_dict:
@@ -2746,68 +6227,323 @@ def print_output_in_influxdb_lp():
                         continue
                     v_prefix = vnic_prefix + domain_ip
                     vnic_tags = ','
-                    vnic_fields = ' '
                     vnic_tags = vnic_tags + 'adaptor=' + adaptor_id + \
-                        ',server=' + ru_id + ',chassis=' + ru_id + \
-                        ',domain_name=' + name + ',service_profile=' + \
-                        per_ru_dict['service_profile'] + \
+                        ',chassis=' + chassis_id + \
+                        ',domain_name=' + name + \
+                        ',location=' + location + \
+                        ',server=' + blade_id + \
+                        ',service_profile=' + \
+                                per_blade_dict['service_profile'] + \
                         ',transport=' + per_vif_dict['transport'] + \
-                        ',vif_name=' + vif_name + \
-                        ',location=' + location
+                        ',vif_name=' + vif_name
+
+                    # All fields are counters. None for an unchanged sample
                     vnic_tags, vnic_fields = \
-                    influxdb_lp_vnic(per_vif_dict, vnic_tags, vnic_fields)
-                    final_print_string = final_print_string + v_prefix \
-                                            + vnic_tags + vnic_fields
+                    influxdb_lp_vnic(per_vif_dict, \
+                            get_counter_text(counter_text, per_vif_dict), \
+                            vnic_tags)
+                    line = get_lp_line(v_prefix + vnic_tags, vnic_fields,
+                                       excluded['VnicStats'])
+                    if line:
+                        yield line
             # Done: Build insert string for VnicStats
 
-        # Build insert string for FEX
-        fex_dict = d_dict['fex']
-        for fex_id, per_fex_dict in fex_dict.items():
-            # Build insert string for BackplanePortStats
-            if 'bp_ports' not in per_fex_dict:
+        # Build insert string for BackplanePortStats
+        if 'bp_ports' not in per_chassis_dict or \
+                'BackplanePortStats' not in enabled_measurements:
+            continue
+        bp_port_dict = per_chassis_dict['bp_ports']
+        for iom_slot_id, iom_slot_dict in bp_port_dict.items():
+            for bp_port_id, per_bp_port_dict in iom_slot_dict.items():
+                bp_prefix = bp_port_prefix + domain_ip
+                bp_tags = ','
+                bp_tags = bp_tags + 'bp_port=' + iom_slot_id + '/' + \
+                    bp_port_id + ',chassis=' + chassis_id + \
+                    ',fi_id=' + per_bp_port_dict['fi_id'] + \
+                    ',location=' + location
+                if 'peer_type' in per_bp_port_dict:
+                    if per_bp_port_dict['peer_type'] != 'unknown':
+                        bp_tags = bp_tags + ',peer_type=' + \
+                            per_bp_port_dict['peer_type'] + \
+                            ',peer=' + per_bp_port_dict['peer'] + \
+                            ',peer_port=' + per_bp_port_dict['peer_port']
+                    per_blade_dict = \
+                            blade_dict[per_bp_port_dict['peer']]
+                    bp_tags = bp_tags + ',peer_service_profile=' + \
+                                per_blade_dict['service_profile']
+                counters = get_counter_text(counter_text, per_bp_port_dict)
+                bp_tags, bp_fields = \
+                            influxdb_lp_bp_ports(per_bp_port_dict, \
+                                        counters, bp_tags)
+
+                line = get_lp_line(bp_prefix + bp_tags, bp_fields,
+                                   excluded['BackplanePortStats'])
+                if line:
+                    yield line
+        # Done: Build insert string for BackplanePortStats
+
+    # Build insert string for rack servers - Servers, Vnic, Backplane, etc.
+    ru_dict = d_dict['ru']
+    for ru_id, per_ru_dict in ru_dict.items():
+        # Build insert string for Rack Servers
+        if 'Servers' in enabled_measurements:
+            rack_prefix = server_prefix + domain_ip
+            rack_tags = ','
+            rack_tags = rack_tags + 'service_profile=' + \
+                            per_ru_dict['service_profile'] + \
+                        ',location=' + location + \
+                        ',id=' + ru_id + \
+                        ',type=' + 'rack'
+
+            line = get_lp_line(rack_prefix + rack_tags,
+                               influxdb_lp_server_fields(per_ru_dict),
+                               excluded['Servers'])
+            if line:
+                yield line
+        # Done: Build insert string for Rack Servers
+
+        # This is a strict check before going any deeper. Candidate
+        # for re-visit. If this check is removed, check the presence
+        # of keys in VnicState before filling in the values because
+        # keys may be missing like fi_id, uplink_port, etc.
+        if 'ok' not in per_ru_dict['oper_state'] or \
+            'associated' not in per_ru_dict['association']:
+            continue
+        if 'adaptors' not in per_ru_dict or \
+                'VnicStats' not in enabled_measurements:
+            continue
+        adaptor_dict = per_ru_dict['adaptors']
+        # Build insert string for VnicStats
+        for adaptor_id, per_adaptor_dict in adaptor_dict.items():
+            if 'vifs' not in per_adaptor_dict:
                 continue
-            bp_port_dict = per_fex_dict['bp_ports']
-            for iom_slot_id, iom_slot_dict in bp_port_dict.items():
-                for bp_port_id, per_bp_port_dict in iom_slot_dict.items():
-                    bp_prefix = bp_port_prefix + domain_ip
-                    bp_tags = ','
-                    bp_fields = ' '
-                    bp_tags = bp_tags + 'bp_port=' + iom_slot_id + '/' + \
-                        bp_port_id + ',chassis=' + fex_id + \
-                        ',fi_id=' + per_bp_port_dict['fi_id']
-                    if 'peer_type' in per_bp_port_dict:
-                        if per_bp_port_dict['peer_type'] != 'unknown':
-                            if per_bp_port_dict['peer_type'] == 'S-chassis':
-                                s_chassis = per_bp_port_dict['peer']
-                                s_slot = ((per_bp_port_dict['peer_port']). \
-                                            split('/'))[0]
-                                s_blade = 'blade-' + s_slot
-                                per_chassis_dict = chassis_dict[s_chassis]
-                                blade_dict = per_chassis_dict['blades']
-                                per_blade_dict = blade_dict[s_blade]
-                                bp_tags = bp_tags + ',peer_service_profile=' + \
-                                            per_blade_dict['service_profile']
+            vif_dict = per_adaptor_dict['vifs']
+            for vif_name, per_vif_dict in vif_dict.items():
+                if 'up' not in per_vif_dict['link_state']:
+                    continue
+                v_prefix = vnic_prefix + domain_ip
+                vnic_tags = ','
+                vnic_tags = vnic_tags + 'adaptor=' + adaptor_id + \
+                    ',server=' + ru_id + ',chassis=' + ru_id + \
+                    ',domain_name=' + name + ',service_profile=' + \
+                    per_ru_dict['service_profile'] + \
+                    ',transport=' + per_vif_dict['transport'] + \
+                    ',vif_name=' + vif_name + \
+                    ',location=' + location
+                vnic_tags, vnic_fields = \
+                influxdb_lp_vnic(per_vif_dict, \
+                        get_counter_text(counter_text, per_vif_dict), \
+                        vnic_tags)
+                line = get_lp_line(v_prefix + vnic_tags, vnic_fields,
+                                   excluded['VnicStats'])
+                if line:
+                    yield line
+        # Done: Build insert string for VnicStats
+
+    # Build insert string for FEX
+    if 'BackplanePortStats' not in enabled_measurements:
+        return
+    fex_dict = d_dict['fex']
+    for fex_id, per_fex_dict in fex_dict.items():
+        # Build insert string for BackplanePortStats
+        if 'bp_ports' not in per_fex_dict:
+            continue
+        bp_port_dict = per_fex_dict['bp_ports']
+        for iom_slot_id, iom_slot_dict in bp_port_dict.items():
+            for bp_port_id, per_bp_port_dict in iom_slot_dict.items():
+                bp_prefix = bp_port_prefix + domain_ip
+                bp_tags = ','
+                bp_tags = bp_tags + 'bp_port=' + iom_slot_id + '/' + \
+                    bp_port_id + ',chassis=' + fex_id + \
+                    ',fi_id=' + per_bp_port_dict['fi_id']
+                if 'peer_type' in per_bp_port_dict:
+                    if per_bp_port_dict['peer_type'] != 'unknown':
+                        if per_bp_port_dict['peer_type'] == 'S-chassis':
+                            s_chassis = per_bp_port_dict['peer']
+                            s_slot = ((per_bp_port_dict['peer_port']). \
+                                        split('/'))[0]
+                            s_blade = 'blade-' + s_slot
+                            per_chassis_dict = chassis_dict[s_chassis]
+                            blade_dict = per_chassis_dict['blades']
+                            per_blade_dict = blade_dict[s_blade]
+                            bp_tags = bp_tags + ',peer_service_profile=' + \
+                                        per_blade_dict['service_profile']
+                        else:
+                            ru_dict = d_dict['ru']
+                            ru_server = per_bp_port_dict['peer']
+                            if ru_server in per_ru_dict:
+                                per_ru_dict = ru_dict[ru_server]
+                                bp_tags = bp_tags + \
+                                        ',peer_service_profile=' + \
+                                        per_ru_dict['service_profile']
                             else:
-                                ru_dict = d_dict['ru']
-                                ru_server = per_bp_port_dict['peer']
-                                if ru_server in per_ru_dict:
-                                    per_ru_dict = ru_dict[ru_server]
-                                    bp_tags = bp_tags + \
-                                            ',peer_service_profile=' + \
-                                            per_ru_dict['service_profile']
-                                else:
-                                    logger.info('Know peer_type for {} but' \
-                                    ' cannot find it in per_ru_dict' \
-                                    .format(per_bp_port_dict['peer']))
-                    bp_tags, bp_fields = \
-                                influxdb_lp_bp_ports(per_bp_port_dict, \
-                                                     bp_tags, bp_fields)
-
-                    final_print_string = final_print_string + bp_prefix \
-                                            + bp_tags + bp_fields
-            # Done: Build insert string for BackplanePortStats
-
-    print(final_print_string)
+                                logger.info('Know peer_type for {} but' \
+                                ' cannot find it in per_ru_dict' \
+                                .format(per_bp_port_dict['peer']))
+                counters = get_counter_text(counter_text, per_bp_port_dict)
+                bp_tags, bp_fields = \
+                            influxdb_lp_bp_ports(per_bp_port_dict, \
+                                        counters, bp_tags)
+
+                line = get_lp_line(bp_prefix + bp_tags, bp_fields,
+                                   excluded['BackplanePortStats'])
+                if line:
+                    yield line
+        # Done: Build insert string for BackplanePortStats
+
+def write_influxdb_lp(lines, sink=None):
+    """
+    Write lines of InfluxDB Line Protocol as they are generated, in batches
+    of LP_WRITE_LINES lines. The sink is flushed at the end
+
+    Must be multithreading aware. A batch is one write of whole lines
+
+    Parameters:
+    lines (iterable of lines in InfluxDB Line Protocol)
+    sink (binary file, default buffer of stdout)
+
+    Returns:
+    None
+
+    """
+
+    if sink is None:
+        # Text written by print() must go out first
+        sys.stdout.flush()
+        sink = sys.stdout.buffer
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == LP_WRITE_LINES:
+            sink.write(''.join(batch).encode())
+            batch = []
+    if batch:
+        sink.write(''.join(batch).encode())
+    sink.flush()
+
+def print_output_in_influxdb_lp():
+    for domain_ip, d_dict in stats_dict.items():
+        write_influxdb_lp(get_influxdb_lp(domain_ip, d_dict))
+
+def print_domain_output(domain_ip):
+    """
+    Parse and print the stats of a domain as soon as its stats pull completes
+
+    Used with --pipelined. Parsing and output of a domain overlap with the
+    stats pull of other domains. Output in dict format is still printed
+    once, after all the domains
+
+    Parameters:
+    domain_ip (IP Address of the UCS domain)
+
+    Returns:
+    None
+
+    """
+
+    parse_domain_stats(domain_ip)
+    if user_args['output_format'] == 'influxdb-lp':
+        logger.info('Printing output for {} in InfluxDB Line Protocol format' \
+                    .format(domain_ip))
+        write_influxdb_lp(get_influxdb_lp(domain_ip, \
+                                          stats_dict[domain_ip]))
+
+# Keys of stats_dict per field of InfluxDB Line Protocol, where the names
+# differ. Used to apply the measurements file to output in dict format
+DICT_FIELD_KEYS = {
+    'FIEnvStats':{'sys_uptime':['uptime']},
+    'FIServerPortStats':{'description':['name']},
+    'FIUplinkPortStats':{'description':['name']},
+    'BackplanePortStats':{'speed':['oper_speed', 'admin_speed']}
+    }
+# Keys of FI and server records which are fields of FIEnvStats and Servers.
+# Removed if the measurement is disabled. Other keys of these records hold
+# the stats of other measurements
+FI_ENV_KEYS = ['load', 'total_memory', 'mem_available', 'model', 'serial',
+               'oob_if_ip', 'fi_fw_sys_ver', 'ha_ready', 'leadership']
+SERVER_KEYS = ['admin_state', 'association', 'operability', 'oper_state',
+               'oper_state_code', 'memory', 'model', 'num_adaptors',
+               'num_cores', 'num_cpus', 'num_vEths', 'num_vFCs', 'serial']
+# Keys of a domain which are fields of FIEnvStats
+DOMAIN_ENV_KEYS = ['mode', 'name', 'ucsm_fw_ver', 'uptime', 'poll_interval',
+                   'protected']
+
+def pop_dict_keys(record, keys):
+    '''
+    Remove keys from a record of stats_dict, if present
+    '''
+    for key in keys:
+        record.pop(key, None)
+
+def prune_dict_output(d_dict):
+    """
+    Remove disabled measurements and excluded fields of the measurements
+    file from the stats of a domain, for output in dict format
+
+    Records of a disabled measurement are removed. FI and server records
+    also hold other measurements, hence only the keys of FIEnvStats and
+    Servers are removed from them
+
+    Parameters:
+    d_dict (copy of stats_dict of a domain. Updated in place)
+
+    Returns:
+    None
+
+    """
+
+    exclude_fields = measurement_config.get('exclude_fields', {})
+    excluded = {}
+    for measurement in MEASUREMENT_PARSERS:
+        field_keys = DICT_FIELD_KEYS.get(measurement, {})
+        excluded[measurement] = set()
+        for field in exclude_fields.get(measurement, []):
+            excluded[measurement].update(field_keys.get(field, [field]))
+    if 'FIEnvStats' not in enabled_measurements:
+        excluded['FIEnvStats'].update(FI_ENV_KEYS)
+    if 'Servers' not in enabled_measurements:
+        excluded['Servers'].update(SERVER_KEYS)
+
+    if 'FIEnvStats' not in enabled_measurements:
+        pop_dict_keys(d_dict, DOMAIN_ENV_KEYS)
+    else:
+        pop_dict_keys(d_dict, excluded['FIEnvStats'] & set(DOMAIN_ENV_KEYS))
+    for fi_id in ['A', 'B']:
+        if fi_id not in d_dict:
+            continue
+        fi_dict = d_dict[fi_id]
+        pop_dict_keys(fi_dict, excluded['FIEnvStats'])
+        fi_port_dict = fi_dict.get('fi_ports', {})
+        for fi_port in list(fi_port_dict):
+            if fi_port_dict[fi_port].get('if_role') == 'server':
+                measurement = 'FIServerPortStats'
+            else:
+                measurement = 'FIUplinkPortStats'
+            if measurement not in enabled_measurements:
+                del fi_port_dict[fi_port]
+            else:
+                pop_dict_keys(fi_port_dict[fi_port], excluded[measurement])
+
+    server_list = list(d_dict.get('ru', {}).values())
+    bp_parent_list = list(d_dict.get('fex', {}).values())
+    for per_chassis_dict in d_dict.get('chassis', {}).values():
+        server_list.extend(per_chassis_dict.get('blades', {}).values())
+        bp_parent_list.append(per_chassis_dict)
+    for server_dict in server_list:
+        pop_dict_keys(server_dict, excluded['Servers'])
+        if 'VnicStats' not in enabled_measurements:
+            server_dict.pop('adaptors', None)
+            continue
+        for per_adaptor_dict in server_dict.get('adaptors', {}).values():
+            for per_vif_dict in per_adaptor_dict.get('vifs', {}).values():
+                pop_dict_keys(per_vif_dict, excluded['VnicStats'])
+    for parent_dict in bp_parent_list:
+        if 'BackplanePortStats' not in enabled_measurements:
+            parent_dict.pop('bp_ports', None)
+            continue
+        for iom_slot_dict in parent_dict.get('bp_ports', {}).values():
+            for per_bp_port_dict in iom_slot_dict.values():
+                pop_dict_keys(per_bp_port_dict, excluded['BackplanePortStats'])
 
 def print_output():
     if user_args['verify_only']:
@@ -2817,10 +6553,22 @@ def print_output():
         current_log_level = logger.level
         logger.setLevel(logging.DEBUG)
         logger.info('Printing output in dictionary format')
-        logger.debug('stats_dict : \n {}'.format(json.dumps(stats_dict, indent=2)))
+        for domain_ip, store in counter_stores.items():
+            store.fold_into_records()
+        output_dict = stats_dict
+        if measurement_config:
+            # Copy to keep stats_dict intact for the next cycle
+            output_dict = json.loads(json.dumps(stats_dict))
+            for d_dict in output_dict.values():
+                prune_dict_output(d_dict)
+        logger.debug('stats_dict : \n {}'.format(json.dumps(output_dict, \
+                                                            indent=2)))
         logger.info('Printing output - DONE')
         logger.setLevel(current_log_level)
     if user_args['output_format'] == 'influxdb-lp':
+        if user_args['pipelined']:
+            logger.info('Output already printed per domain due to --pipelined')
+            return
         logger.info('Printing output in InfluxDB Line Protocol format')
         print_output_in_influxdb_lp()
         logger.info('Printing output - DONE')
@@ -2829,50 +6577,68 @@ def print_output():
 # END: Output functions
 ###############################################################################
 
+def run_cycle(start_time, input_read_time):
+    """
+    Pull, parse and print the stats of all the domains once
 
-# Key is the name of the stat, value is a list with first member as the NX-OS
-# command and 2nd member as function to process the output (as dispatcher)
-cli_stats_types = {
-    'pfc_stats':['show interface priority-flow-control', parse_pfc_stats]
-    }
+    Parameters:
+    start_time (time of start of the cycle)
+    input_read_time (time when the input is read)
 
-def main(argv):
-    # Initial tasks
+    Returns:
+    None
 
-    if not pre_checks_passed(argv):
-        return
-    parse_cmdline_arguments()
-    setup_logging()
-    start_time = time.time()
-    logger.warning('---------- START (version {})----------'.format(__version__))
-    get_ucs_domains()
-    unpickle_connections()
+    """
 
-    input_read_time = time.time()
+    read_trace_config()
+    if user_args['adaptive_interval']:
+        skip_domains_not_due()
+    if user_args['hot_lane']:
+        read_hot_port_config()
 
     # Connect to UCS and pull stats. This section must be multi-threading aware
+    # With --pipelined, every domain is also parsed and printed as soon as its
+    # pull completes. Connection time then includes parsing and output
     try:
-        get_ucs_stats()
+        if user_args['pipelined']:
+            get_ucs_stats(print_domain_output)
+        else:
+            get_ucs_stats()
     except Exception as e:
         logger.exception('Exception with get_ucs_stats')
 
     connect_time = time.time()
+    track_peak_rss('pull')
 
     # Parse the stats returned by UCS
-    update_stats_dict()
+    if not user_args['pipelined']:
+        update_stats_dict()
 
     parse_time = time.time()
+    track_peak_rss('parse')
 
     # Print the stats as per the desired output format
     try:
         print_output()
     except Exception as e:
         logger.exception('Exception with print_output:{}'.format((str)(e)))
+    sys.stdout.flush()
 
     output_time = time.time()
-
-    # Final tasks
-    pickle_connections()
+    track_peak_rss('output')
+
+    # Final tasks. With --daemon, sessions are pickled only on exit
+    if not user_args['daemon_interval']:
+        pickle_connections()
+    save_topology_cache()
+    save_dns_cache()
+    save_domain_schedule()
+    save_collection_ticks()
+    save_capabilities()
+    if user_args['iom_cli']:
+        save_iom_targets()
+    if user_args['protect_load']:
+        save_protection()
 
     # Print response times per domain and total execution time
     time_output = ''
@@ -2902,6 +6668,13 @@ def main(argv):
             else:
                 sdk_query = 'N/A'
 
+            if time_d['sdk_handshake'] or time_d['sdk_request']:
+                sdk_handshake = (str)(round(time_d['sdk_handshake'], 2))
+                sdk_request = (str)(round(time_d['sdk_request'], 2))
+            else:
+                sdk_handshake = 'N/A'
+                sdk_request = 'N/A'
+
             if user_args.get('no_ssh'):
                 start_t = time_d['sdk_start']
                 end_t = time_d['sdk_end']
@@ -2927,10 +6700,11 @@ def main(argv):
                         '    |--------------------------------------------|\n'\
                         '    | CLI: Login:{:>8} s  | Query:{:>8} s  |\n'\
                         '    | SDK: Login:{:>8} s  | Query:{:>8} s  |\n'\
+                        '    | TLS: Hands:{:>8} s  | Reqst:{:>8} s  |\n'\
                         '    | Total: {:>8} s                          |\n'\
                         '    |--------------------------------------------|'.\
                         format(domain_ip, cli_login, cli_query, sdk_login,\
-                               sdk_query, total_t)
+                               sdk_query, sdk_handshake, sdk_request, total_t)
 
     time_output = time_output + '\n' \
                    '    |--------------------------------------------|\n'\
@@ -2948,6 +6722,22 @@ def main(argv):
                           (parse_time - connect_time),
                           (output_time - parse_time),
                           (output_time - start_time))
+    rss_mb = {}
+    for phase in ['input', 'pull', 'parse', 'output']:
+        if peak_rss_dict.get(phase) is None:
+            rss_mb[phase] = 'N/A'
+        else:
+            rss_mb[phase] = (str)(round(peak_rss_dict[phase] / 1024, 1))
+    time_output = time_output + '\n' \
+                   '    |          Peak memory (RSS) per phase       |\n'\
+                   '    |--------------------------------------------|\n'\
+                   '    |                           Input:{:>7} MB |\n'\
+                   '    | Connection setup and stats pull:{:>7} MB |\n'\
+                   '    |                         Parsing:{:>7} MB |\n'\
+                   '    |                          Output:{:>7} MB |\n'\
+                   '    |--------------------------------------------|'.\
+                   format(rss_mb['input'], rss_mb['pull'], rss_mb['parse'],
+                          rss_mb['output'])
     logger.setLevel(logging.INFO)
     logger.info('{}'.format(time_output))
     if (output_time - start_time) > (MASTER_TIMEOUT - 3):
@@ -2956,5 +6746,112 @@ def main(argv):
 
     logger.warning('---------- END ----------')
 
+def handle_sigterm(signum, frame):
+    # Raise SystemExit for the clean up in run_daemon()
+    logger.warning('Received signal {}. Exiting.'.format(signum))
+    sys.exit()
+
+def run_daemon(start_time, input_read_time):
+    """
+    Run a cycle every --daemon seconds until stopped
+
+    Sessions (SDK and SSH) of a cycle are re-used in the next cycle. Names
+    are resolved and sessions are logged in WARMUP_LEAD seconds before the
+    next cycle. Sessions are pickled on exit. With --hot-lane, hot ports are
+    pulled on the same sessions between the cycles
+
+    Parameters:
+    start_time (time of start of the first cycle)
+    input_read_time (time when the input is read)
+
+    Returns:
+    None
+
+    """
+
+    interval = user_args['daemon_interval']
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    next_cycle_time = start_time
+    try:
+        while True:
+            run_cycle(start_time, input_read_time)
+
+            # Free the stats of this cycle and keep the sessions
+            carry_over_connections()
+            for domain_ip in domain_dict:
+                reset_domain_stats(domain_ip, domain_dict[domain_ip][2])
+
+            next_cycle_time = next_cycle_time + interval
+            if next_cycle_time < time.time():
+                logger.warning('Cycle took longer than {}s. Skipping missed ' \
+                               'cycles'.format(interval))
+                while next_cycle_time < time.time():
+                    next_cycle_time = next_cycle_time + interval
+            warm_up_time = next_cycle_time - WARMUP_LEAD
+            if user_args['hot_lane'] and \
+                    user_args['output_format'] == 'influxdb-lp':
+                run_hot_lane(warm_up_time)
+            if warm_up_time > time.time():
+                time.sleep(warm_up_time - time.time())
+            warm_up_connections()
+            if next_cycle_time > time.time():
+                time.sleep(next_cycle_time - time.time())
+
+            start_time = time.time()
+            logger.warning('---------- START (version {})----------' \
+                           .format(__version__))
+            input_read_time = time.time()
+            track_peak_rss('input')
+    finally:
+        pickle_connections()
+
+def main(argv):
+    # Initial tasks
+
+    if not pre_checks_passed(argv):
+        return
+    parse_cmdline_arguments()
+    setup_logging()
+    compile_record_maps()
+    compile_cli_table_maps()
+    read_measurement_config()
+    plan_queries()
+    start_time = time.time()
+    logger.warning('---------- START (version {})----------'.format(__version__))
+    get_ucs_domains()
+    unpickle_connections()
+    read_topology_cache()
+    read_dns_cache()
+    read_domain_schedule()
+    read_collection_ticks()
+    read_capabilities()
+    if user_args['iom_cli']:
+        read_iom_targets()
+    if user_args['protect_load']:
+        read_protection()
+    if user_args['async_ssh'] and not user_args['no_ssh']:
+        if asyncssh is None:
+            logger.error('--async-ssh requires asyncssh. Using netmiko')
+        else:
+            global ssh_engine
+            ssh_engine = AsyncSshEngine()
+    resolve_domains()
+
+    input_read_time = time.time()
+    track_peak_rss('input')
+
+    if user_args['hot_lane'] and not user_args['daemon_interval']:
+        logger.warning('--hot-lane is used only with --daemon. Ignored')
+    elif user_args['hot_lane'] and \
+            user_args['output_format'] != 'influxdb-lp':
+        logger.warning('--hot-lane is used only with influxdb-lp output. ' \
+                       'Ignored')
+    if user_args['iom_cli'] and ssh_engine is None:
+        logger.warning('--iom-cli is used only with --async-ssh. Ignored')
+    if user_args['daemon_interval']:
+        run_daemon(start_time, input_read_time)
+    else:
+        run_cycle(start_time, input_read_time)
+
 if __name__ == '__main__':
     main(sys.argv)